@@ -1,6 +1,12 @@
+import os
 import sys
+import numpy as np
 
+from abrox.core.abc_backend import WorkerPool, importingMain
 from abrox.core.abc_summary import ABCSummary
+from abrox.core.abc_cache import ABCTableCache
+from abrox.core.abc_cluster import ABCCoordinator
+from abrox.core.abc_raw import ABCRawStore
 from abrox.core.abc_utils import read_external, pickle_results
 from abrox.core.abc_config_check import ConfigTester
 from abrox.core.abc_initializer import ABCInitializer
@@ -27,14 +33,19 @@ class Abc:
     def _checkConfigSanity(self):
         """Creates and runs an instance of the config sanity tester."""
 
-        tester = ConfigTester(self.config)
-        tester.checkForErrors()
+        self._tester = ConfigTester(self.config)
+        self._tester.checkForErrors()
 
     def run(self):
         """
         The only interface method of the class, responsible for handling
         all pre-processing and computation steps.
         """
+        # Worker processes import the script of the run, which must
+        # therefore only start the analysis in its main block
+        if importingMain():
+            raise RuntimeError('Abc.run() was called while a worker process imports the script. '
+                               'Start the analysis under if __name__ == "__main__":')
         print('run')
         # Create an initializer instance, responsible for
         # importing/generating data, building the models,
@@ -53,55 +64,157 @@ class Abc:
 
         # Create a wrapper over the user-defined summary function
         # and obtain the summary statistics of the observed data
-        summarizer = ABCSummary(self.config['summary'])
+        summarizer = ABCSummary(self.config['summary'], self.config.get('summary_batch'))
         sumStatObsData = summarizer.summarize(obsData)
 
-        # Create an instance of the abc preprocessor, responsible for
-        # generating an ABC reference table (a pandas DataFrame)
-        # which contains four columns containing the following information:
-        # Column 0: idx  - (the model index)
-        # Column 1: param - a list of sampled parameters
-        # Column 2: sumstat - a list of the summary statistics
-        # Column 3: distance - the value obtained by evaluating the distance func
-        pp = ABCPreProcessor(modelList, summarizer, sumStatObsData)
-
-        # TODO -> parallel and jobs must also be specified in settings!
-        if settings['extref']:
-            refTable = read_external(settings['extref'])
-        else:
-            refTable = pp.preprocess(settings['nsim'], parallel=True, jobs=4)
-
-        # Create a rejecter instance, responsible for filtering
-        # the reference table according to the specified number 'keep'
-        # of rows to retain (retains those with smallest distance)
-        # only use for rejection and MCMC
-
-        # According to the specified algorithm, run the abc
-        if settings['alg'] == "rejection":
-            subset, threshold = ABCRejection(refTable, settings['specs']['keep']).reject()
-            if settings['specs']['cv'] is not None:
-                crossval = ABCCv(refTable, settings['specs']['keep'],
-                                           settings['obj'],
-                                           settings['specs']['cv'],
-                                           modelNames)
-                output = crossval.report(settings['outputdir'])
-            else:
-                reporter = ABCReporter(subset, modelNames,
-                                               settings['pnames'],
+        # Time a few simulations to predict the cost of the reference
+        # table, and refuse the run if it exceeds the configured budget
+        if settings['profile'] or settings['maxruntime'] is not None or \
+                settings['maxmemory'] is not None:
+            self._tester.profile(modelList, summarizer, sumStatObsData)
+
+        # Start the workers shared by all stages of the run (table,
+        # cross-validation, MCMC chains, random forest folds), so that
+        # they are warm (with ABrox and the script imported) when needed
+        with self._workerPool(settings) as pool:
+            # Create an instance of the abc preprocessor, responsible for
+            # generating an ABC reference table (a RefTable of numpy arrays)
+            # which contains four columns containing the following information:
+            # idx  - the model index vector
+            # param - the matrix of sampled parameters
+            # sumstat - the matrix of the summary statistics
+            # distance - the values obtained by evaluating the distance func
+            # Optionally keep the simulated datasets, so that the summary
+            # statistics can later be recomputed without simulating again
+            rawStore = None
+            if settings['rawstore']:
+                rawStore = ABCRawStore(settings['rawstore'], settings['rawcompress'])
+
+            # With the cluster backend, standalone workers connect to a
+            # coordinator and simulate the blocks of the table remotely
+            coordinator = self._startCoordinator(settings, modelList, summarizer)
+            pp = ABCPreProcessor(modelList, summarizer, sumStatObsData, rawStore, settings['timeout'],
+                                 coordinator, pool)
+            try:
+                refTable = self._buildRefTable(pp, settings)
+            finally:
+                if coordinator is not None:
+                    coordinator.close()
+
+            # Report skipped simulations (exceptions, timeouts, dead workers)
+            if len(pp.failures):
+                print(pp.failures.report(modelNames))
+
+            # Report the rows achieved (e.g. within a time budget)
+            rows = np.bincount(refTable.idx, minlength=len(modelNames))
+            print('Reference table: {} rows ({})'.format(
+                len(refTable), ', '.join('{}: {}'.format(name, n) for name, n in zip(modelNames, rows))))
+
+            # Record the prior model probabilities the table was simulated
+            # with, so that model comparison results refer to equal priors
+            # even if the models have different numbers of rows
+            modelPrior = rows / len(refTable)
+            if not np.allclose(modelPrior, modelPrior[0]):
+                print('Effective prior model probabilities of the table: {}'.format(
+                    ', '.join('{}: {:.3f}'.format(name, p) for name, p in zip(modelNames, modelPrior))))
+
+            # Create a rejecter instance, responsible for filtering
+            # the reference table according to the specified number 'keep'
+            # of rows to retain (retains those with smallest distance)
+            # only use for rejection and MCMC
+
+            # According to the specified algorithm, run the abc
+            if settings['alg'] == "rejection":
+                subset, threshold = ABCRejection(refTable, settings['specs']['keep']).reject()
+                if settings['specs']['cv'] is not None:
+                    crossval = ABCCv(refTable, settings['specs']['keep'],
                                                settings['obj'],
-                                               settings['outputdir'])
-                output = reporter.report()
+                                               settings['specs']['cv'],
+                                               modelNames, modelPrior, pool)
+                    output = crossval.report(settings['outputdir'])
+                else:
+                    reporter = ABCReporter(subset, modelNames,
+                                                   settings['pnames'],
+                                                   settings['obj'],
+                                                   settings['outputdir'],
+                                                   modelPrior)
+                    output = reporter.report()
 
-        elif settings['alg'] == "mcmc":
-            subset, threshold = ABCRejection(refTable, settings['specs']['keep']).reject()
-            mcmc = MCMC(pp, subset, threshold, settings)
-            samples, output, accepted = mcmc.run()
-            plotter = Plotter(samples, settings['pnames'])
-            plotter.plot()
+            elif settings['alg'] == "mcmc":
+                subset, threshold = ABCRejection(refTable, settings['specs']['keep']).reject()
+                mcmc = MCMC(pp, subset, threshold, settings, pool)
+                samples, output, accepted = mcmc.run()
+                plotter = Plotter(samples, settings['pnames'])
+                plotter.plot()
 
+            else:
+                rf = ABCRandomForest(refTable, pp, settings, modelNames, modelPrior, pool)
+                output = rf.run()
+
+            pickle_results(output, settings['outputdir'])
+            return output
+
+    def _workerPool(self, settings):
+        """
+        The pool of workers of the run. With the cluster backend, the
+        table is simulated remotely and the later stages use local processes.
+        """
+        if settings['backend'] == 'cluster':
+            return WorkerPool('processes', None, settings['preload'])
+        return WorkerPool(settings['backend'], settings['jobs'], settings['preload'])
+
+    def _startCoordinator(self, settings, modelList, summarizer):
+        """Start the coordinator of the remote workers, None for local backends."""
+
+        if settings['backend'] != 'cluster':
+            return None
+        coordinator = ABCCoordinator(settings['coordinator'], settings['authkey'],
+                                     modelList, summarizer, settings['timeout'])
+        print('Coordinator listening on {}:{}. Start workers with:'.format(*coordinator.address))
+        print('  abrox-worker {} --coordinator {}:{} --authkey KEY --jobs N'.format(
+            os.path.abspath(sys.argv[0]), *coordinator.address))
+        return coordinator
+
+    def _buildRefTable(self, pp, settings):
+        """
+        Generate, extend, resummarize or import the reference table
+        according to the settings.
+        :param pp: the ABCPreProcessor
+        :param settings: the extracted settings
+        :return: the scaled reference table
+        """
+        if settings['resummarize']:
+            refTable = pp.resummarize(backend=settings['backend'], jobs=settings['jobs'],
+                                      blasThreads=settings['blasthreads'])
+        elif settings['extend']:
+            # Append new rows to an existing table and rescale it
+            baseTable = read_external(settings['extref']) if settings['extref'] else None
+            refTable = pp.extend(settings['extend'], baseTable, backend=settings['backend'],
+                                 jobs=settings['jobs'], blockSize=settings['blocksize'],
+                                 blasThreads=settings['blasthreads'],
+                                 store=settings['store'], inMemory=settings['inmemory'])
+            print('Simulation cost per model:')
+            print(pp.costs)
+        elif settings['extref']:
+            refTable = read_external(settings['extref'])
         else:
-            rf = ABCRandomForest(refTable, pp, settings, modelNames)
-            output = rf.run()
+            # Reuse the unscaled rows of models simulated in earlier runs
+            # with the same simulate code, priors, summary, size and seed
+            # (time-budgeted and adaptively allocated tables depend on the
+            # machine and are not cached)
+            cache = None
+            if settings['cache'] and settings['timebudget'] is None and \
+                    settings['allocation'] == 'equal':
+                cache = ABCTableCache(settings['cache'], settings['cachesize'])
+            refTable = pp.preprocess(settings['nsim'], backend=settings['backend'],
+                                     jobs=settings['jobs'], blockSize=settings['blocksize'],
+                                     blasThreads=settings['blasthreads'],
+                                     store=settings['store'], inMemory=settings['inmemory'],
+                                     resume=settings['resume'], seed=settings['seed'],
+                                     cache=cache, timeBudget=settings['timebudget'],
+                                     allocation=settings['allocation'],
+                                     keep=settings['specs'].get('keep'))
+            print('Simulation cost per model:')
+            print(pp.costs)
 
-        pickle_results(output, settings['outputdir'])
-        return output
+        return refTable
@@ -0,0 +1,502 @@
+from concurrent.futures import Executor, Future, ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures import BrokenExecutor, wait, FIRST_COMPLETED
+from collections import deque
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+import ast
+import asyncio
+import itertools
+import multiprocessing
+import os
+import pickle
+import sys
+import threading
+import time
+import uuid
+
+
+# Execution backends for the simulations of the reference table:
+#  - serial: run every task in the calling process
+#  - threads: a thread pool, useful for simulators spending most of
+#    their time in NumPy/BLAS code that releases the GIL
+#  - processes: a process pool, needed for pure-Python simulators
+#  - asyncio: an event loop running async simulate functions, for
+#    simulators waiting on subprocesses or services (jobs is the number
+#    of simulations in flight)
+#  - cluster: standalone workers connecting over TCP (see abc_cluster)
+BACKENDS = ('serial', 'threads', 'processes', 'asyncio', 'cluster')
+
+# Address the coordinator of the cluster backend listens on by default
+DEFAULT_ADDRESS = 'localhost:7177'
+
+# Simulations in flight on the asyncio backend if jobs is not given
+ASYNCIO_JOBS = 100
+
+# Seconds between checks whether tasks with a time limit waiting in the
+# queue of the executor have been started by a worker
+START_POLL = 0.5
+
+# Modules the fork server of the worker processes imports once, so that
+# workers start with them loaded ('__main__' is the script of the run,
+# which imports ABrox and the simulators)
+DEFAULT_PRELOAD = ('__main__', 'numpy', 'scipy.stats', 'pandas', 'abrox.core.abc_worker')
+
+
+def availableCpus():
+    """Returns the number of CPUs the current process may run on."""
+
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def workerCount(backend, jobs):
+    """
+    Number of workers of a backend.
+    :param backend: one of BACKENDS (except 'cluster')
+    :param jobs: number of workers, None for the default of the backend
+    :return: the number of workers
+    """
+    if backend == 'serial':
+        return 1
+    if backend == 'asyncio':
+        return jobs or ASYNCIO_JOBS
+    return jobs or availableCpus()
+
+
+def parseAddress(address):
+    """
+    Split a 'host:port' string.
+    :param address: the address as 'host:port'
+    :return: a (host, port) tuple
+    """
+    host, _, port = address.rpartition(':')
+    if not host or not port.isdigit():
+        raise ValueError("Invalid address {}, expected 'host:port'.".format(address))
+    return host, int(port)
+
+
+class SerialExecutor(Executor):
+    """An executor running each submitted task immediately in the caller."""
+
+    def submit(self, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) and return a completed future."""
+
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as exc:
+            future.set_exception(exc)
+        return future
+
+
+class TaskFailure:
+    """Result of a task that exceeded its time limit or killed its worker."""
+
+    def __init__(self, kind, message):
+        """
+        :param kind: 'timeout' or 'crash'
+        :param message: description of the failure
+        """
+        self.kind = kind
+        self.message = message
+
+    def __repr__(self):
+        return 'TaskFailure(kind={}, message={})'.format(self.kind, self.message)
+
+
+class AsyncioExecutor(Executor):
+    """
+    An executor running coroutine functions on an event loop in a
+    background thread, with at most jobs of them running at a time.
+    Submitting returns a concurrent.futures.Future, so the caller
+    does not need to run an event loop itself.
+    """
+
+    def __init__(self, jobs):
+        """
+        :param jobs: maximum number of coroutines running at a time
+        """
+        self._loop = asyncio.new_event_loop()
+        self._semaphore = asyncio.Semaphore(jobs)
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+
+    async def _limited(self, fn, args):
+        async with self._semaphore:
+            if asyncio.iscoroutinefunction(fn):
+                return await fn(*args)
+            return await asyncio.to_thread(fn, *args)
+
+    def submit(self, fn, *args):
+        """Schedule fn(*args) (in a thread if fn is not a coroutine function) and return its future."""
+
+        return asyncio.run_coroutine_threadsafe(self._limited(fn, args), self._loop)
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        """Stop the event loop (coroutines still running are abandoned)."""
+
+        if self._loop.is_closed():
+            return
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+
+def imapUnordered(executor, fn, tasks, window, timeout=None, split=None, started=None):
+    """
+    Submit fn(*task) for each task of a (lazy) task stream, keeping at
+    most window tasks in flight, and yield (task, result) pairs as they
+    complete. Unlike Executor.map or Pool.imap, the stream is only
+    consumed as fast as the workers finish, so memory stays flat no
+    matter how many tasks it holds.
+    If the executor is a WorkerPool, a worker dying or a task exceeding
+    its time limit does not end the run: the pool is replaced, the
+    innocent tasks in flight are resubmitted, and the culprit is yielded
+    with a TaskFailure as result. After a worker died, the tasks that
+    were in flight are rerun one at a time to find the culprit.
+    Given a split function, a lost task is instead cut around the part
+    its worker was busy with: only that part is rerun alone (or yielded
+    as the culprit of a timeout), and the rest of the task is rerun with
+    the other tasks.
+    :param executor: a concurrent.futures.Executor or WorkerPool
+    :param fn: the function to run
+    :param tasks: an iterable of argument tuples
+    :param window: maximum number of tasks in flight
+    :param timeout: function returning the time limit of a task in seconds,
+    None for no limit (only enforced by a WorkerPool of processes)
+    :param split: function taking a lost task and returning the task of the
+    part its worker was busy with (None if unknown) and a list of tasks
+    covering the rest of it, None to rerun lost tasks whole
+    :param started: function returning the time.time() a worker started a
+    task (NaN if it has not started), so that the time limit does not count
+    the wait in the queue of the executor, None to count from submission
+    :return: a generator of (task, result) tuples
+    """
+
+    tasks = iter(tasks)
+    pending = {}
+    suspects = deque()
+    retries = deque()
+    restartable = isinstance(executor, WorkerPool) and executor.canRestart()
+    timeout = timeout if restartable else None
+    split = split or (lambda task: (task, []))
+
+    def submit(task, isolated=False):
+        pending[executor.submit(fn, *task)] = (task, time.time(), isolated)
+
+    def deadline(task, submitted):
+        # Infinite while the task waits for a worker; a start time from
+        # before the submission belongs to an earlier run of the task
+        begun = submitted if started is None else started(task)
+        return begun + timeout(task) if begun >= submitted else float('inf')
+
+    def lose(task):
+        # A task lost with the pool: its busy part is a suspect of the
+        # crash, the rest is rerun with the other tasks
+        suspect, rest = split(task)
+        if suspect is not None:
+            suspects.append(suspect)
+        retries.extend(rest)
+
+    def refill():
+        # Pull new tasks only after the results have been consumed, so
+        # that lazy task streams can adapt to them. Suspects of a crash
+        # run alone, so that a second crash identifies the culprit
+        if suspects:
+            if not pending:
+                submit(suspects.popleft(), isolated=True)
+            return
+        while retries and len(pending) < window:
+            submit(retries.popleft())
+        for task in itertools.islice(tasks, window - len(pending)):
+            submit(task)
+
+    refill()
+    while pending:
+        waitTime = None
+        if timeout is not None:
+            deadlines = [deadline(task, submitted) for task, submitted, _ in pending.values()]
+            waitTime = max(min(deadlines) - time.time(), 0)
+            if float('inf') in deadlines:
+                # Wake up to see the queued tasks start
+                waitTime = min(waitTime, START_POLL)
+        done, _ = wait(pending, timeout=waitTime, return_when=FIRST_COMPLETED)
+
+        crashed = False
+        for future in done:
+            task, _, isolated = pending.pop(future)
+            try:
+                result = future.result()
+            except BrokenExecutor:
+                if not restartable:
+                    raise
+                crashed = True
+                if isolated:
+                    yield task, TaskFailure('crash', 'the worker process died')
+                else:
+                    lose(task)
+                continue
+            yield task, result
+
+        if crashed:
+            # All tasks still in flight were lost with the pool
+            for task, _, _ in pending.values():
+                lose(task)
+            pending.clear()
+            executor.restart()
+        elif timeout is not None:
+            now = time.time()
+            overdue = [future for future, (task, submitted, _) in pending.items()
+                       if deadline(task, submitted) <= now]
+            if overdue:
+                for future in overdue:
+                    task, _, _ = pending.pop(future)
+                    culprit, rest = split(task)
+                    if culprit is not None:
+                        yield culprit, TaskFailure('timeout', 'the task exceeded {:g} seconds'.format(
+                            timeout(task)))
+                    retries.extend(rest)
+                # Kill the hung workers and rerun the other tasks in flight
+                innocent = [(task, isolated) for task, _, isolated in pending.values()]
+                pending.clear()
+                executor.restart()
+                for task, isolated in innocent:
+                    submit(task, isolated)
+
+        refill()
+
+
+class WorkerPool:
+    """
+    A pool of workers of one backend, created once and reused by all
+    stages of a run, and replaced when a worker process dies or hangs.
+    The workers are only started when the first stage installs its
+    state, so runs without a parallel stage (e.g. a cache hit) do not
+    pay for them. Worker processes are forked from a server with
+    preloaded modules and stay warm between stages: each stage installs
+    its state (e.g. models and table buffer, or the table to
+    cross-validate) with install(), which pickles it once into shared
+    memory. The tasks only carry its key, and each worker loads the
+    state from shared memory and runs the initializer when the key
+    changed. A replacement pool is therefore indistinguishable from
+    the original one.
+    """
+
+    def __init__(self, backend, jobs=None, preload=DEFAULT_PRELOAD):
+        """
+        :param backend: one of BACKENDS (except 'cluster')
+        :param jobs: number of workers, None for the default of the backend
+        :param preload: modules the fork server imports before forking workers
+        """
+        self.backend = backend
+        self.jobs = workerCount(backend, jobs)
+        self._preload = preload
+        self._context = None
+        self._state = None
+        self._executor = None
+        self.restarts = 0
+
+    def _create(self):
+        """Create the executor and start its workers in the background."""
+
+        executor = createExecutor(self.backend, self.jobs, preload=self._preload)
+        if self.backend == 'processes':
+            # Workers forked before the first shared buffer exists would
+            # start resource trackers of their own, which unlink the
+            # buffers attached by a worker that is killed
+            resource_tracker.ensure_running()
+            for _ in range(self.jobs):
+                executor.submit(os.getpid)
+        return executor
+
+    def _started(self):
+        """Returns the executor, created on first use."""
+
+        if self._executor is None:
+            self._executor = self._create()
+        return self._executor
+
+    def canRestart(self):
+        """Only worker processes can be killed and replaced."""
+
+        return self.backend == 'processes'
+
+    def install(self, initializer, initargs=()):
+        """
+        Install the state of the next stage. Worker processes load it
+        from shared memory before their next task, in-process backends
+        run the initializer right away (threads share the installed state).
+        :param initializer: function installing per-worker state
+        :param initargs: arguments of the initializer
+        :return: the pool
+        """
+        self._started()
+        self._releaseState()
+        if self.backend == 'processes':
+            state = pickle.dumps(initargs)
+            self._state = SharedMemory(create=True, size=max(len(state), 1))
+            self._state.buf[:len(state)] = state
+            self._context = (uuid.uuid4().hex, initializer, self._state.name, len(state))
+        else:
+            initializer(*initargs)
+            self._context = None
+        return self
+
+    def submit(self, fn, *args):
+        """Submit fn(*args) to the current executor."""
+
+        if self._context is None:
+            return self._started().submit(fn, *args)
+        return self._started().submit(runInContext, *self._context, fn, *args)
+
+    def map(self, fn, tasks):
+        """
+        Run fn(*task) for each task on the workers.
+        :param fn: the function to run
+        :param tasks: an iterable of argument tuples
+        :return: the list of results, in the order of the tasks
+        """
+        futures = [self.submit(fn, *task) for task in tasks]
+        return [future.result() for future in futures]
+
+    def restart(self):
+        """Kill all worker processes and start a fresh pool."""
+
+        # Hung workers never return, so they are terminated explicitly
+        processes = getattr(self._executor, '_processes', None) or {}
+        for process in list(processes.values()):
+            process.terminate()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = self._create()
+        self.restarts += 1
+
+    def _releaseState(self):
+        """Free the shared memory of the installed state (if any)."""
+
+        if self._state is not None:
+            self._state.close()
+            self._state.unlink()
+            self._state = None
+
+    def shutdown(self, wait=True):
+        """Shut the current executor down and free the installed state."""
+
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+        self._releaseState()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        return False
+
+
+# Key of the state installed in this worker process
+_contextKey = None
+
+
+def runInContext(key, initializer, name, size, fn, *args):
+    """
+    Run fn(*args) in a worker process of a WorkerPool, after installing
+    the state of the current stage if the worker does not have it yet.
+    :param key: key of the state
+    :param initializer: function installing the state
+    :param name: name of the shared memory holding the pickled arguments
+    of the initializer
+    :param size: number of bytes of the pickled arguments
+    :param fn: the function to run
+    :return: the result of fn
+    """
+    global _contextKey
+    if key != _contextKey:
+        shm = SharedMemory(name=name)
+        try:
+            with shm.buf[:size] as state:
+                initargs = pickle.loads(state)
+        finally:
+            shm.close()
+        initializer(*initargs)
+        _contextKey = key
+    return fn(*args)
+
+
+def importingMain():
+    """
+    Returns True while the script of the run is imported by the fork
+    server or a freshly started worker process.
+    """
+    return getattr(multiprocessing.current_process(), '_inheriting', False)
+
+
+def guardsMain(path):
+    """
+    Checks whether a script only runs its analysis in a main block
+    (if __name__ == '__main__':), so that it can be imported safely.
+    :param path: path of the script
+    :return: a boolean
+    """
+    try:
+        with open(path) as infile:
+            tree = ast.parse(infile.read())
+    except (OSError, SyntaxError, ValueError):
+        return False
+    for node in tree.body:
+        if isinstance(node, ast.If) and isinstance(node.test, ast.Compare) and \
+                '__name__' in {getattr(part, 'id', None) for part in [node.test.left] + node.test.comparators}:
+            return True
+    return False
+
+
+def processContext(preload=DEFAULT_PRELOAD):
+    """
+    Returns the multiprocessing context of worker processes: a fork
+    server importing the preload modules once, where available.
+    :param preload: module names, '__main__' for the running script
+    :return: a multiprocessing context
+    """
+    main = sys.modules['__main__']
+    if 'forkserver' not in multiprocessing.get_all_start_methods() or \
+            not getattr(main, '__file__', None) or not guardsMain(main.__file__):
+        # Functions defined interactively only reach forked workers, and
+        # a script without a main block would run again in the server
+        return multiprocessing.get_context()
+    context = multiprocessing.get_context('forkserver')
+    context.set_forkserver_preload(list(preload))
+    return context
+
+
+def createExecutor(backend, jobs, initializer=None, initargs=(), preload=DEFAULT_PRELOAD):
+    """
+    Create an executor for the given backend. The initializer is run
+    once per worker process, or once in the calling process for the
+    in-process backends (threads share the installed state).
+    :param backend: one of BACKENDS
+    :param jobs: number of workers, None for the default of the backend
+    :param initializer: function installing per-worker state, None for no state
+    :param initargs: arguments of the initializer
+    :param preload: modules the fork server imports before forking workers
+    :return: a concurrent.futures.Executor
+    """
+
+    if backend not in BACKENDS:
+        raise ValueError('Unknown backend {}. Choose one of {}.'.format(backend, ', '.join(BACKENDS)))
+    if backend == 'cluster':
+        raise ValueError('The cluster backend is served by an ABCCoordinator.')
+
+    jobs = workerCount(backend, jobs)
+
+    if backend == 'processes':
+        return ProcessPoolExecutor(jobs, mp_context=processContext(preload),
+                                   initializer=initializer, initargs=initargs)
+
+    if initializer is not None:
+        initializer(*initargs)
+    if backend == 'threads':
+        return ThreadPoolExecutor(jobs)
+    if backend == 'asyncio':
+        return AsyncioExecutor(jobs)
+    return SerialExecutor()
@@ -0,0 +1,219 @@
+import functools
+import hashlib
+import inspect
+import marshal
+import os
+import pickle
+import shutil
+import types
+import warnings
+import numpy as np
+
+
+def codeFingerprint(func, _seen=None):
+    """
+    Returns a stable text representation of user-defined code. A function
+    is described by its source (or compiled code) and the values it refers
+    to: globals and closure variables, recursing into the functions and
+    classes of its own module (e.g. helpers of the simulate function).
+    Functions and classes of other modules are only described by name.
+    Callable objects, bound methods and functools.partial are described by
+    the code of their class or function and their pickled state.
+    :param func: a callable or None
+    :return: a string
+    """
+    if func is None:
+        return 'None'
+    seen = set() if _seen is None else _seen
+    if id(func) in seen:
+        return '<recursion>'
+    seen.add(id(func))
+
+    if isinstance(func, functools.partial):
+        return '\n'.join((codeFingerprint(func.func, seen), _valueFingerprint((func.args, func.keywords))))
+    if inspect.ismethod(func):
+        return '\n'.join((codeFingerprint(func.__func__, seen), _stateFingerprint(func.__self__)))
+    if not inspect.isfunction(func):
+        return '\n'.join((_sourceFingerprint(type(func)), _stateFingerprint(func)))
+
+    parts = [_sourceFingerprint(func)]
+    for name, value in _references(func):
+        parts.append('{}={}'.format(name, _referenceFingerprint(value, func.__module__, seen)))
+    return '\n'.join(parts)
+
+
+def _sourceFingerprint(obj):
+    """The source of a function or class, otherwise its compiled code or name."""
+
+    try:
+        return inspect.getsource(obj)
+    except (OSError, TypeError):
+        if hasattr(obj, '__code__'):
+            return marshal.dumps(obj.__code__).hex()
+        return '{}.{}'.format(obj.__module__, obj.__qualname__)
+
+
+def _references(func):
+    """Returns the (name, value) pairs of the globals and closure variables a function uses."""
+
+    names = set()
+    codes = [func.__code__]
+    while codes:
+        code = codes.pop()
+        names.update(code.co_names)
+        codes.extend(const for const in code.co_consts if isinstance(const, types.CodeType))
+
+    references = {name: func.__globals__[name] for name in names if name in func.__globals__}
+    for name, cell in zip(func.__code__.co_freevars, func.__closure__ or ()):
+        try:
+            references[name] = cell.cell_contents
+        except ValueError:
+            # The variable is not assigned yet
+            pass
+    return sorted(references.items(), key=lambda item: item[0])
+
+
+def _referenceFingerprint(value, module, seen):
+    """Describe a value used by a function of the given module."""
+
+    if inspect.ismodule(value):
+        return 'module ' + value.__name__
+    if inspect.isfunction(value) or inspect.isclass(value):
+        if value.__module__ == module:
+            return codeFingerprint(value, seen) if inspect.isfunction(value) else _sourceFingerprint(value)
+        return '{}.{}'.format(value.__module__, value.__qualname__)
+    if inspect.isbuiltin(value):
+        return '{}.{}'.format(value.__module__, value.__qualname__)
+    return _valueFingerprint(value)
+
+
+def _stateFingerprint(obj):
+    """
+    Hash of the attributes of an object. Unlike the pickled object, they do
+    not depend on the name of the module defining its class, which differs
+    between a script and the workers of a cluster importing it.
+    """
+    return _valueFingerprint(getattr(obj, '__dict__', obj))
+
+
+def _valueFingerprint(value):
+    """Hash of the pickled value, or its representation if it cannot be pickled."""
+
+    try:
+        return hashlib.sha256(pickle.dumps(value)).hexdigest()
+    except Exception:
+        warnings.warn('A value of type {} used by the simulate or summary code cannot be pickled; '
+                      'the reference table cache only notices changes of its representation.'.format(
+                          type(value).__name__))
+        return '{}:{!r}'.format(type(value).__name__, value)
+
+
+def priorFingerprint(priors):
+    """
+    Returns a stable text representation of a list of prior dicts.
+    Frozen scipy distributions are described by name and arguments.
+    :param priors: list - a list of dicts containing {priorName: stats.[dist]}
+    :return: a string
+    """
+    parts = []
+    for priorDict in priors:
+        for name, dist in priorDict.items():
+            if hasattr(dist, 'dist') and hasattr(dist, 'args'):
+                parts.append('{}={}{}{}'.format(name, dist.dist.name, dist.args,
+                                                sorted(dist.kwds.items())))
+            else:
+                parts.append('{}={!r}'.format(name, dist))
+    return ';'.join(parts)
+
+
+class ABCTableCache:
+    """
+    Content-addressed cache of unscaled reference tables across runs.
+    Tables are cached per model: each entry is an ABCTableStore with
+    the rows of one model, in a directory named by a hash of everything
+    these rows depend on: the simulate code and priors of the model, the
+    summary code, the number of simulations and the seed. Settings that
+    only affect the algorithm run on the table (keep, cv, algorithm...)
+    do not enter the key, so changing them reuses the table, and adding
+    or editing a model only simulates that model. The cache is bounded
+    in size and evicts the least recently used entries.
+    """
+
+    def __init__(self, path, maxSize=1024):
+        """
+        :param path: directory of the cache
+        :param maxSize: maximum size of the cache in megabytes
+        """
+        self.path = path
+        self.maxSize = maxSize
+        os.makedirs(path, exist_ok=True)
+
+    @staticmethod
+    def key(model, summarizer, simulations, seed=None):
+        """
+        Compute the key of the rows of a model.
+        :param model: the ABCModel instance
+        :param summarizer: the ABCSummary instance
+        :param simulations: number of simulations of the model
+        :param seed: base seed of the simulations, None if unseeded
+        :return: a hex digest
+        """
+        digest = hashlib.sha256()
+        for part in (model.fingerprint(), summarizer.fingerprint(), repr(simulations), repr(seed)):
+            digest.update(part.encode())
+        return digest.hexdigest()
+
+    @staticmethod
+    def seed(key, seed):
+        """
+        Derive the base seed of an entry from the run seed, so that the
+        models of a seeded run draw independent random streams.
+        :param key: the key of the entry
+        :param seed: base seed of the run, None if unseeded
+        :return: the base seed of the entry, None if unseeded
+        """
+        if seed is None:
+            return None
+        return int(np.random.SeedSequence([seed, int(key[:8], 16)]).generate_state(1)[0])
+
+    def entry(self, key):
+        """
+        Returns the store directory of an entry and marks it as used.
+        :param key: the key of the entry
+        :return: the directory, which may not exist yet
+        """
+        entryPath = os.path.join(self.path, key)
+        if os.path.isdir(entryPath):
+            os.utime(entryPath)
+        return entryPath
+
+    def _size(self, entryPath):
+        """Size of an entry in bytes."""
+
+        return sum(os.path.getsize(os.path.join(entryPath, fileName))
+                   for fileName in os.listdir(entryPath))
+
+    def evict(self, keep=()):
+        """
+        Remove the least recently used entries until the cache fits
+        into its maximum size.
+        :param keep: keys of entries that must not be removed
+        :return: the list of removed keys
+        """
+        entries = []
+        for key in os.listdir(self.path):
+            entryPath = os.path.join(self.path, key)
+            if os.path.isdir(entryPath):
+                entries.append((os.path.getmtime(entryPath), key, self._size(entryPath)))
+
+        total = sum(size for _, _, size in entries)
+        removed = []
+        for _, key, size in sorted(entries):
+            if total <= self.maxSize * 1024 ** 2:
+                break
+            if key in keep:
+                continue
+            shutil.rmtree(os.path.join(self.path, key), ignore_errors=True)
+            total -= size
+            removed.append(key)
+        return removed
@@ -0,0 +1,437 @@
+import argparse
+import hashlib
+import importlib.util
+import itertools
+import multiprocessing
+import os
+import socket
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import Future
+from multiprocessing.connection import AuthenticationError, Client, Listener
+
+from abrox.core.abc_backend import DEFAULT_ADDRESS, TaskFailure, parseAddress
+from abrox.core.abc_failures import ABCFailures
+from abrox.core.abc_initializer import ABCInitializer
+from abrox.core.abc_summary import ABCSummary
+from abrox.core.abc_threads import ABCThreadBudget
+from abrox.core.abc_worker import initWorker, simulateBlock, simulateRows
+
+# Coordinator/worker mode of the reference table ('cluster' backend).
+# The coordinator (the process running Abc) listens on a TCP address;
+# standalone workers started with
+#
+#     abrox-worker project.py --coordinator host:port --authkey KEY --jobs N
+#
+# load the models and the summary function from the same script and
+# connect to it. Messages are pickled Python tuples sent over a
+# multiprocessing connection (length-prefixed, authenticated with the
+# shared key, so only run it on networks you trust):
+#
+#   worker -> coordinator  ('hello', key, name)    key: hash of the model and
+#                                                  summary definitions
+#   coordinator -> worker  ('welcome', timeout)    or ('reject', message)
+#   coordinator -> worker  ('simulate', number, modelindex, count, seed)
+#   worker -> coordinator  ('result', number, params, sumstats, failures, elapsed)
+#                          ('error', number, traceback)
+#   coordinator -> worker  ('stop',)
+#
+# Workers pull a couple of blocks at a time and push the simulated rows
+# back; the blocks of a worker that disconnects are handed to the others.
+
+
+def definitionsKey(models, summarizer):
+    """
+    Hash of the model and summary definitions, so that the coordinator
+    only accepts workers simulating exactly the same models.
+    :param models: list of ABCModel instances
+    :param summarizer: the ABCSummary instance
+    :return: a hex digest
+    """
+    digest = hashlib.sha256()
+    for part in [model.fingerprint() for model in models] + [summarizer.fingerprint()]:
+        digest.update(part.encode())
+    return digest.hexdigest()
+
+
+class _ClusterTask:
+    """A simulation block waiting for or running on a remote worker."""
+
+    def __init__(self, session, number, modelindex, offset, count, seed):
+        self.session = session
+        self.number = number
+        self.modelindex = modelindex
+        self.offset = offset
+        self.count = count
+        self.seed = seed
+        self.attempts = 0
+        self.future = Future()
+
+    def message(self):
+        """The message sending the task to a worker."""
+
+        return ('simulate', self.number, self.session.remoteIndex(self.modelindex),
+                self.count, self.seed)
+
+
+class ABCClusterSession:
+    """
+    Executor-like view of the coordinator for one table generation:
+    it accepts simulateBlock tasks and writes the rows returned by the
+    remote workers into the table buffer, so that the results look the
+    same as those of local workers.
+    """
+
+    def __init__(self, coordinator, models, buffer):
+        """
+        :param coordinator: the ABCCoordinator
+        :param models: the models the task model indices refer to
+        :param buffer: the ABCTableBuffer to write the rows into
+        """
+        self._coordinator = coordinator
+        self._indices = [coordinator.modelIndex(model) for model in models]
+        self._buffer = buffer
+        self._lock = threading.Lock()
+        self.closed = False
+
+    def remoteIndex(self, modelindex):
+        """Index of a model in the model list of the workers."""
+
+        return self._indices[modelindex]
+
+    def submit(self, fn, modelindex, offset, count, seed):
+        """Queue a simulateBlock task for the workers and return its future."""
+
+        if fn is not simulateBlock:
+            raise ValueError('Remote workers only run simulateBlock tasks.')
+        return self._coordinator.enqueue(self, modelindex, offset, count, seed)
+
+    def complete(self, task, params, sumstats, failures, elapsed):
+        """Write the rows of a finished task into the buffer and resolve its future."""
+
+        with self._lock:
+            if self.closed:
+                return
+            if params.shape[0] > 0:
+                self._buffer.write(task.offset, params, sumstats)
+        localFailures = ABCFailures()
+        localFailures.merge(failures, task.modelindex)
+        task.future.set_result((params.shape[0], elapsed, None, localFailures))
+
+    def shutdown(self, wait=True):
+        """Stop writing into the buffer and drop the tasks still queued."""
+
+        with self._lock:
+            self.closed = True
+        self._coordinator.discard(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        return False
+
+
+class ABCCoordinator:
+    """
+    Serves simulation blocks to remote workers over TCP. Each connected
+    worker is handled by a thread that keeps a couple of blocks in flight
+    on it; when a worker disconnects, its blocks go back to the front of
+    the queue. A block lost with several workers is given up as a crash,
+    so a simulator killing its worker cannot stall the run. The
+    coordinator lives for a whole Abc run; each table generation submits
+    to it through an ABCClusterSession.
+    """
+
+    # Blocks in flight per worker, seconds between checks of the queue,
+    # and workers a block may be lost with before it is given up
+    prefetch = 2
+    pollInterval = 0.05
+    maxAttempts = 3
+
+    def __init__(self, address, authkey, models, summarizer, timeout=None):
+        """
+        :param address: the 'host:port' to listen on (port 0 for any free port)
+        :param authkey: the key shared with the workers
+        :param models: list of ABCModel instances
+        :param summarizer: the ABCSummary instance
+        :param timeout: time limit of one simulation in seconds, None for no limit
+        """
+        self._authkey = authkey.encode()
+        self._listener = Listener(parseAddress(address), authkey=self._authkey)
+        self.address = self._listener.address
+        self._fingerprints = [model.fingerprint() for model in models]
+        self._key = definitionsKey(models, summarizer)
+        self._timeout = timeout
+
+        self._lock = threading.Condition()
+        self._queue = deque()
+        self._workers = {}
+        self._numbers = itertools.count()
+        self._closed = False
+        self._threads = []
+        self._accepter = threading.Thread(target=self._accept, daemon=True)
+        self._accepter.start()
+
+    def modelIndex(self, model):
+        """Index of a model in the model list shared with the workers."""
+
+        return self._fingerprints.index(model.fingerprint())
+
+    def session(self, models, buffer):
+        """
+        Start submitting the blocks of a table generation.
+        :param models: the models the task model indices refer to
+        :param buffer: the ABCTableBuffer to write the rows into
+        :return: an ABCClusterSession
+        """
+        return ABCClusterSession(self, models, buffer)
+
+    def waitForWorkers(self):
+        """
+        Block until at least one worker is connected.
+        :return: the number of connected workers
+        """
+        with self._lock:
+            if not self._workers:
+                print('Waiting for workers to connect to {}:{}'.format(*self.address))
+            self._lock.wait_for(lambda: self._workers or self._closed)
+            return max(len(self._workers), 1)
+
+    def enqueue(self, session, modelindex, offset, count, seed):
+        """Queue a task of a session and return its future."""
+
+        task = _ClusterTask(session, next(self._numbers), modelindex, offset, count, seed)
+        with self._lock:
+            self._queue.append(task)
+        return task.future
+
+    def discard(self, session):
+        """Drop the queued tasks of a session."""
+
+        with self._lock:
+            self._queue = deque(task for task in self._queue if task.session is not session)
+
+    def _accept(self):
+        """Accept worker connections and serve each in its own thread."""
+
+        while not self._closed:
+            try:
+                conn = self._listener.accept()
+            except (OSError, EOFError, AuthenticationError):
+                continue
+            if self._closed:
+                conn.close()
+                break
+            thread = threading.Thread(target=self._serve, args=(conn,), daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def _serve(self, conn):
+        """Hand blocks to a worker and collect its results until it disconnects."""
+
+        try:
+            _, key, name = conn.recv()
+            if key != self._key:
+                conn.send(('reject', 'The worker runs other model or summary definitions '
+                                     'than the coordinator.'))
+                print('Rejected worker {}: the model or summary definitions differ.'.format(name))
+                conn.close()
+                return
+            conn.send(('welcome', self._timeout))
+        except (EOFError, OSError, ValueError):
+            conn.close()
+            return
+
+        inflight = {}
+        with self._lock:
+            self._workers[id(inflight)] = name
+            self._lock.notify_all()
+        try:
+            while not self._closed:
+                self._assign(conn, inflight)
+                if conn.poll(self.pollInterval):
+                    self._finish(conn.recv(), inflight)
+            conn.send(('stop',))
+        except (EOFError, OSError):
+            # The worker disconnected (or died)
+            pass
+        finally:
+            with self._lock:
+                del self._workers[id(inflight)]
+                self._requeue(inflight.values())
+            conn.close()
+
+    def _assign(self, conn, inflight):
+        """Send queued tasks to a worker until it has enough in flight."""
+
+        tasks = []
+        with self._lock:
+            while self._queue and len(inflight) < self.prefetch:
+                task = self._queue.popleft()
+                inflight[task.number] = task
+                tasks.append(task)
+        for task in tasks:
+            conn.send(task.message())
+
+    def _finish(self, message, inflight):
+        """Resolve a task from the message of a worker."""
+
+        kind, number = message[:2]
+        task = inflight.pop(number)
+        if kind == 'result':
+            task.session.complete(task, *message[2:])
+        else:
+            task.future.set_exception(RuntimeError('A remote worker failed:\n' + message[2]))
+
+    def _requeue(self, tasks):
+        """Put the tasks of a lost worker back in front of the queue (lock held)."""
+
+        for task in tasks:
+            if task.session.closed:
+                continue
+            task.attempts += 1
+            if task.attempts >= self.maxAttempts:
+                task.future.set_result(TaskFailure('crash', 'the block was lost with {} workers'.format(
+                    task.attempts)))
+            else:
+                self._queue.appendleft(task)
+
+    def close(self):
+        """Stop the workers and the listener."""
+
+        self._closed = True
+        with self._lock:
+            self._lock.notify_all()
+        # A blocked accept() only returns for a new connection
+        try:
+            Client(self.address, authkey=self._authkey).close()
+        except (OSError, EOFError, AuthenticationError):
+            pass
+        self._accepter.join()
+        for thread in self._threads:
+            thread.join()
+        self._listener.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def loadConfig(script):
+    """
+    Import a script defining CONFIG (e.g. the script generated by the GUI)
+    without running its __main__ block.
+    :param script: path of the script
+    :return: the CONFIG dict
+    """
+    script = os.path.abspath(script)
+    sys.path.insert(0, os.path.dirname(script))
+    spec = importlib.util.spec_from_file_location('__abrox_worker__', script)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.CONFIG
+
+
+def connect(address, authkey, wait=60.0):
+    """
+    Connect to a coordinator, retrying while it is not up yet.
+    :param address: a (host, port) tuple
+    :param authkey: the shared key as bytes
+    :param wait: seconds to keep retrying
+    :return: the connection
+    """
+    deadline = time.monotonic() + wait
+    while True:
+        try:
+            return Client(address, authkey=authkey)
+        except ConnectionRefusedError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(1)
+
+
+def serve(script, address, authkey, blasThreads=None, wait=60.0):
+    """
+    Run a worker: load the models and the summary function from the
+    script, connect to the coordinator and simulate the blocks it sends
+    until it stops the worker or goes away.
+    :param script: path of the script defining CONFIG
+    :param address: the 'host:port' of the coordinator
+    :param authkey: the key shared with the coordinator
+    :param blasThreads: BLAS threads of this worker, None to leave unchanged
+    :param wait: seconds to wait for the coordinator to come up
+    :return: None
+    """
+    config = loadConfig(script)
+    models, _ = ABCInitializer(config).buildAndGetModels()
+    summarizer = ABCSummary(config['summary'], config.get('summary_batch'))
+
+    with connect(parseAddress(address), authkey.encode(), wait) as conn:
+        conn.send(('hello', definitionsKey(models, summarizer),
+                   '{}:{}'.format(socket.gethostname(), os.getpid())))
+        reply = conn.recv()
+        if reply[0] == 'reject':
+            raise RuntimeError(reply[1])
+        initWorker(models, summarizer, None, blasThreads, None, reply[1])
+
+        while True:
+            try:
+                message = conn.recv()
+            except EOFError:
+                # The coordinator went away
+                return
+            if message[0] == 'stop':
+                return
+            _, number, modelindex, count, seed = message
+            try:
+                params, sumstats, _, failures, elapsed = simulateRows(modelindex, count, seed)
+            except Exception:
+                conn.send(('error', number, traceback.format_exc()))
+            else:
+                conn.send(('result', number, params, sumstats, failures, elapsed))
+
+
+def main(argv=None):
+    """Command line entry point of the standalone worker (abrox-worker)."""
+
+    parser = argparse.ArgumentParser(prog='abrox-worker',
+                                     description='Simulate reference table blocks for an '
+                                                 'ABrox coordinator.')
+    parser.add_argument('script', help='the ABrox script defining CONFIG')
+    parser.add_argument('--coordinator', default=DEFAULT_ADDRESS,
+                        help="address of the coordinator as 'host:port' (default: %(default)s)")
+    parser.add_argument('--authkey', default=os.environ.get('ABROX_AUTHKEY'),
+                        help='key shared with the coordinator (default: $ABROX_AUTHKEY)')
+    parser.add_argument('--jobs', type=int, default=1, help='number of worker processes')
+    parser.add_argument('--blasthreads', type=int, default=None,
+                        help='BLAS threads per worker (default: split the cores evenly)')
+    parser.add_argument('--wait', type=float, default=60.0,
+                        help='seconds to wait for the coordinator (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    if not args.authkey:
+        parser.error('provide the --authkey shared with the coordinator (or set ABROX_AUTHKEY)')
+
+    budget = ABCThreadBudget('processes', args.jobs, args.blasthreads)
+    workerArgs = (args.script, args.coordinator, args.authkey, budget.blasThreads, args.wait)
+    if args.jobs == 1:
+        serve(*workerArgs)
+        return
+
+    processes = [multiprocessing.Process(target=serve, args=workerArgs) for _ in range(args.jobs)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
+if __name__ == '__main__':
+    main()
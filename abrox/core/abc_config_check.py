@@ -1,3 +1,11 @@
+import inspect
+
+from abrox.core.abc_backend import BACKENDS, DEFAULT_ADDRESS, parseAddress
+from abrox.core.abc_external import ABCExternalSimulator
+from abrox.core.abc_initializer import ABCInitializer
+from abrox.core.abc_profiler import ABCProfiler
+from abrox.core.abc_summary import ABCSummary
+
 
 class ConfigurationError(Exception):
     pass
@@ -14,7 +22,8 @@ class ConfigTester:
         :return: None
         """
         names = {'data', 'models', 'summary', 'distance', 'settings'}
-        if names != set(self.config.keys()):
+        optional = {'summary_batch'}
+        if not names <= set(self.config.keys()) <= names | optional:
             raise ConfigurationError('The configuration file should contain the following keys: \n' +
                                      ','.join(names))
 
@@ -23,10 +32,35 @@ class ConfigTester:
         Checks if the model key contains the necessary information.
         :return: None
         """
+        required = {'name', 'priors', 'simulate'}
+        optional = {'simulate_batch'}
         for i, modelDict in enumerate(self.config['models']):
-            if set(modelDict.keys()) != {'name', 'priors', 'simulate'}:
+            if 'external' in modelDict:
+                self._checkExternalModel(modelDict)
+                continue
+            if not required <= set(modelDict.keys()) <= required | optional:
                 raise ConfigurationError(
-                    "A model needs to be provided with three keys: 'name', 'priors', and 'simulate'")
+                    "A model needs to be provided with three keys: 'name', 'priors', and 'simulate' "
+                    "and may additionally provide 'simulate_batch'")
+
+    def _checkExternalModel(self, modelDict):
+        """
+        Checks a model simulated by a persistent external program.
+        :return: None
+        """
+        if set(modelDict.keys()) != {'name', 'priors', 'external'}:
+            raise ConfigurationError(
+                "A model with an 'external' simulator needs to be provided with the keys "
+                "'name', 'priors' and 'external' only")
+        external = modelDict['external']
+        if not isinstance(external, dict) or not {'command', 'shape'} <= set(external.keys()) or \
+                not set(external.keys()) <= {'command', 'shape', 'protocol', 'cwd'}:
+            raise ConfigurationError(
+                "The 'external' simulator of model {} needs a 'command' and the 'shape' of a "
+                "dataset, and may provide a 'protocol' and a 'cwd'".format(modelDict['name']))
+        if external.get('protocol', 'binary') not in ABCExternalSimulator.PROTOCOLS:
+            raise ConfigurationError("The protocol of an external simulator should be one of: " +
+                                     ','.join(ABCExternalSimulator.PROTOCOLS))
 
     def _checkDataSetting(self):
         """
@@ -76,6 +110,119 @@ class ConfigTester:
         if self.config['settings']['objective'] == "inference" and len(self.config['models']) > 1:
             raise ConfigurationError('Please define only one model for parameter inference.')
 
+    def _checkMethodSettings(self):
+        """
+        Check the settings of the ABC algorithm.
+        :return: None
+        """
+        method = self.config['settings']['method']
+        if method['algorithm'] == 'mcmc':
+            chains = method['specs'].get('chains', 1)
+            if not isinstance(chains, int) or isinstance(chains, bool) or chains < 1:
+                raise ConfigurationError("The MCMC setting 'chains' should be a positive integer.")
+
+    def _checkRefTableSettings(self):
+        """
+        Check if the execution backend, worker and thread counts and the
+        storage settings of the reference table are valid.
+        :return: None
+        """
+        reftable = self.config['settings']['reftable']
+        if reftable.get('backend', 'processes') not in BACKENDS:
+            raise ConfigurationError("The reference table backend should be one of: " +
+                                     ','.join(BACKENDS))
+
+        if not reftable.get('inmemory', True) and not reftable.get('store'):
+            raise ConfigurationError("Provide a 'store' directory if the reference table "
+                                     "is not kept in memory ('inmemory': False).")
+
+        if reftable.get('resume', False) and not reftable.get('store'):
+            raise ConfigurationError("Provide the 'store' directory of the run to resume.")
+
+        if reftable.get('extend') is not None:
+            if bool(reftable.get('extref')) == bool(reftable.get('store')):
+                raise ConfigurationError("Extending a reference table needs either an 'extref' "
+                                         "file or a 'store' directory holding the table.")
+            if reftable.get('resume', False):
+                raise ConfigurationError("A reference table cannot be resumed and extended at once.")
+
+        if reftable.get('cache') and reftable.get('store'):
+            raise ConfigurationError("Use either a reference table 'cache' or a 'store', not both.")
+
+        if reftable.get('seed') is not None and not isinstance(reftable.get('seed'), int):
+            raise ConfigurationError("The reference table setting 'seed' should be an integer or None.")
+
+        if reftable.get('timebudget') is not None:
+            if not isinstance(reftable['timebudget'], (int, float)) or reftable['timebudget'] <= 0:
+                raise ConfigurationError("The reference table setting 'timebudget' should be "
+                                         "a positive number of seconds or None.")
+        elif reftable.get('simulations') is None and not (reftable.get('extref') or reftable.get('extend')
+                                                          or reftable.get('resummarize', False)):
+            raise ConfigurationError("Provide the number of 'simulations' or a 'timebudget'.")
+
+        if reftable.get('timeout') is not None:
+            if not isinstance(reftable['timeout'], (int, float)) or reftable['timeout'] <= 0:
+                raise ConfigurationError("The reference table setting 'timeout' should be "
+                                         "a positive number of seconds or None.")
+            if reftable.get('backend', 'processes') == 'threads':
+                raise ConfigurationError("Simulation timeouts need the 'processes', 'serial' "
+                                         "or 'asyncio' backend.")
+            # Plain simulate functions run in threads on the asyncio
+            # backend, which cannot be stopped when they time out
+            if reftable.get('backend', 'processes') == 'asyncio' and \
+                    not all(inspect.iscoroutinefunction(modelDict.get('simulate'))
+                            for modelDict in self.config['models']):
+                raise ConfigurationError("Simulation timeouts on the 'asyncio' backend need "
+                                         "async simulate functions (async def simulate).")
+
+        if reftable.get('backend', 'processes') == 'cluster':
+            if not isinstance(reftable.get('authkey'), str) or not reftable['authkey']:
+                raise ConfigurationError("The cluster backend needs an 'authkey' shared with the workers.")
+            try:
+                parseAddress(reftable.get('coordinator', DEFAULT_ADDRESS))
+            except ValueError:
+                raise ConfigurationError("The reference table setting 'coordinator' should be "
+                                         "an address of the form 'host:port'.")
+            if reftable.get('rawstore'):
+                raise ConfigurationError("A 'rawstore' cannot be used with the cluster backend.")
+
+        preload = reftable.get('preload', ())
+        if not isinstance(preload, (list, tuple)) or not all(isinstance(name, str) for name in preload):
+            raise ConfigurationError("The reference table setting 'preload' should be a list of "
+                                     "module names.")
+
+        if reftable.get('allocation', 'equal') not in ('equal', 'adaptive'):
+            raise ConfigurationError("The reference table allocation should be 'equal' or 'adaptive'.")
+
+        if reftable.get('allocation', 'equal') == 'adaptive':
+            if self.config['settings']['objective'] != 'comparison':
+                raise ConfigurationError("Adaptive allocation is only available for model comparison.")
+            if reftable.get('timebudget') is not None or reftable.get('simulations') is None:
+                raise ConfigurationError("Adaptive allocation needs the maximum number of "
+                                         "'simulations' per model and no 'timebudget'.")
+
+        if reftable.get('rawstore'):
+            if reftable.get('cache') or reftable.get('extend') is not None or reftable.get('extref'):
+                raise ConfigurationError("A 'rawstore' only records simulations run from scratch, "
+                                         "it cannot be combined with 'cache', 'extend' or 'extref'.")
+        elif reftable.get('resummarize', False):
+            raise ConfigurationError("Provide the 'rawstore' directory of the simulations to resummarize.")
+
+        if not isinstance(reftable.get('profile', False), bool):
+            raise ConfigurationError("The reference table setting 'profile' should be True or False.")
+
+        for key in ('maxruntime', 'maxmemory'):
+            value = reftable.get(key)
+            if value is not None and (not isinstance(value, (int, float)) or value <= 0):
+                raise ConfigurationError("The reference table setting '{}' should be "
+                                         "a positive number or None.".format(key))
+
+        for key in ('jobs', 'blasthreads', 'extend', 'cachesize'):
+            value = reftable.get(key)
+            if value is not None and (not isinstance(value, int) or value < 1):
+                raise ConfigurationError("The reference table setting '{}' should be "
+                                         "a positive integer or None.".format(key))
+
     def checkForErrors(self):
         """
         Run all sanity tests on the config file.
@@ -88,3 +235,45 @@ class ConfigTester:
         self._checkDistanceSettings()
         self._checkDirectory()
         self._checkObjective()
+        self._checkMethodSettings()
+        self._checkRefTableSettings()
+
+    def profile(self, models=None, summarizer=None, sumStatObsData=None):
+        """
+        Time a few simulations of each model, print the predicted cost of
+        the reference table and refuse runs exceeding the 'maxruntime'
+        (seconds) or 'maxmemory' (MB) of the reference table settings.
+        The models, summarizer and observed summary statistics are built
+        from the config unless given.
+        :return: the prediction (see ABCProfiler.predict), None if the
+        reference table is not simulated
+        """
+        initializer = ABCInitializer(self.config)
+        settings = initializer.extractAndGetSettings()
+        if settings['resummarize'] or (settings['extref'] and not settings['extend']):
+            return None
+        if models is None:
+            models, _ = initializer.buildAndGetModels()
+            summarizer = ABCSummary(self.config['summary'], self.config.get('summary_batch'))
+            sumStatObsData = summarizer.summarize(initializer.getOrGenerateObsData(models))
+
+        profiler = ABCProfiler(models, summarizer, sumStatObsData, timeout=settings['timeout'])
+        costs = profiler.calibrate()
+        failed = costs.index[costs['draws'] == costs['failed']]
+        if len(failed):
+            print(costs)
+            raise ConfigurationError('All calibration simulations of {} failed.'.format(', '.join(failed)))
+
+        prediction = profiler.predict(settings['extend'] or settings['nsim'], settings['backend'],
+                                      settings['jobs'], settings['timebudget'])
+        print(profiler.report(prediction))
+
+        if settings['maxruntime'] is not None and prediction['runtime'] > settings['maxruntime']:
+            raise ConfigurationError("The reference table is predicted to take {:.0f} seconds, more than "
+                                     "the 'maxruntime' of {} seconds.".format(prediction['runtime'],
+                                                                             settings['maxruntime']))
+        if settings['maxmemory'] is not None and prediction['memory'] > settings['maxmemory']:
+            raise ConfigurationError("The reference table is predicted to need {:.0f} MB, more than "
+                                     "the 'maxmemory' of {} MB.".format(prediction['memory'],
+                                                                       settings['maxmemory']))
+        return prediction
@@ -3,35 +3,87 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import matplotlib.backends.backend_pdf
 
-from abrox.core.abc_utils import toArray, euclideanDistance
+from abrox.core.abc_shared import ABCSharedTable
+from abrox.core.abc_utils import euclideanDistance
+
+# The cross-validation run by the workers of a pool, installed once
+# per worker so that tasks only carry the picked rows
+_cv = None
+
+
+def initCv(cv, sharedTable):
+    """
+    Pool initializer. Stores the cross-validation in the worker.
+    :param cv: the ABCCv instance (without its reference table)
+    :param sharedTable: the ABCSharedTable holding the reference table
+    :return: None
+    """
+    global _cv
+    _cv = cv
+    _cv.setRefTable(sharedTable.table)
+
+
+def computeFolds(picks):
+    """
+    Run the cross-validation of the worker for a chunk of picked rows.
+    :param picks: row indices of the pseudo-observed data
+    :return: see ABCCv.computeFolds
+    """
+    return _cv.computeFolds(picks)
 
 
 class ABCCv:
 
-    def __init__(self, refTable, keep, objective, times, modelNames=None):
+    def __init__(self, refTable, keep, objective, times, modelNames=None, modelPrior=None,
+                 pool=None):
         self.estimatedParams = None
         self.trueParams = None
-        self.refTable = refTable
-        self.sumStatArray = toArray(self.refTable,'sumstat')
-        self.paramArray = toArray(self.refTable,'param')
-        self.indexList = np.arange(len(self.refTable.index))
+        self.setRefTable(refTable)
         self.picks = []
         self.keep = keep
         self.objective = objective
         self.times = times
         self.modelNames = modelNames
+        self.modelPrior = modelPrior
+        self.pool = pool
 
-    def _getRandomIndices(self):
+    def __getstate__(self):
         """
-        Pick a random row index from the reference table and the remaining indices.
-        :return: both the picked index and the remaining indices.
+        Workers receive the cross-validation without the pool and the
+        reference table, which they map from an ABCSharedTable.
         """
-        picked = np.random.choice(self.indexList)
+        state = self.__dict__.copy()
+        state['pool'] = None
+        for name in ('refTable', 'sumStatArray', 'paramArray', 'indexList'):
+            state[name] = None
+        return state
 
-        self.picks.append(picked)
+    def setRefTable(self, refTable):
+        """
+        Set the reference table to cross-validate.
+        :param refTable: the RefTable
+        :return: None
+        """
+        self.refTable = refTable
+        self.sumStatArray = self.refTable.sumstat
+        self.paramArray = self.refTable.param
+        self.indexList = np.arange(len(self.refTable))
+
+    def _getRandomIndices(self):
+        """
+        Pick one random row index from the reference table per run.
+        :return: the picked indices.
+        """
+        self.picks = np.random.choice(self.indexList, self.times)
+        return self.picks
 
-        notPicked = self.indexList[self.indexList != picked]
-        return picked, notPicked
+    def _getRemainingIndices(self, picked):
+        """
+        Return the indices of all rows except the picked one.
+        :param picked: the picked index.
+        :return: the remaining indices.
+        """
+        return self.indexList[self.indexList != picked]
 
     def calculateDistance(self, picked, notPicked):
         """
@@ -42,24 +94,19 @@ class ABCCv:
         distances = euclideanDistance(self.sumStatArray[notPicked], self.sumStatArray[picked])
         return distances
 
-    def deletePickedRow(self,picked):
+    def getSubset(self, notPicked, distances):
         """
-        Drop the picked row from the reference table.
-        :param picked: integer representing the row-index.
-        :return: None
-        """
-        subTable = self.refTable.drop(self.refTable.index[[picked]], inplace=False)
-        return subTable
-
-    def getSubset(self, subTable):
+        Return filtered Reference Table only containing the remaining
+        rows for which the distance is < threshold.
+        :param notPicked: row indices of the remaining rows.
+        :param distances: distances of the remaining rows.
+        :return: the subset table.
         """
-        Return tuple with filtered Reference Table only containing
-        rows for which the distance is < threshold and threshold itself.
-        :return: the tuple
-        """
-        q = self.keep / len(subTable.index) * 100
-        threshold = np.percentile(subTable['distance'],q=q)
-        subset = subTable[subTable['distance'] < threshold]
+        q = self.keep / len(notPicked) * 100
+        threshold = np.percentile(distances,q=q)
+        accepted = distances < threshold
+        subset = self.refTable.subset(notPicked[accepted])
+        subset.distance = distances[accepted]
         return subset
 
     def getEstimates(self,subset):
@@ -68,8 +115,7 @@ class ABCCv:
         :param subset: the subset table.
         :return: the means (estimates)
         """
-        paramArray = toArray(subset,'param')
-        return np.mean(paramArray, axis=0)
+        return np.mean(subset.param, axis=0)
 
     def getPrediction(self,subset):
         """
@@ -77,55 +123,74 @@ class ABCCv:
         :param subset: the subset of the ref table.
         :return: a prediction
         """
-        _ , counts = np.unique(subset['idx'], return_counts=True)
-        return np.argmax(counts)
+        indices, counts = np.unique(subset.idx, return_counts=True)
+        if self.modelPrior is not None:
+            # Predict under equal prior model probabilities
+            counts = counts / np.asarray(self.modelPrior)[indices]
+        return indices[np.argmax(counts)]
 
-    def computeSubset(self):
+    def computeSubset(self, picked):
         """
         Run cross validation scheme:
-            - pick a simulated summary statistic from the ref table.
+            - take a simulated summary statistic from the ref table.
             - treat it as pseudo-observed
             - compute the distances between all other and the pseudo-observed one.
             - compute subset reference table based on distances.
-        :param times: accuracy of cv.
+        :param picked: row index of the pseudo-observed summary statistic.
         :return: subset reference table.
         """
 
-        picked, notPicked = self._getRandomIndices()
+        notPicked = self._getRemainingIndices(picked)
         distances = self.calculateDistance(picked, notPicked)
-        subTable = self.deletePickedRow(picked)
-        subTable['distance'] = distances
-        filteredSubset = self.getSubset(subTable)
+        filteredSubset = self.getSubset(notPicked, distances)
 
         return filteredSubset
 
-    def compute(self):
+    def computeFolds(self, picks):
         """
         Compute the array of estimated parameters if obj is inference.
         Compute the model predictions if obj is comparison.
-        :param times: accuracy of cross validation sheme.
+        :param picks: row indices of the pseudo-observed summary statistics.
         """
         if self.objective == "comparison":
 
-            pred = np.empty(shape=(self.times,1),dtype=np.uint8)
+            pred = np.empty(shape=(len(picks),1),dtype=np.uint8)
 
-            for i in range(self.times):
-                subset = self.computeSubset()
+            for i, picked in enumerate(picks):
+                subset = self.computeSubset(picked)
                 pred[i,0] = self.getPrediction(subset)
 
             return pred
 
         if self.objective == "inference":
 
-            cols = len(self.refTable.at[0, 'param'])
-            estimatedParams = np.empty(shape=(self.times, cols))
+            cols = self.paramArray.shape[1]
+            estimatedParams = np.empty(shape=(len(picks), cols))
 
-            for i in range(self.times):
-                subset = self.computeSubset()
+            for i, picked in enumerate(picks):
+                subset = self.computeSubset(picked)
                 estimatedParams[i, :] = self.getEstimates(subset)
 
             return estimatedParams
 
+    def compute(self):
+        """
+        Run the cross validation for 'times' randomly picked rows. With a
+        pool, the runs are split into one chunk per worker.
+        """
+        picks = self._getRandomIndices()
+        if self.pool is None:
+            return self.computeFolds(picks)
+
+        chunks = np.array_split(picks, min(self.times, self.pool.jobs))
+        sharedTable = ABCSharedTable(self.refTable, shared=self.pool.backend == 'processes')
+        try:
+            results = self.pool.install(initCv, (self, sharedTable)).map(
+                computeFolds, [(chunk,) for chunk in chunks])
+        finally:
+            sharedTable.release()
+        return np.concatenate(results)
+
     def report(self, outputdir):
         """
         Compute the prediction error if the objective is inference.
@@ -134,11 +199,11 @@ class ABCCv:
 
         if self.objective == "comparison":
             predictions = self.compute()
-            true = toArray(self.refTable, 'idx')[self.picks, :]
-            actual = pd.Series(true[:,0],name="Actual")
+            true = self.refTable.idx[self.picks]
+            actual = pd.Series(true,name="Actual")
             predicted = pd.Series(predictions[:,0], name="Predicted")
             confusionMatrix = pd.crosstab(actual,predicted)
-            self.saveConfusion(confusionMatrix.as_matrix(),outputdir)
+            self.saveConfusion(confusionMatrix.values,outputdir)
 
             return confusionMatrix
 
@@ -149,7 +214,9 @@ class ABCCv:
             SumSqDiff = np.sum((self.estimatedParams - self.trueParams)**2,axis=0)
             Variance = np.var(self.trueParams,axis=0)
 
-            return np.float(SumSqDiff / Variance)
+            # One prediction error per parameter, a number for a single parameter
+            error = SumSqDiff / Variance
+            return error.item() if error.size == 1 else error
 
     def saveConfusion(self, confusionMatrix, outputdir):
         """
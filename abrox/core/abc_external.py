@@ -0,0 +1,193 @@
+import hashlib
+import os
+import shlex
+import shutil
+import struct
+import subprocess
+import threading
+import numpy as np
+
+# Protocol between ABrox and a persistent external simulator. The
+# simulator is started once per worker and reads simulation requests
+# from its stdin until it reaches end of file, then exits. Each request
+# holds a batch of n parameter vectors with k parameters each (in the
+# order of the model priors); the simulator answers with one dataset of
+# the declared shape per parameter vector, in the same order:
+#
+#   'text'   request:  a line "n k", then n lines of k whitespace-separated numbers
+#            response: n lines, each holding the values of one dataset
+#                      (row-major, whitespace-separated)
+#   'binary' request:  n and k as little-endian uint32, then n*k little-endian float64
+#            response: n*prod(shape) little-endian float64 (row-major)
+#
+# The simulator must flush stdout after each response. Anything written
+# to stderr is passed through to the console.
+
+
+class ABCExternalSimulator:
+    """
+    Simulates datasets with a long-lived external program, so that the
+    program is started once per worker instead of once per simulation.
+    Every worker process (or thread) drives its own simulator process,
+    started on first use. A process that dies, answers out of protocol
+    or is interrupted (e.g. by a simulation timeout) is killed and
+    replaced on the next request. Closing the pipe to a simulator ends
+    it, which also happens when its worker exits.
+    """
+
+    PROTOCOLS = ('text', 'binary')
+
+    def __init__(self, command, shape, protocol='binary', cwd=None):
+        """
+        :param command: the command starting the simulator, as list or string
+        :param shape: shape of one simulated dataset, e.g. (#obs, #vars)
+        :param protocol: 'text' or 'binary'
+        :param cwd: working directory of the simulator, None for the current one
+        """
+        if protocol not in self.PROTOCOLS:
+            raise ValueError('Unknown protocol {}. Choose one of {}.'.format(
+                protocol, ', '.join(self.PROTOCOLS)))
+        self.command = shlex.split(command) if isinstance(command, str) else list(command)
+        self.shape = tuple(shape)
+        self.protocol = protocol
+        self.cwd = cwd
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._processes = []
+
+    def __getstate__(self):
+        """Simulator processes stay with the process that started them."""
+
+        return {'command': self.command, 'shape': self.shape,
+                'protocol': self.protocol, 'cwd': self.cwd}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def _process(self):
+        """Returns the simulator process of the current thread, starting it if needed."""
+
+        process = getattr(self._local, 'process', None)
+        if process is not None and process.poll() is not None:
+            self._stop(process)
+            process = None
+        if process is None:
+            process = subprocess.Popen(self.command, stdin=subprocess.PIPE,
+                                       stdout=subprocess.PIPE, cwd=self.cwd)
+            self._local.process = process
+            with self._lock:
+                self._processes.append(process)
+        return process
+
+    def _stop(self, process):
+        """Kill a simulator process that is out of step (or dead)."""
+
+        process.kill()
+        process.wait()
+        for pipe in (process.stdin, process.stdout):
+            pipe.close()
+        self._local.process = None
+        with self._lock:
+            self._processes.remove(process)
+
+    def simulateBatch(self, params):
+        """
+        Simulate one dataset per row of a parameter block.
+        :param params: a numpy array of shape (#rows, #parameters)
+        :return: a numpy array of shape (#rows,) + shape
+        """
+        params = np.asarray(params, dtype=np.float64).reshape(len(params), -1)
+        process = self._process()
+        try:
+            self._send(process, params)
+            return self._receive(process, params.shape[0])
+        except BaseException:
+            # A partial exchange leaves the pipes out of step, so the
+            # process is replaced rather than reused
+            self._stop(process)
+            raise
+
+    def simulate(self, params):
+        """
+        Simulate one dataset.
+        :param params: a dictionary with parameter-names : parameter-values
+        :return: a numpy array of the declared shape
+        """
+        return self.simulateBatch(np.array([list(params.values())], dtype=np.float64))[0]
+
+    def _send(self, process, params):
+        """Write a request."""
+
+        n, k = params.shape
+        if self.protocol == 'text':
+            lines = ['{} {}'.format(n, k)] + [' '.join(map(repr, row)) for row in params.tolist()]
+            request = ('\n'.join(lines) + '\n').encode()
+        else:
+            request = struct.pack('<II', n, k) + params.astype('<f8').tobytes()
+        process.stdin.write(request)
+        process.stdin.flush()
+
+    def _receive(self, process, n):
+        """Read the response to a request of n parameter vectors."""
+
+        size = int(np.prod(self.shape))
+        if self.protocol == 'binary':
+            nbytes = 8 * n * size
+            response = process.stdout.read(nbytes)
+            if len(response) < nbytes:
+                raise self._died(process)
+            return np.frombuffer(response, dtype='<f8').reshape((n,) + self.shape).astype(np.float64)
+
+        datasets = np.empty((n, size))
+        for i in range(n):
+            line = process.stdout.readline()
+            if not line:
+                raise self._died(process)
+            values = np.array(line.split(), dtype=np.float64)
+            if values.size != size:
+                raise RuntimeError('The external simulator {} returned {} values instead of {}.'.format(
+                    ' '.join(self.command), values.size, size))
+            datasets[i] = values
+        return datasets.reshape((n,) + self.shape)
+
+    def _died(self, process):
+        """The error raised when a simulator stops answering."""
+
+        try:
+            code = process.wait(timeout=1)
+        except subprocess.TimeoutExpired:
+            code = None
+        return RuntimeError('The external simulator {} stopped answering (exit code {}).'.format(
+            ' '.join(self.command), code))
+
+    def close(self):
+        """End all simulator processes started by this instance."""
+
+        with self._lock:
+            processes, self._processes = self._processes, []
+        for process in processes:
+            try:
+                process.stdin.close()
+                process.wait(timeout=5)
+            except (OSError, subprocess.TimeoutExpired):
+                process.kill()
+                process.wait()
+        self._local = threading.local()
+
+    def fingerprint(self):
+        """
+        Returns a text uniquely describing the simulator: its command,
+        protocol and shape, and the content of the executable and of
+        the files the command refers to (e.g. a script).
+        """
+        parts = [repr(self.command), repr(self.shape), self.protocol]
+        for i, argument in enumerate(self.command):
+            path = shutil.which(argument) if i == 0 else os.path.join(self.cwd or '', argument)
+            if path and os.path.isfile(path):
+                with open(path, 'rb') as infile:
+                    parts.append(hashlib.sha256(infile.read()).hexdigest())
+        return '\n'.join(parts)
+
+    def __repr__(self):
+        return 'ExternalSimulator:(command={}, shape={}, protocol={})'.format(
+            ' '.join(self.command), self.shape, self.protocol)
@@ -0,0 +1,81 @@
+from collections import Counter, OrderedDict
+import pandas as pd
+
+
+class ABCFailures:
+    """
+    Records the simulations that were skipped while generating the
+    reference table: simulate or summary functions raising an exception,
+    simulations exceeding their time limit, and blocks whose worker
+    process died. Keeps the number of failures per model and kind, and
+    a few example parameter vectors to reproduce them.
+    """
+
+    # Kinds of failures
+    ERROR = 'error'
+    TIMEOUT = 'timeout'
+    CRASH = 'crash'
+
+    def __init__(self, maxExamples=5):
+        """
+        :param maxExamples: number of example failures to keep
+        """
+        self.maxExamples = maxExamples
+        self.counts = Counter()
+        self.examples = []
+
+    def add(self, modelindex, kind, message, params, count=1):
+        """
+        Record failed simulations.
+        :param modelindex: index of the model
+        :param kind: ERROR, TIMEOUT or CRASH
+        :param message: description of the failure
+        :param params: an example parameter vector
+        :param count: number of failed simulations
+        :return: None
+        """
+        self.counts[(modelindex, kind)] += count
+        if len(self.examples) < self.maxExamples:
+            self.examples.append((modelindex, kind, message, list(params)))
+
+    def merge(self, other, modelindex=None):
+        """
+        Add the failures recorded by another instance (e.g. of a worker).
+        :param other: the ABCFailures to add
+        :param modelindex: index to record all failures under (e.g. when the
+        other instance was recorded for a single model), None to keep the indices
+        :return: None
+        """
+        for (index, kind), count in other.counts.items():
+            self.counts[(index if modelindex is None else modelindex, kind)] += count
+        for index, kind, message, params in other.examples[:self.maxExamples - len(self.examples)]:
+            self.examples.append((index if modelindex is None else modelindex, kind, message, params))
+
+    def __len__(self):
+        """Total number of failed simulations."""
+
+        return sum(self.counts.values())
+
+    def summary(self, modelNames):
+        """
+        Returns the failure counts per model and kind.
+        :param modelNames: list of model names
+        :return: a pandas DataFrame indexed by model name
+        """
+        kinds = (self.ERROR, self.TIMEOUT, self.CRASH)
+        report = OrderedDict((kind, [self.counts[(i, kind)] for i in range(len(modelNames))])
+                             for kind in kinds)
+        return pd.DataFrame(report, index=pd.Index(modelNames, name='Models'))
+
+    def report(self, modelNames):
+        """
+        Returns a printable failure summary with the example parameters.
+        :param modelNames: list of model names
+        :return: a string
+        """
+        lines = ['{} simulations failed and were skipped:'.format(len(self)),
+                 str(self.summary(modelNames)), 'Examples:']
+        for modelindex, kind, message, params in self.examples:
+            lines.append('  {} ({}): {} with parameters {}'.format(
+                modelNames[modelindex], kind, message, params))
+        return '\n'.join(lines)
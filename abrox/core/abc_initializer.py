@@ -1,6 +1,8 @@
+import os
 import pandas as pd
 from itertools import chain
 
+from abrox.core.abc_backend import DEFAULT_ADDRESS, DEFAULT_PRELOAD
 from abrox.core.abc_model import ABCModel
 
 
@@ -52,13 +54,45 @@ class ABCInitializer:
                     'pnames': paramNames,
                     'obj': objective,
                     'nmodels': nModels,
-                    'nsim': reftable['simulations'],
+                    'nsim': reftable.get('simulations'),
                     'extref': reftable['extref'],
+                    'blocksize': reftable.get('blocksize', 500),
+                    'backend': reftable.get('backend', 'processes'),
+                    'jobs': reftable.get('jobs'),
+                    'blasthreads': reftable.get('blasthreads'),
+                    'store': reftable.get('store'),
+                    'inmemory': reftable.get('inmemory', True),
+                    'resume': reftable.get('resume', False),
+                    'extend': reftable.get('extend'),
+                    'seed': reftable.get('seed'),
+                    'cache': self._getCacheDir(reftable.get('cache'), outputdir),
+                    'cachesize': reftable.get('cachesize', 1024),
+                    'rawstore': reftable.get('rawstore'),
+                    'rawcompress': reftable.get('rawcompress', False),
+                    'resummarize': reftable.get('resummarize', False),
+                    'timebudget': reftable.get('timebudget'),
+                    'allocation': reftable.get('allocation', 'equal'),
+                    'timeout': reftable.get('timeout'),
+                    'coordinator': reftable.get('coordinator', DEFAULT_ADDRESS),
+                    'authkey': reftable.get('authkey'),
+                    'preload': tuple(reftable.get('preload', DEFAULT_PRELOAD)),
+                    'profile': reftable.get('profile', False),
+                    'maxruntime': reftable.get('maxruntime'),
+                    'maxmemory': reftable.get('maxmemory'),
                     'outputdir': outputdir
                     }
 
         return settings
 
+    def _getCacheDir(self, cache, outputdir):
+        """
+        Returns the directory of the reference table cache, None if disabled.
+        True places the cache in the output directory.
+        """
+        if cache is True:
+            return os.path.join(outputdir, '.abrox_cache')
+        return cache or None
+
     def getSummaryFunc(self):
         """Returns an instance of summary class."""
         return self.config['summary']
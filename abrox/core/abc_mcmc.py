@@ -1,36 +1,111 @@
+import multiprocessing
 import numpy as np
 import pandas as pd
 
 from abrox.core.abc_utils import euclideanDistance
 from abrox.core.abc_wegmann import Wegmann
 
+# The sampler run by the workers of a pool, installed once per worker
+# so that tasks only carry the starting values and seed of a chain
+_sampler = None
+
+
+def initChains(sampler):
+    """
+    Pool initializer. Stores the sampler in the worker.
+    :param sampler: the MCMC instance
+    :return: None
+    """
+    global _sampler
+    _sampler = sampler
+
+
+def runChain(start, seed):
+    """
+    Run one chain of the sampler of the worker. In a worker process,
+    numpy's global random state (used by the simulate function) is
+    seeded from the stream of the chain as well; threads share it, so
+    it is left alone there.
+    :param start: the starting values of the chain
+    :param seed: seed of the random stream of the chain
+    :return: see MCMC.runChain
+    """
+    rng = np.random.RandomState(seed)
+    if multiprocessing.parent_process() is not None:
+        np.random.seed(rng.randint(np.iinfo(np.int32).max))
+    return _sampler.runChain(start, rng)
+
 
 class MCMC:
     """
     Implements the MCMC sampling algorithm without likelihood.
+    Independent chains (specs 'chains', 1 by default) run in parallel
+    on the workers of the pool.
     """
     #TODO - give reference to paper
 
-    def __init__(self, preprocessor, subset, threshold, settings):
+    def __init__(self, preprocessor, subset, threshold, settings, pool=None):
 
         self._pp = preprocessor
+        self._pool = pool
         self._subset = subset
         self._settings = settings
         self._settings['specs']['threshold'] = threshold
         self._model = self._pp.getFirstModel()
         self._priors = self._model.getPriors()
+        self._summarizer = self._pp.summarizer
+        self._scaler = self._pp.scaler
+        self._scaledSumStatObsData = self._pp.scaledSumStatObsData
+        self._wegmann = None
 
         if settings['specs']['proposal'] is None:
             self._initWegmann()
 
+    def __getstate__(self):
+        """Workers receive the sampler without the preprocessor and the pool."""
+
+        state = self.__dict__.copy()
+        state['_pp'] = None
+        state['_pool'] = None
+        return state
+
     def run(self):
-        """Runs an ABC-MCMC sampling chain."""
+        """Runs the ABC-MCMC sampling chains."""
+
+        chains = self._settings['specs'].get('chains', 1)
+        starts = [self._settings['specs']['start']]
+        starts += [self._getStartingValues() for _ in range(chains - 1)]
+
+        # Every chain draws its proposals from a random stream of its own
+        seeds = np.random.randint(np.iinfo(np.int32).max, size=chains)
+        if chains == 1 or self._pool is None:
+            results = [self.runChain(start, np.random.RandomState(seed))
+                       for start, seed in zip(starts, seeds)]
+        else:
+            tasks = list(zip(starts, seeds))
+            results = self._pool.install(initChains, (self,)).map(runChain, tasks)
+
+        frames = [pd.DataFrame(samples, columns=self._settings['pnames']) for samples, _ in results]
+        df = frames[0] if chains == 1 else pd.concat(frames, keys=range(chains),
+                                                      names=['chain', 'sample'])
+        accepted = sum(accepted for _, accepted in results)
+
+        df.to_csv(self._settings['outputdir'] + '/posteriorSamples_mcmc.csv')
+
+        return df, df.describe(), accepted
+
+    def runChain(self, start, rng):
+        """
+        Runs one ABC-MCMC sampling chain.
+        :param start: the starting values
+        :param rng: the numpy RandomState drawing the proposals and acceptances
+        :return: the samples after burn-in and the number of accepted proposals
+        """
 
         # Extract settings
         chainLength = self._settings['specs']['chl']
         thin = self._settings['specs']['thin']
         burn = self._settings['specs']['burn']
-        start = self._settings['specs']['start']
         accepted = 0
 
         # Pre-initialize an array to hold samples
@@ -38,16 +113,12 @@ class MCMC:
         samples[0, :] = start
 
         for i in range(chainLength-1):
-            start, accept = self._metropolis(start)
+            start, accept = self._metropolis(start, rng)
             accepted += accept
             if i % thin is 0:
                 samples[i+1, :] = start
 
-        df = pd.DataFrame(samples[burn:, :], columns=self._settings['pnames'])
-
-        df.to_csv(self._settings['outputdir'] + '/posteriorSamples_mcmc.csv')
-
-        return df, df.describe(), accepted
+        return samples[burn:, :], accepted
 
     def _initWegmann(self):
         """
@@ -56,16 +127,25 @@ class MCMC:
         :return: None
         """
 
-        wegmann = Wegmann(self._subset, self._settings['pnames'])
-        self._settings['specs']['proposal'] = wegmann.getProposal()
-        self._settings['specs']['start'] = wegmann.getStartingValues()
+        self._wegmann = Wegmann(self._subset, self._settings['pnames'])
+        self._settings['specs']['proposal'] = self._wegmann.getProposal()
+        self._settings['specs']['start'] = self._wegmann.getStartingValues()
+
+    def _getStartingValues(self):
+        """
+        Starting values of a further chain: a new random row of the
+        subset if they were determined by Wegmann, the given ones otherwise.
+        """
+        if self._wegmann is None:
+            return self._settings['specs']['start']
+        return self._wegmann.getStartingValues()
 
-    def _metropolis(self, old):
+    def _metropolis(self, old, rng):
         """Implements a single step of the metropolis algorithm."""
 
-        new = old + self._propose()
+        new = old + self._propose(rng)
         accProb = np.min([self._density(new) / self._density(old), 1])
-        u = np.random.uniform()
+        u = rng.uniform()
 
         cnt = 0
         if self._distance(new) and u < accProb:
@@ -91,11 +171,11 @@ class MCMC:
         except ValueError:
             return False
 
-        sumStat = self._pp.summarizer.summarize(simulation)
-        scaledSumStat = self._pp.scaler.transform(sumStat)
+        sumStat = self._summarizer.summarize(simulation)
+        scaledSumStat = self._scaler.transform(sumStat)
 
         # Decide whether to accept sample or not
-        dist = euclideanDistance(self._pp.scaledSumStatObsData, scaledSumStat, axis=0)
+        dist = euclideanDistance(self._scaledSumStatObsData, scaledSumStat, axis=0)
         accepted = dist < self._settings['specs']['threshold']
         return accepted
 
@@ -112,15 +192,16 @@ class MCMC:
                 density += dist.logpdf(value[i])
         return density
 
-    def _propose(self):
+    def _propose(self, rng):
         """
         Generate proposed values according to proposal distributions
+        :param rng: the numpy RandomState of the chain
         :return: Proposed values
         """
 
         proposedValue = []
         for paramName, proposal in self._settings['specs']['proposal'].items():
-            proposedValue.append(proposal.rvs())
+            proposedValue.append(proposal.rvs(random_state=rng))
         return np.array(proposedValue)
 
     def _listToDict(self, paramList):
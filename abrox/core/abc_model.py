@@ -1,20 +1,40 @@
 from collections import OrderedDict
+import asyncio
+import inspect
+import numpy as np
 import sys
 
+from abrox.core.abc_cache import codeFingerprint, priorFingerprint
+from abrox.core.abc_external import ABCExternalSimulator
+
 class ABCModel:
     """Defines a model in a format suitable for ABC."""
 
-    def __init__(self, name, priors, simulate):
+    def __init__(self, name, priors, simulate=None, simulate_batch=None, external=None):
         """
         Constructor requires following information:
         :param name: string - the internal name of the model
         :param prior: list - a list of dicts containing {priorName: stats.[dist]}
         :param simulate: function - the simulate function defined by the user
+        :param simulate_batch: function - optional vectorized simulate function, receives
+        a parameter matrix (#rows, #parameters) and returns the stacked datasets
+        :param external: dict - instead of simulate, the arguments of an ABCExternalSimulator
+        (command, shape, protocol, cwd) simulating with a persistent external program
         """
         self.name = name
         self.currentParam = OrderedDict()
         self._priors = priors
+        self._external = None
+        if external is not None:
+            self._external = ABCExternalSimulator(**external)
+            simulate, simulate_batch = self._external.simulate, self._external.simulateBatch
         self._simulateFunc = simulate
+        self._simulateBatchFunc = simulate_batch
+
+        # Flatten the list of prior dicts once, so that batch
+        # sampling does not have to walk the nested structure
+        self.paramNames = [name for priorDict in priors for name in priorDict.keys()]
+        self._dists = [dist for priorDict in priors for dist in priorDict.values()]
 
     def drawParameter(self):
         """Draw a value from each prior distribution"""
@@ -23,6 +43,29 @@ class ABCModel:
                 self.currentParam[name] = dist.rvs()
         return self.currentParam
 
+    def drawParameters(self, n, random_state=None):
+        """
+        Draw n values from each prior distribution at once.
+        :param n: int - the number of parameter vectors to draw
+        :param random_state: a numpy RandomState to draw from, None for the
+        random state of the distributions (a frozen distribution keeps its own
+        copy of it once pickled, e.g. when sent to a worker process)
+        :return: a numpy array of shape (n, #parameters)
+        """
+        params = np.empty((n, len(self._dists)))
+        for j, dist in enumerate(self._dists):
+            params[:, j] = dist.rvs(size=n, random_state=random_state)
+        return params
+
+    def toParamDict(self, paramRow):
+        """
+        Convert a row of a parameter block to the dictionary
+        expected by the user-defined simulate function.
+        :param paramRow: a one-dimensional array of parameter values
+        :return: an OrderedDict with parameter-names : parameter-values
+        """
+        return OrderedDict(zip(self.paramNames, paramRow))
+
     def getPriors(self):
         """Returns the list with model priors."""
 
@@ -31,11 +74,58 @@ class ABCModel:
     def simulate(self, param):
         """
         Simulate data from user-defined simulate function.
+        An async simulate function is run to completion.
         :param param: a dictionary with parameter-names : parameter-values
         :return: the output ot the simulate function
         """
+        if self.isAsync():
+            return asyncio.run(self._simulateFunc(param))
         return self._simulateFunc(param)
 
+    def isAsync(self):
+        """Returns True if the user-defined simulate function is a coroutine function."""
+
+        return inspect.iscoroutinefunction(self._simulateFunc)
+
+    async def simulateAsync(self, param):
+        """
+        Simulate data from an event loop. Plain simulate functions
+        are run in a thread, so they do not block the loop.
+        :param param: a dictionary with parameter-names : parameter-values
+        :return: the output ot the simulate function
+        """
+        if self.isAsync():
+            return await self._simulateFunc(param)
+        return await asyncio.to_thread(self._simulateFunc, param)
+
+    def hasBatchSimulate(self):
+        """Returns True if the user provided a vectorized simulate function."""
+
+        return self._simulateBatchFunc is not None
+
+    def simulateBatch(self, params):
+        """
+        Simulate one dataset per row of a parameter block. Uses the
+        user-defined simulate_batch function if available, otherwise
+        falls back to calling simulate once per row.
+        :param params: a numpy array of shape (#rows, #parameters)
+        :return: a numpy array of stacked datasets with #rows as first dimension
+        """
+        if self.hasBatchSimulate():
+            return np.asarray(self._simulateBatchFunc(params))
+        return np.stack([self.simulate(self.toParamDict(paramRow)) for paramRow in params])
+
+    def fingerprint(self):
+        """
+        Returns a text uniquely describing what the model simulates
+        (simulate code and priors), used for caching.
+        """
+        if self._external is not None:
+            return '\n'.join((self._external.fingerprint(), priorFingerprint(self._priors)))
+        return '\n'.join((codeFingerprint(self._simulateFunc),
+                          codeFingerprint(self._simulateBatchFunc),
+                          priorFingerprint(self._priors)))
+
     def __repr__(self):
         """Provides a nice representation of the user defined model."""
 
@@ -2,7 +2,7 @@ import numpy as np
 from keras.models import Sequential
 from keras.layers import Dense
 from sklearn.neural_network import MLPClassifier
-from abrox.core.abc_utils import toArray, cross_val
+from abrox.core.abc_utils import cross_val
 
 
 class ABCNeuralNet:
@@ -17,8 +17,8 @@ class ABCNeuralNet:
         """Runs according to settings (these must be specified by user.)"""
 
         # Extract sum stats and model indices from ref table
-        indices = toArray(self._refTable, 'idx').flatten()
-        sumStat = toArray(self._refTable, 'sumstat')
+        indices = self._refTable.idx
+        sumStat = self._refTable.sumstat
 
         print(sumStat.shape)
 
@@ -1,105 +1,549 @@
-from multiprocessing import Pool
+from collections import Counter
+from contextlib import nullcontext
+from functools import partial
+import os
 import numpy as np
-import itertools
+import pandas as pd
 
 
+from abrox.core.abc_backend import imapUnordered, TaskFailure, WorkerPool, workerCount
+from abrox.core.abc_failures import ABCFailures
 from abrox.core.abc_utils import euclideanDistance
 from abrox.core.abc_reference_table import RefTable
 from abrox.core.abc_scale import ABCScaler
+from abrox.core.abc_scheduler import ABCScheduler
+from abrox.core.abc_shared import ABCTableBuffer
+from abrox.core.abc_store import ABCCheckpoint, ABCMemoryWriter, ABCTableStore
+from abrox.core.abc_threads import ABCThreadBudget
+from abrox.core.abc_worker import drawTaskParameters, initWorker, resummarizeBlock, simulateBlock, simulateBlockAsync
 
 
 class ABCPreProcessor:
 
-    def __init__(self, model, summarizer, sumStatObsData):
+    # Share of the simulations per model run as a pilot before the
+    # remaining simulations are allocated adaptively
+    pilotFraction = 0.1
+
+    # Rows scaled at once when the table is memory-mapped
+    scaleBlockRows = 100000
+
+    # Seconds a block may take beyond the time limit of its simulations
+    # before its worker is considered hung and replaced
+    timeoutGrace = 10.0
+
+    def __init__(self, model, summarizer, sumStatObsData, rawStore=None, timeout=None,
+                 coordinator=None, pool=None):
 
         # Private attributes
         self._models = model
-        self._refTableWrapper = RefTable()
+        self._refTable = RefTable()
 
         # Public attributes
         self.summarizer = summarizer
         self.scaler = ABCScaler()
         self.sumStatObsData = sumStatObsData
         self.scaledSumStatObsData = None
+        self.rawStore = rawStore
+        self.timeout = timeout
+        self.coordinator = coordinator
+        self.pool = pool
+        self.failures = ABCFailures()
+        self.costs = None
 
-    def _generateSample(self, _, modelindex):
+    def getFirstModel(self):
         """
-        Run one simulation.
-        1. Draw parameter from model
-        2. Simulate data
-        3. Compute summary statistics
-        4. Add row to reference Table
+        Get first model from list of models. This is
+        necessary for parameter inference via MCMC.
         """
-        param = self._models[modelindex].drawParameter()
-        simdata = self._models[modelindex].simulate(param)
-        sumstat = self.summarizer.summary(simdata)
-        return modelindex, list(param.values()), sumstat, -1
 
-    def _generateArgs(self, simulations, nModels):
+        return self._models[0]
+
+    def _assignSlots(self, tasks, freeSlots, blockSize, buffer):
         """
-        Generate argument list.
-        :param simulations:
-        :param nModels:
-        :return:
+        Attach a free slot of the table buffer to each task.
+        :param tasks: a generator of (modelindex, count, seed) tuples
+        :param freeSlots: list of free slot numbers, refilled by the caller
+        :param blockSize: number of rows per slot
+        :param buffer: the ABCTableBuffer, whose progress is reset per slot
+        :return: a generator of (modelindex, offset, count, seed) tuples
         """
-        iterations = np.tile(np.arange(simulations), nModels)
-        modelindices = np.repeat(np.arange(nModels), simulations)
-        return list(zip(iterations, modelindices))
+        for modelindex, count, seed in tasks:
+            offset = freeSlots.pop() * blockSize
+            buffer.progress[offset] = np.nan
+            yield modelindex, offset, count, seed
 
-    def getFirstModel(self):
+    @staticmethod
+    def _taskRows(task):
+        """Rows of its block a task simulates, as (start, stop)."""
+
+        return (task[4], task[5]) if len(task) > 4 else (0, task[2])
+
+    def _taskStarted(self, buffer, task):
+        """Time a worker started a task, read from the table buffer (NaN before)."""
+
+        return buffer.started[task[1] + self._taskRows(task)[0]]
+
+    def _splitTask(self, buffer, parts, task):
         """
-        Get first model from list of models. This is
-        necessary for parameter inference via MCMC.
+        Split a task lost with its worker around the row the worker was
+        simulating, read from the progress column of the table buffer, so
+        that a simulation killing its worker costs only its own row.
+        :param buffer: the ABCTableBuffer
+        :param parts: Counter of the extra tasks in flight per slot, so
+        that a slot is only freed when all parts of its block are done
+        :param task: the lost task
+        :return: the single-row task of the busy row (None if unknown) and
+        the tasks of the remaining rows (see imapUnordered)
         """
+        modelindex, offset, count, seed = task[:4]
+        start, stop = self._taskRows(task)
+        row = buffer.progress[offset + start]
 
-        return self._models[0]
+        if np.isnan(row):
+            # The task had not started yet
+            return None, [task]
+        if row < 0:
+            # A batch was running: rerun its rows one by one
+            busy, rest = None, [(start, stop)]
+        else:
+            row = int(row)
+            busy, rest = (row, row + 1), [(start, row), (row + 1, stop)]
+
+        newTasks = [(modelindex, offset, count, seed, first, last)
+                    for first, last in ([busy] if busy else []) + rest if last > first]
+        for newTask in newTasks:
+            buffer.progress[offset + newTask[4]] = np.nan
+        parts[offset] += len(newTasks) - 1
+        if busy is None:
+            return None, newTasks
+        return newTasks[0], newTasks[1:]
+
+    def _collect(self, results, scheduler, buffer, freeSlots, writer, blockSize, parts):
+        """
+        Move completed blocks from the table buffer to the writer,
+        record failed simulations and report the cost of the blocks
+        to the scheduler.
+        :return: None
+        """
+        for task, result in results:
+            modelindex, offset, taskCount, seed = task[:4]
+            start, stop = self._taskRows(task)
+            if parts[offset]:
+                parts[offset] -= 1
+            else:
+                freeSlots.append(offset // blockSize)
+            if isinstance(result, TaskFailure):
+                # The rows were lost with their worker
+                self.failures.add(modelindex, result.kind, result.message,
+                                  self._taskParams(modelindex, seed, taskCount)[start], stop - start)
+                continue
+
+            count, elapsed, rawName, failures = result
+            if count > 0:
+                params, sumstats = buffer.read(offset + start, count)
+                writer.append(modelindex, params, sumstats)
+                if rawName is not None:
+                    self.rawStore.append(modelindex, rawName, count)
+            self.failures.merge(failures)
+            scheduler.update(modelindex, count, elapsed, stop - start - count)
 
-    def fillTable(self, simulations, parallel, jobs):
+    def _taskParams(self, modelindex, seed, count=1):
+        """
+        Redraw the parameters of a task, e.g. to report a lost block.
+        :return: parameter block of shape (count, #parameters)
+        """
+        return drawTaskParameters(self._models[modelindex], modelindex, count, seed)[0]
+
+    def _jobs(self, backend, jobs):
+        """Number of workers of a backend, None for the default (or the connected workers)."""
+
+        if backend == 'cluster':
+            return jobs or self.coordinator.waitForWorkers()
+        return workerCount(backend, jobs)
+
+    def _executor(self, backend, jobs, buffer, initargs):
+        """
+        Returns the executor of a stage as context manager: a session of
+        the coordinator, the (warm) pool shared by the stages of the run,
+        or a pool of its own if there is no shared pool for the backend.
+        """
+        if backend == 'cluster':
+            return self.coordinator.session(self._models, buffer)
+        if self.pool is not None and (self.pool.backend, self.pool.jobs) == (backend, jobs):
+            return nullcontext(self.pool.install(initWorker, initargs))
+        return WorkerPool(backend, jobs).install(initWorker, initargs)
+
+    def _nColumns(self):
+        """Number of parameter and summary statistic columns of the table."""
+
+        return max(len(model.paramNames) for model in self._models), len(self.sumStatObsData)
+
+    def fillTable(self, simulations, backend, jobs, blockSize=500, blasThreads=None,
+                  store=None, inMemory=True, resume=False, seed=None, timeBudget=None,
+                  allocation='equal', keep=None):
         """
         Run (summarize(simulate()) #simulation
         and store results in ABC table. Return summary statistics
-        for scaling as numpy array.
+        for scaling as numpy array. Completed blocks are kept in
+        memory or streamed to an on-disk store as they arrive.
+        When resuming, the blocks already in the store are kept and
+        only the missing simulations per model are run. With a time
+        budget, the models are simulated in balanced blocks until it
+        expires (simulations only caps the rows per model). With
+        adaptive allocation, simulations is the maximum number of rows
+        per model, the actual number depends on the cost and acceptance
+        rate of each model in a pilot run (keep is the number of rows
+        the algorithm will accept, None for 1% of the table).
         """
 
-        args = self._generateArgs(simulations, len(self._models))
-        with Pool(jobs) as pool:
+        if (resume or not inMemory) and store is None:
+            raise ValueError('Provide a store when resuming or when the reference table '
+                             'is not kept in memory.')
+
+        nParams, nStats = self._nColumns()
 
-            Starmap = pool.starmap if parallel else itertools.starmap
-            out = Starmap(self._generateSample, args) if parallel else list(Starmap(self._generateSample, args))
+        # Completed blocks go to the store (with a checkpoint of the
+        # task seeds) if one is given, otherwise they are kept in memory
+        if store is None:
+            writer, checkpoint, done = ABCMemoryWriter(), ABCCheckpoint(baseSeed=seed), None
+        elif resume:
+            writer = ABCTableStore(store, nParams, nStats, mode='a')
+            checkpoint = ABCCheckpoint.load(store, seed)
+            done = writer.modelCounts(len(self._models))
+        else:
+            writer = ABCTableStore(store, nParams, nStats, mode='w')
+            checkpoint, done = ABCCheckpoint(store, seed), None
 
-        self._refTableWrapper.initialize(out)
+        if self.rawStore is not None and not resume:
+            self.rawStore.clear()
+        self.failures = ABCFailures()
 
-        return self._refTableWrapper.getColumn('sumstat')
+        # Tasks only carry a model index, a row offset, a count and a
+        # seed; the scheduler sizes them from the observed model costs
+        jobs = self._jobs(backend, jobs)
+        adaptive = allocation == 'adaptive'
+        targets = max(int(np.ceil(self.pilotFraction * simulations)), 1) if adaptive else simulations
+        scheduler = ABCScheduler(self._models, targets, jobs, blockSize,
+                                 checkpoint.nextSeed, done, timeBudget)
 
-    def preprocess(self, simulations, parallel=True, jobs=2):
+        try:
+            self._generate(scheduler, backend, jobs, blockSize, blasThreads, writer)
+            if adaptive:
+                keep = 0.01 * simulations * len(self._models) if keep is None else keep
+                scheduler.setTargets(self._allocate(writer.load(), simulations, keep,
+                                                    scheduler.costPerSimulation()))
+                self._generate(scheduler, backend, jobs, blockSize, blasThreads, writer)
+        finally:
+            writer.close()
+
+        self.costs = scheduler.costs()
+        self._checkFailures(writer.modelCounts(len(self._models)))
+        self._refTable = writer.load() if store is None else writer.load(mmap=not inMemory)
+
+        return self._refTable.getColumn('sumstat')
+
+    def fillTableCached(self, cache, simulations, backend, jobs, blockSize=500,
+                        blasThreads=None, seed=None):
+        """
+        Fill the ABC table from the per-model entries of a cache. Only
+        models without a complete entry are simulated (incomplete entries
+        are resumed), the others are read back and concatenated in memory.
+        Return the unscaled summary statistics as numpy array.
+        """
+
+        nParams, _ = self._nColumns()
+        tables, costs, keys = [], [], []
+        self.failures = ABCFailures()
+
+        for modelindex, model in enumerate(self._models):
+            key = cache.key(model, self.summarizer, simulations, seed)
+            part = ABCPreProcessor([model], self.summarizer, self.sumStatObsData,
+                                   timeout=self.timeout, coordinator=self.coordinator,
+                                   pool=self.pool)
+            part.fillTable(simulations, backend, jobs, blockSize, blasThreads,
+                           store=cache.entry(key), resume=True, seed=cache.seed(key, seed))
+            tables.append(part._refTable)
+            costs.append(part.costs)
+            keys.append(key)
+            self.failures.merge(part.failures, modelindex)
+
+        # Model indices and parameter columns depend on the other
+        # models of the run, so they are fixed up when concatenating
+        self._refTable = RefTable()
+        self._refTable.initialize(
+            np.concatenate([np.full(len(table), i) for i, table in enumerate(tables)]),
+            np.concatenate([np.pad(table.param, ((0, 0), (0, nParams - table.param.shape[1])),
+                                   constant_values=np.nan) for table in tables]),
+            np.concatenate([table.sumstat for table in tables]))
+        self.costs = pd.concat(costs)
+
+        cache.evict(keep=keys)
+
+        return self._refTable.getColumn('sumstat')
+
+    def _checkFailures(self, counts):
+        """
+        Raise an error if a model has no rows because all its simulations failed.
+        :param counts: number of rows per model
+        :return: None
+        """
+        names = [model.name for model in self._models]
+        if len(self.failures) and np.any(counts == 0):
+            raise RuntimeError('All simulations of model(s) {} failed. '.format(
+                ', '.join(name for name, count in zip(names, counts) if count == 0)) +
+                self.failures.report(names))
+
+    def _allocate(self, table, simulations, keep, costs):
+        """
+        Number of rows per model for adaptive allocation. The pilot table
+        is scaled and rejected as the final table would be, which gives
+        the acceptance rate p of each model. Rows are then allocated as
+        n ~ sqrt(p (1 - p) / cost) (Neyman allocation), which minimizes the
+        variance of the estimated acceptance rates, and therefore of the
+        posterior model probabilities, for a given amount of CPU time.
+        :param table: the unscaled pilot table
+        :param simulations: maximum number of rows per model
+        :param keep: number of rows the algorithm will accept from the full table
+        :param costs: seconds per simulation of each model
+        :return: an integer array with the number of rows per model
+        """
+        nModels = len(self._models)
+        counts = np.bincount(table.idx, minlength=nModels)
+
+        scaler = ABCScaler()
+        distance = euclideanDistance(scaler.fit_transform(table.sumstat),
+                                     scaler.transform(self.sumStatObsData))
+        nAccept = int(np.clip(round(keep / (simulations * nModels) * len(table)), 10, len(table)))
+        accepted = np.bincount(table.idx[np.argsort(distance)[:nAccept]], minlength=nModels)
+
+        rates = (accepted + 0.5) / (counts + 1)
+        weights = np.sqrt(rates * (1 - rates) / np.maximum(costs, 1e-9))
+        return np.maximum(counts, np.ceil(simulations * weights / weights.max())).astype(np.int64)
+
+    def _generate(self, scheduler, backend, jobs, blockSize, blasThreads, writer):
+        """
+        Simulate the tasks of the scheduler and pass the completed
+        blocks to the writer.
+        :param scheduler: the ABCScheduler producing the tasks
+        :param backend: 'serial', 'threads', 'processes', 'asyncio' or 'cluster'
+        :param jobs: number of workers
+        :param blockSize: maximum number of simulations per task
+        :param blasThreads: BLAS threads per worker, None to split the cores evenly
+        :param writer: an ABCMemoryWriter or ABCTableStore
+        :return: None
+        """
+
+        if scheduler.finished():
+            # Nothing left to simulate (e.g. a complete store was resumed)
+            return
+
+        nParams, nStats = self._nColumns()
+
+        # Workers write parameters and summary statistics straight into
+        # a preallocated (shared) buffer with one slot per task in flight
+        window = 2 * jobs
+        buffer = ABCTableBuffer(window * blockSize, nParams, nStats,
+                                shared=backend == 'processes')
+        freeSlots, parts = list(range(window)), Counter()
+
+        # Split cores between workers and their BLAS threads. Worker
+        # processes apply the limit themselves, in-process backends
+        # limit the current process for the duration of the run.
+        # Remote workers split the cores of their own machine
+        budget = ABCThreadBudget(backend, jobs, blasThreads)
+        inProcess = backend in ('serial', 'threads', 'asyncio')
+        initargs = (self._models, self.summarizer, buffer,
+                    None if inProcess else budget.blasThreads, self.rawStore, self.timeout)
+
+        # The event loop of the asyncio backend awaits the simulations
+        simulate = simulateBlockAsync if backend == 'asyncio' else simulateBlock
+
+        # Blocks whose worker hangs well beyond the time limit of their
+        # simulations are given up and the worker is replaced
+        def timeout(task):
+            start, stop = self._taskRows(task)
+            return (stop - start) * self.timeout + self.timeoutGrace
+
+        try:
+            with budget if inProcess else nullcontext(), \
+                    self._executor(backend, jobs, buffer, initargs) as executor:
+                # Keep a couple of tasks per worker in flight
+                tasks = self._assignSlots(scheduler.tasks(), freeSlots, blockSize, buffer)
+                results = imapUnordered(executor, simulate, tasks, window,
+                                        timeout if self.timeout is not None else None,
+                                        partial(self._splitTask, buffer, parts),
+                                        partial(self._taskStarted, buffer))
+                self._collect(results, scheduler, buffer, freeSlots, writer, blockSize, parts)
+        finally:
+            buffer.release()
+
+    def preprocess(self, simulations, backend='processes', jobs=None, blockSize=500,
+                   blasThreads=None, store=None, inMemory=True, resume=False, seed=None,
+                   cache=None, timeBudget=None, allocation='equal', keep=None):
         """
         Generate the complete ABC reference table.
         :param sumStatObsData: summary statistics of observed data
-        :param simulations: number of rows in the table
-        :param parallel: boolean flag
-        :param jobs: number of jobs if parallel
+        :param simulations: number of rows per model, with a time budget the
+        maximum number of rows per model (None for no maximum)
+        :param backend: 'serial', 'threads', 'processes', 'asyncio' or 'cluster'
+        :param jobs: number of workers, None for all available CPUs
+        :param blockSize: maximum number of simulations per task
+        :param blasThreads: BLAS threads per worker, None to split the cores evenly
+        :param store: directory to stream the unscaled table to, None for no store
+        :param inMemory: boolean flag - keep the table in memory, otherwise
+        it is memory-mapped from the store after generation
+        :param resume: boolean flag - continue the table in the store up to
+        simulations rows per model instead of starting over
+        :param seed: base seed of the simulations, None to draw one
+        :param cache: an ABCTableCache to reuse and store the rows of each model, None for no cache
+        :param timeBudget: wall-clock seconds to simulate for, None to run all simulations
+        :param allocation: 'equal' rows per model, or 'adaptive' to allocate up to
+        simulations rows per model by cost and acceptance rate in a pilot run
+        :param keep: number of rows the algorithm will accept, used by adaptive allocation
         :return: None
         """
 
         # Pre-fill table and return unscaled summary statistics
-        sumStatTable = self.fillTable(simulations, parallel, jobs)
+        if cache is not None:
+            sumStatTable = self.fillTableCached(cache, simulations, backend, jobs, blockSize,
+                                                blasThreads, seed)
+        else:
+            sumStatTable = self.fillTable(simulations, backend, jobs, blockSize, blasThreads,
+                                          store, inMemory, resume, seed, timeBudget,
+                                          allocation, keep)
 
-        # Scale summary statistics and store MAD
-        scaledSumStatTable = self.scaler.fit_transform(sumStatTable)
+        return self._scaleAndMeasure(sumStatTable)
 
-        # Override unscaled with scaled summary statistics
-        self._refTableWrapper.fillColumn(scaledSumStatTable, 'sumstat')
+    def resummarize(self, backend='processes', jobs=None, blasThreads=None):
+        """
+        Rebuild the reference table from the datasets in the raw store,
+        computing the summary statistics with the current summarizer.
+        Nothing is simulated; the blocks are summarized in parallel.
+        :param backend: 'serial', 'threads', 'processes' or 'asyncio'
+        :param jobs: number of workers, None for all available CPUs
+        :param blasThreads: BLAS threads per worker, None to split the cores evenly
+        :return: the reference table
+        """
+
+        blocks = self.rawStore.blocks()
+        if not blocks:
+            raise ValueError('The raw store at {} holds no simulations.'.format(self.rawStore.path))
+
+        jobs = self._jobs(backend, jobs)
+        budget = ABCThreadBudget(backend, jobs, blasThreads)
+        inProcess = backend != 'processes'
+        initargs = (self._models, self.summarizer, None,
+                    None if inProcess else budget.blasThreads, self.rawStore)
+
+        with budget if inProcess else nullcontext(), \
+                self._executor(backend, jobs, None, initargs) as executor:
+            tasks = [(name,) for _, name, _ in blocks]
+            sumstats = dict(imapUnordered(executor, resummarizeBlock, tasks, 2 * jobs))
+
+        nParams, _ = self._nColumns()
+        params = [self.rawStore.load(name)[0] for _, name, _ in blocks]
+        self._refTable = RefTable()
+        self._refTable.initialize(
+            np.concatenate([np.full(count, modelindex) for modelindex, _, count in blocks]),
+            np.concatenate([np.pad(block, ((0, 0), (0, nParams - block.shape[1])),
+                                   constant_values=np.nan) for block in params]),
+            np.concatenate([sumstats[(name,)] for _, name, _ in blocks]))
+
+        return self._scaleAndMeasure(self._refTable.getColumn('sumstat'))
+
+    def extend(self, simulations, refTable=None, backend='processes', jobs=None,
+               blockSize=500, blasThreads=None, store=None, inMemory=True):
+        """
+        Append new rows to an existing reference table, refit the scaling
+        and recompute all distances. Only the new rows are simulated.
+        :param simulations: number of new rows per model
+        :param refTable: a RefTable with unscaled summary statistics (e.g. read
+        from an external file), None to extend the table of the last preprocess run
+        :param backend: 'serial', 'threads', 'processes', 'asyncio' or 'cluster'
+        :param jobs: number of workers, None for all available CPUs
+        :param blockSize: maximum number of simulations per task
+        :param blasThreads: BLAS threads per worker, None to split the cores evenly
+        :param store: directory of the store holding the table to extend, None
+        to extend the table in memory
+        :param inMemory: boolean flag - keep the table in memory, otherwise
+        it is memory-mapped from the store after generation
+        :return: the extended RefTable
+        """
+
+        # A store already holds the unscaled table, so new rows are simply appended to it
+        if store is not None:
+            counts = ABCTableStore(store).modelCounts(len(self._models))
+            sumStatTable = self.fillTable(counts + simulations, backend, jobs, blockSize,
+                                          blasThreads, store, inMemory, resume=True)
+            return self._scaleAndMeasure(sumStatTable)
 
-        # Scale observed summary statistics with MAD calculated above
+        if refTable is None:
+            # Undo the scaling of the last run
+            refTable = self._refTable
+            sumStatTable = refTable.sumstat * self.scaler.mad
+        else:
+            sumStatTable = refTable.sumstat
+
+        if refTable.param.shape[1] != self._nColumns()[0]:
+            raise ValueError('The reference table to extend has {} parameter columns, but the '
+                             'models have {}.'.format(refTable.param.shape[1], self._nColumns()[0]))
+
+        writer = ABCMemoryWriter()
+        writer.append(refTable.idx, refTable.param, sumStatTable)
+        self.failures = ABCFailures()
+        jobs = self._jobs(backend, jobs)
+        scheduler = ABCScheduler(self._models, simulations, jobs, blockSize, ABCCheckpoint().nextSeed)
+        self._generate(scheduler, backend, jobs, blockSize, blasThreads, writer)
+
+        self.costs = scheduler.costs()
+        self._refTable = writer.load()
+        return self._scaleAndMeasure(self._refTable.getColumn('sumstat'))
+
+    def _scaleAndMeasure(self, sumStatTable):
+        """
+        Scale the summary statistics of the table and the observed data
+        by their MAD and compute the distances. A table memory-mapped
+        from a store is scaled block by block into files of the store,
+        so that it never has to fit into memory.
+        :param sumStatTable: the unscaled summary statistics of the table
+        :return: the reference table
+        """
+
+        # Compute the MAD (one column at a time) and scale the observed
+        # summary statistics with it
+        self.scaler.scale(sumStatTable)
         self.scaledSumStatObsData = self.scaler.transform(self.sumStatObsData)
 
-        # Compute distance
-        distance = euclideanDistance(scaledSumStatTable, self.scaledSumStatObsData)
+        # Scale summary statistics and compute distances
+        if isinstance(sumStatTable, np.memmap):
+            scaledSumStatTable, distance = self._scaleBlockwise(sumStatTable)
+        else:
+            scaledSumStatTable = self.scaler.transform(sumStatTable)
+            distance = euclideanDistance(scaledSumStatTable, self.scaledSumStatObsData)
+
+        # Override unscaled with scaled summary statistics and store distance in table
+        self._refTable.fillColumn(scaledSumStatTable, 'sumstat')
+        self._refTable.fillColumn(distance, 'distance')
 
-        # Store distance in table
-        self._refTableWrapper.fillColumn(distance, 'distance')
+        return self._refTable.getRefTable()
 
-        return self._refTableWrapper.getRefTable()
+    def _scaleBlockwise(self, sumStatTable):
+        """
+        Write the scaled summary statistics and distances of a table
+        memory-mapped from a store into memory-mapped files of the store.
+        :param sumStatTable: the memory-mapped unscaled summary statistics
+        :return: the memory-mapped scaled summary statistics and distances
+        """
+        store = ABCTableStore(os.path.dirname(sumStatTable.filename))
+        scaled = store.derivedColumn('scaled', sumStatTable.shape)
+        distance = store.derivedColumn('distance', sumStatTable.shape[:1])
+        for start in range(0, sumStatTable.shape[0], self.scaleBlockRows):
+            stop = start + self.scaleBlockRows
+            scaled[start:stop] = self.scaler.transform(sumStatTable[start:stop])
+            distance[start:stop] = euclideanDistance(scaled[start:stop], self.scaledSumStatObsData)
+        scaled.flush()
+        distance.flush()
+        return scaled, distance
 
 
 
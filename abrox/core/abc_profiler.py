@@ -0,0 +1,194 @@
+from collections import OrderedDict
+import time
+import numpy as np
+import pandas as pd
+
+from abrox.core.abc_backend import availableCpus, workerCount
+from abrox.core.abc_scale import ABCScaler
+from abrox.core.abc_utils import euclideanDistance
+from abrox.core.abc_worker import timeLimit
+
+
+class ABCProfiler:
+    """
+    Pre-flight calibration of a run. Times the simulate function of each
+    model, the summary function and the distance on a few hundred prior
+    draws, and predicts from these timings the runtime and memory of the
+    reference table and the number of workers and block size suiting
+    the simulators. The calibration runs in the calling process and
+    leaves numpy's global random state unchanged.
+    """
+
+    # Workers are only worth starting for at least this much work each
+    minWorkerSeconds = 1.0
+    # Duration of a task, long enough for its overhead to be negligible,
+    # and number of tasks per worker, so that the blocks balance the load
+    taskSeconds = 0.25
+    tasksPerWorker = 4
+    maxBlockSize = 10000
+    # Floor of the predicted seconds per row, for vectorized models too
+    # cheap to time
+    minRowSeconds = 1e-9
+
+    def __init__(self, models, summarizer, sumStatObsData, draws=200, maxSeconds=5.0, timeout=None):
+        """
+        :param models: list of ABCModel instances
+        :param summarizer: the ABCSummary instance
+        :param sumStatObsData: summary statistics of the observed data
+        :param draws: number of prior draws per model
+        :param maxSeconds: time after which the calibration of a model stops early
+        :param timeout: time limit of one simulation in seconds, None for no limit
+        """
+        self._models = models
+        self.summarizer = summarizer
+        self.sumStatObsData = np.asarray(sumStatObsData)
+        self.draws = draws
+        self.maxSeconds = maxSeconds
+        self.timeout = timeout
+        self.costs = None
+        self.distanceCost = None
+        self._rowCosts = None
+
+    def calibrate(self):
+        """
+        Time the simulations of each model, their summary statistics and
+        the distances of the summary statistics to the observed ones.
+        :return: a pandas DataFrame with the costs per model
+        """
+        state = np.random.get_state()
+        try:
+            results = [self._calibrateModel(model) for model in self._models]
+        finally:
+            np.random.set_state(state)
+        draws, failed, simCost, sumCost, nbytes, sumstats = zip(*results)
+
+        sumstats = [stats for stats in sumstats if len(stats)]
+        self.distanceCost = self._timeDistance(np.concatenate(sumstats)) if sumstats else np.nan
+        # The report is rounded, predictions use the exact seconds per row
+        self._rowCosts = np.array(simCost) + np.array(sumCost)
+
+        report = OrderedDict([
+            ('draws', draws),
+            ('failed', failed),
+            ('ms/simulate', np.round(1000 * np.array(simCost), 4)),
+            ('ms/summary', np.round(1000 * np.array(sumCost), 4)),
+            ('kB/dataset', np.round(np.array(nbytes) / 1024, 1))
+        ])
+        self.costs = pd.DataFrame(report, index=pd.Index([model.name for model in self._models],
+                                                         name='Models'))
+        return self.costs
+
+    def _calibrateModel(self, model):
+        """
+        Simulate and summarize prior draws of a model (in one batch if the
+        model is vectorized) until all are done or the time is up.
+        :return: the number of draws, the number of failed draws, the seconds
+        per simulation and per summary, the bytes per dataset and the summary
+        statistics of the successful draws
+        """
+        params = model.drawParameters(self.draws)
+        if model.hasBatchSimulate():
+            start = time.perf_counter()
+            simdata = model.simulateBatch(params)
+            simulated = time.perf_counter()
+            sumstats = self.summarizer.summarizeBatch(simdata)
+            n = params.shape[0]
+            return (n, 0, (simulated - start) / n, (time.perf_counter() - simulated) / n,
+                    simdata.nbytes / n, sumstats)
+
+        simTime = sumTime = nbytes = 0.0
+        sumstats, draws = [], 0
+        start = time.perf_counter()
+        for paramRow in params:
+            if time.perf_counter() - start > self.maxSeconds:
+                break
+            draws += 1
+            try:
+                with timeLimit(self.timeout):
+                    begin = time.perf_counter()
+                    simdata = model.simulate(model.toParamDict(paramRow))
+                    simulated = time.perf_counter()
+                    sumstat = self.summarizer.summarize(simdata)
+                    summarized = time.perf_counter()
+            except Exception:
+                continue
+            simTime += simulated - begin
+            sumTime += summarized - simulated
+            nbytes += np.asarray(simdata).nbytes
+            sumstats.append(sumstat)
+
+        n = len(sumstats)
+        if n == 0:
+            return draws, draws, np.nan, np.nan, np.nan, np.empty((0, self.sumStatObsData.size))
+        return draws, draws - n, simTime / n, sumTime / n, nbytes / n, np.array(sumstats)
+
+    def _timeDistance(self, sumstats):
+        """Seconds per row to scale the summary statistics and compute the distances."""
+
+        start = time.perf_counter()
+        scaler = ABCScaler()
+        euclideanDistance(scaler.fit_transform(sumstats), scaler.transform(self.sumStatObsData))
+        return (time.perf_counter() - start) / sumstats.shape[0]
+
+    def predict(self, simulations, backend, jobs, timeBudget=None):
+        """
+        Predict the resources needed by a reference table.
+        :param simulations: number of simulations per model (the maximum with a time budget)
+        :param backend: one of BACKENDS
+        :param jobs: number of workers, None for the default of the backend
+        :param timeBudget: time budget of the simulations in seconds, None for no budget
+        :return: an OrderedDict with the predicted rows, CPU time and runtime
+        in seconds, memory in MB and the recommended workers and block size
+        """
+        if self.costs is None:
+            self.calibrate()
+
+        cost = np.maximum(self._rowCosts, self.minRowSeconds)
+        workers = (jobs or 1) if backend == 'cluster' else workerCount(backend, jobs)
+        # Local workers beyond the number of cores share them
+        parallel = min(workers, availableCpus()) if backend in ('threads', 'processes') else workers
+
+        # Within a time budget, the models are simulated in balanced blocks
+        rows = simulations
+        if timeBudget is not None:
+            affordable = int(timeBudget * parallel / cost.sum())
+            rows = affordable if simulations is None else min(simulations, affordable)
+        cpuTime = rows * cost.sum()
+        nRows = rows * len(self._models)
+
+        # The table holds the model index, the parameters, the summary
+        # statistics and the distances, and the summary statistics are
+        # copied once when scaled
+        nParams = max(len(model.paramNames) for model in self._models)
+        memory = nRows * 8 * (2 + nParams + 2 * self.sumStatObsData.size) / 2**20
+
+        recommendedWorkers = int(np.clip(cpuTime // self.minWorkerSeconds, 1, availableCpus()))
+        blockSize = int(np.clip(round(self.taskSeconds / cost.mean()), 1, self.maxBlockSize))
+        blockSize = max(min(blockSize, nRows // (self.tasksPerWorker * recommendedWorkers)), 1)
+
+        return OrderedDict([
+            ('rows', nRows),
+            ('cputime', cpuTime),
+            ('runtime', cpuTime / parallel + nRows * self.distanceCost),
+            ('workers', workers),
+            ('memory', memory),
+            ('recommendedworkers', recommendedWorkers),
+            ('blocksize', blockSize)
+        ])
+
+    def report(self, prediction):
+        """
+        Returns a printable report of the calibration and the prediction.
+        :param prediction: the result of predict()
+        :return: a string
+        """
+        return '\n'.join([
+            'Calibration on up to {} prior draws per model:'.format(self.draws),
+            str(self.costs),
+            'Distance: {:.4f} ms/row'.format(1000 * self.distanceCost),
+            'Predicted reference table: {} rows, {:.1f} CPU seconds, {:.1f} seconds on {} workers, '
+            '{:.1f} MB in memory'.format(prediction['rows'], prediction['cputime'], prediction['runtime'],
+                                         prediction['workers'], prediction['memory']),
+            'Recommended: {} workers, block size {}'.format(prediction['recommendedworkers'],
+                                                            prediction['blocksize'])
+        ])
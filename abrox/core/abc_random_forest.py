@@ -1,17 +1,74 @@
 import numpy as np
+from sklearn.base import clone
 from sklearn.ensemble import RandomForestClassifier
-from abrox.core.abc_utils import toArray
+
+# The folds and classifier of the cross-validation run by the workers
+# of a pool, installed once per worker so that tasks only carry a fold
+_folds = None
+_classifier = None
+
+
+def initFolds(folds, classifier):
+    """
+    Pool initializer. Stores the folds and the classifier in the worker.
+    :param folds: list of arrays holding the features and the label (last column)
+    :param classifier: the (unfitted) classifier
+    :return: None
+    """
+    global _folds, _classifier
+    _folds = folds
+    _classifier = classifier
+
+
+def scoreFold(k):
+    """
+    Score the k-th fold of the worker (see _scoreFold).
+    :param k: index of the test fold
+    :return: the accuracy
+    """
+    return _scoreFold(_folds, _classifier, k)
+
+
+def _scoreFold(folds, classifier, k):
+    """
+    Fit a copy of the classifier on all folds but the k-th and
+    return its accuracy on the k-th fold.
+    :param folds: list of arrays holding the features and the label (last column)
+    :param classifier: the (unfitted) classifier
+    :param k: index of the test fold
+    :return: the accuracy
+    """
+    # Get current test set
+    X_k_test = folds[k][:, :-1]
+    y_k_test = folds[k][:, -1]
+
+    # Get remaining folds and current training set
+    remaining = np.vstack([v for i, v in enumerate(folds) if i != k])
+    X_k_train = remaining[:, :-1]
+    y_k_train = remaining[:, -1]
+
+    # Fit and predict with classifier
+    classifier = clone(classifier)
+    classifier.fit(X_k_train, y_k_train)
+    yhat = classifier.predict(X_k_test)
+
+    return np.sum(y_k_test == yhat) / len(y_k_test)
 
 
 class ABCRandomForest:
-    """Implements a random forest for ABC model selection."""
+    """
+    Implements a random forest for ABC model selection. The folds of
+    the cross-validation are fitted in parallel on the workers of the pool.
+    """
 
-    def __init__(self, refTable, preprocessor, settings, modelNames):
+    def __init__(self, refTable, preprocessor, settings, modelNames, modelPrior=None, pool=None):
 
         self._refTable = refTable
         self._pp = preprocessor
         self._settings = settings
         self._modelNames = modelNames
+        self._modelPrior = modelPrior
+        self._pool = pool
 
     def run(self):
         """Runs according to settings (these must be specified by user.)"""
@@ -19,8 +76,8 @@ class ABCRandomForest:
         rf = RandomForestClassifier(**self._settings['specs'])
 
         # Extract sum stats and model indices from ref table
-        indices = toArray(self._refTable, 'idx').flatten()
-        sumStat = toArray(self._refTable, 'sumstat')
+        indices = self._refTable.idx
+        sumStat = self._refTable.sumstat
 
         # Do a 5-fold cross-validation
         accuracies = self._cross_val(sumStat, indices, rf, 5)
@@ -32,6 +89,12 @@ class ABCRandomForest:
         sumStatTest = np.array(self._pp.scaledSumStatObsData).reshape(1, -1)
         pred = rf.predict_proba(sumStatTest)
 
+        # The forest learns the prior model probabilities of the table (the
+        # share of rows per model), reweight to equal prior probabilities
+        if self._modelPrior is not None:
+            pred = pred / np.asarray(self._modelPrior)[rf.classes_]
+            pred /= pred.sum(axis=1, keepdims=True)
+
         return {mod : np.round(pred[0,i],3) for i, mod in enumerate(self._modelNames)}
 
     def _cross_val(self, X, y, classifier, nfolds=10):
@@ -51,32 +114,17 @@ class ABCRandomForest:
         np.random.seed(42)
         np.random.shuffle(data)
 
-        # Split data into (almost) equal folds (returns a list of arrays)
-        # and we cast the list into a numpy array in order to do list indexing
-        data = np.array(np.array_split(data, nfolds))
-
-        # Do the k-fold cross-validation
-        accs = []
-        for k in range(nfolds):
-            # Get current test set
-            X_k_test = data[k][:, :-1]
-            y_k_test = data[k][:, -1]
-
-            # Get remaining indices and current training set
-            remaining_idx = [i for i, v in enumerate(data) if i != k]
-            X_k_train = np.vstack(data[remaining_idx])[:, :-1]
-            y_k_train = np.vstack(data[remaining_idx])[:, -1]
+        # Split data into (almost) equal folds (returns a list of arrays,
+        # folds differ in size if the rows do not divide evenly)
+        data = np.array_split(data, nfolds)
 
-            # Fit and predict with classifier
-            classifier.fit(X_k_train, y_k_train)
-            yhat = classifier.predict(X_k_test)
-
-            # Store error rate
-            accs.append(self._accuracy(y_k_test, yhat))
+        # Do the k-fold cross-validation (one task per fold)
+        tasks = [(k,) for k in range(nfolds)]
+        if self._pool is None:
+            accs = [_scoreFold(data, classifier, *task) for task in tasks]
+        else:
+            accs = self._pool.install(initFolds, (data, classifier)).map(scoreFold, tasks)
+            # In-process backends installed the folds in this process
+            initFolds(None, None)
 
         return np.array(accs)
-
-    def _accuracy(self, y, yhat):
-        """A utility function to compute the accuracy of the classifier"""
-
-        return np.sum(y == yhat) / len(y)
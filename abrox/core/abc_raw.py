@@ -0,0 +1,89 @@
+import os
+import uuid
+import numpy as np
+
+
+class ABCRawStore:
+    """
+    Opt-in store of the simulated datasets behind a reference table, so
+    that the summary statistics can be recomputed with a new summary
+    function without simulating again. Workers save every block of
+    datasets, together with its parameters, in its own file; the parent
+    records the blocks in table order in an append-only index. Blocks
+    are saved either as plain .npy files, which are memory-mapped when
+    read back, or as compressed .npz archives.
+    """
+
+    indexName = 'blocks.tsv'
+
+    def __init__(self, path, compress=False):
+        """
+        :param path: directory of the store
+        :param compress: boolean flag - save compressed archives instead of
+        memory-mappable arrays
+        """
+        self.path = path
+        self.compress = compress
+        os.makedirs(path, exist_ok=True)
+
+    def clear(self):
+        """Remove all blocks and the index."""
+
+        for fileName in os.listdir(self.path):
+            if fileName.endswith(('.npy', '.npz')) or fileName == self.indexName:
+                os.remove(os.path.join(self.path, fileName))
+
+    def save(self, params, data):
+        """
+        Save a block of simulated datasets (called by the workers).
+        :param params: parameter block of shape (#rows, #model parameters)
+        :param data: the stacked datasets with #rows as first dimension
+        :return: the name of the block
+        """
+        name = uuid.uuid4().hex
+        if self.compress:
+            np.savez_compressed(os.path.join(self.path, name + '.npz'), param=params, data=data)
+        else:
+            np.save(os.path.join(self.path, name + '.param.npy'), params)
+            np.save(os.path.join(self.path, name + '.data.npy'), data)
+        return name
+
+    def load(self, name):
+        """
+        Read a block back.
+        :param name: the name of the block
+        :return: (params, data) arrays, memory-mapped if not compressed
+        """
+        archive = os.path.join(self.path, name + '.npz')
+        if os.path.exists(archive):
+            with np.load(archive) as block:
+                return block['param'], block['data']
+        return (np.load(os.path.join(self.path, name + '.param.npy'), mmap_mode='r'),
+                np.load(os.path.join(self.path, name + '.data.npy'), mmap_mode='r'))
+
+    def append(self, modelindex, name, count):
+        """
+        Record a block at the end of the table (called by the parent in
+        the order the rows are written to the table).
+        :param modelindex: index of the model the block was simulated from
+        :param name: the name of the block
+        :param count: number of rows of the block
+        :return: None
+        """
+        with open(os.path.join(self.path, self.indexName), 'a') as outfile:
+            outfile.write('{}\t{}\t{}\n'.format(modelindex, name, count))
+
+    def blocks(self):
+        """
+        Returns the recorded blocks in table order.
+        :return: a list of (modelindex, name, count) tuples
+        """
+        indexPath = os.path.join(self.path, self.indexName)
+        if not os.path.exists(indexPath):
+            return []
+        with open(indexPath) as infile:
+            return [(int(modelindex), name, int(count))
+                    for modelindex, name, count in (line.split() for line in infile if line.strip())]
+
+    def __len__(self):
+        return sum(count for _, _, count in self.blocks())
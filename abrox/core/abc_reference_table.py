@@ -1,32 +1,43 @@
 import pandas as pd
 import numpy as np
 
-from abrox.core.abc_utils import toArray
-
 
 class RefTable:
-    """ 
+    """
     Holds the final ABC Table where each row corresponds to one simulation.
-    Contains information about:
-     - model index
-     - summary statistics
-     - drawn parameters
-     - distance to observed data
+    The table is stored column-wise as contiguous numpy arrays:
+     - idx: model index, shape (#rows,)
+     - param: drawn parameters, shape (#rows, #parameters)
+     - sumstat: summary statistics, shape (#rows, #sumstats)
+     - distance: distance to observed data, shape (#rows,)
+    Models with fewer parameters than others are padded with NaN.
     """
 
-    def __init__(self):
-        self._table = None
+    def __init__(self, idx=None, param=None, sumstat=None, distance=None):
+        self.idx = idx
+        self.param = param
+        self.sumstat = sumstat
+        self.distance = distance
 
-    def initialize(self, content):
-        """ Initialize Reference Table."""
+    def initialize(self, idx, param, sumstat):
+        """
+        Initialize Reference Table from filled column arrays.
+        Distances are calculated later.
+        :param idx: model indices, shape (#rows,)
+        :param param: parameters, shape (#rows, #parameters)
+        :param sumstat: summary statistics, shape (#rows, #sumstats)
+        :return: None
+        """
 
-        cols = ['idx', 'param', 'sumstat', 'distance']
-        self._table = pd.DataFrame(content, columns=cols)
+        self.idx = np.asarray(idx, dtype=np.int64)
+        self.param = param
+        self.sumstat = sumstat
+        self.distance = np.full(self.idx.shape[0], -1.0)
 
     def getRefTable(self):
-        """ Returns the actual pandas DataFrame."""
+        """ Returns the reference table itself."""
 
-        return self._table
+        return self
 
     def fillColumn(self, data, columnName):
         """
@@ -35,18 +46,59 @@ class RefTable:
         after scaling.
         """
 
-        if columnName == 'sumstat':
-            data = [np.array(row) for row in data]
-        self._table[columnName] = data
+        setattr(self, columnName, np.asarray(data))
 
     def getColumn(self, columnName):
         """Returns given column as numpy array."""
 
-        return toArray(self._table, columnName)
+        return getattr(self, columnName)
+
+    def subset(self, rows):
+        """
+        Return a new reference table containing only the given rows.
+        :param rows: a boolean mask or an array of row indices
+        :return: the subset as a RefTable
+        """
+
+        return RefTable(self.idx[rows], self.param[rows],
+                        self.sumstat[rows], self.distance[rows])
+
+    def toDataFrame(self, paramNames=None):
+        """
+        Return a flat pandas view of the table for reporting. Columns
+        are idx, one column per parameter and summary statistic, and distance.
+        :param paramNames: optional list of parameter names
+        :return: a pandas DataFrame
+        """
+
+        if paramNames is None:
+            paramNames = ['p{}'.format(i+1) for i in range(self.param.shape[1])]
+        sumstatNames = ['s{}'.format(i+1) for i in range(self.sumstat.shape[1])]
+
+        df = pd.DataFrame(np.column_stack((self.param, self.sumstat)),
+                          columns=list(paramNames) + sumstatNames)
+        df.insert(0, 'idx', self.idx)
+        df['distance'] = self.distance
+        return df
+
+    @classmethod
+    def fromDataFrame(cls, df):
+        """
+        Create a reference table from a flat pandas DataFrame
+        (parameter columns start with 'p', summary statistics with 's').
+        :param df: the pandas DataFrame
+        :return: a RefTable
+        """
+
+        paramCols = [col for col in df if col.startswith('p')]
+        sumstatCols = [col for col in df if col.startswith('s')]
+
+        return cls(df['idx'].values.astype(np.int64),
+                   df[paramCols].values.astype(float).reshape(len(df.index), -1),
+                   df[sumstatCols].values.astype(float),
+                   df['distance'].values.astype(float))
 
-    def fillRow(self, row, idx, param, sumstat):
-        """Fill a row of the table. Distance is calculated later."""
+    def __len__(self):
+        """Number of rows in the table."""
 
-        self._table.loc[row, 'idx'] = idx
-        self._table.set_value(row, 'param', param)
-        self._table.set_value(row, 'sumstat', sumstat)
+        return 0 if self.idx is None else self.idx.shape[0]
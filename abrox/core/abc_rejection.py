@@ -13,7 +13,7 @@ class ABCRejection:
         rows for which the distance is < threshold and threshold itself.
         :return: the tuple
         """
-        q = self.keep / len(self.refTable.index) * 100
-        threshold = np.percentile(self.refTable['distance'],q=q)
-        subset = self.refTable[self.refTable['distance'] < threshold]
+        q = self.keep / len(self.refTable) * 100
+        threshold = np.percentile(self.refTable.distance,q=q)
+        subset = self.refTable.subset(self.refTable.distance < threshold)
         return subset, threshold
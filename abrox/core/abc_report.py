@@ -3,22 +3,20 @@ from itertools import combinations
 import pandas as pd
 import numpy as np
 
-from abrox.core.abc_utils import toArray
-
 
 class ABCReporter:
 
-    def __init__(self, table, modelNames, paramNames, objective, wd):
+    def __init__(self, table, modelNames, paramNames, objective, wd, modelPrior=None):
         self.table = table
         self.modelNames = modelNames
         self.paramNames = paramNames
         self.objective = objective
+        self.modelPrior = modelPrior
         self._wd = wd
 
     def initParamTable(self):
         """ Initialise the parameter table."""
-        paramArray = toArray(self.table, 'param')
-        return pd.DataFrame(paramArray, columns=self.paramNames)
+        return self.table.toDataFrame(self.paramNames)[self.paramNames]
 
     def bayesFactor(self):
         """
@@ -31,11 +29,17 @@ class ABCReporter:
 
         counter = Counter(counterDict)
 
-        counter.update(self.table['idx'])
+        counter.update(self.table.idx.tolist())
 
         orderedCounter = OrderedDict(sorted(counter.items()))
 
-        lowerPart = [b / a for a, b in list(combinations(orderedCounter.values(), 2))]
+        # Divide out the prior model probabilities of the reference table
+        # (the share of rows per model) to obtain Bayes factors
+        counts = list(orderedCounter.values())
+        if self.modelPrior is not None:
+            counts = [count / float(prior) for count, prior in zip(counts, self.modelPrior)]
+
+        lowerPart = [b / a for a, b in list(combinations(counts, 2))]
         upperPart = []
         for t in lowerPart:
             try:
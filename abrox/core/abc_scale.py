@@ -24,6 +24,5 @@ class ABCScaler:
     def transform(self, data):
         """Scale data using MAD computed from fit_transform."""
 
-        data /= self.mad
-        return data
+        return data / self.mad
 
@@ -0,0 +1,164 @@
+from collections import OrderedDict
+import time
+import numpy as np
+import pandas as pd
+
+from abrox.core.abc_worker import SEED_BLOCK
+
+
+class ABCScheduler:
+    """
+    Produces the simulation tasks of the reference table and adapts
+    their size online. The cost of one simulation is measured per model
+    from the completed tasks, blocks are sized to take about targetTime
+    seconds, and they shrink towards the end of the run so that all
+    workers finish at about the same time (guided self-scheduling).
+    With a time budget, tasks are handed out until the budget expires,
+    always to the model with the fewest rows so that the models stay
+    balanced, and the number of simulations only acts as a cap.
+    """
+
+    def __init__(self, models, simulations, jobs, maxBlock, seeds, done=None,
+                 timeBudget=None, targetTime=0.5, initialBlock=16, smoothing=0.3):
+        """
+        :param models: list of ABCModel instances
+        :param simulations: number of simulations per model, None for no cap
+        (only with a time budget)
+        :param jobs: number of workers
+        :param maxBlock: maximum number of simulations per task
+        :param seeds: function returning the seed of the next task from
+        its model index and number of simulations
+        :param done: number of simulations per model already available (e.g. when resuming)
+        :param timeBudget: wall-clock seconds to simulate for, None to run all simulations
+        :param targetTime: desired duration of a task in seconds
+        :param initialBlock: size of the blocks sent before the cost of a model is known
+        :param smoothing: weight of the newest observation in the cost average
+        """
+        self._names = [model.name for model in models]
+        self._simulations = np.inf if simulations is None else simulations
+        self._timeBudget = timeBudget
+        self._deadline = None
+        self._jobs = jobs
+        self._maxBlock = maxBlock
+        self._targetTime = targetTime
+        self._initialBlock = initialBlock
+        self._smoothing = smoothing
+        self._seeds = seeds
+        # Vectorized models simulate a batch per seed block, so their
+        # tasks are made of whole seed blocks to be reproducible
+        self._aligned = [model.hasBatchSimulate() and maxBlock >= SEED_BLOCK for model in models]
+
+        nModels = len(models)
+        done = np.zeros(nModels, dtype=np.int64) if done is None else np.asarray(done, dtype=np.int64)
+        self._scheduled = done.copy() if simulations is None else np.minimum(done, simulations)
+        self._done = np.zeros(nModels, dtype=np.int64)
+        self._busy = np.zeros(nModels)
+        self._costs = np.full(nModels, np.nan)
+
+    def _remaining(self):
+        """Number of simulations per model not handed out yet."""
+
+        return self._simulations - self._scheduled
+
+    def _blockSize(self, modelindex):
+        """
+        Number of simulations for the next task of a model.
+        :param modelindex: index of the model
+        :return: the block size
+        """
+        remaining = self._remaining()
+        cost = self._costs[modelindex]
+
+        if np.isnan(cost):
+            size = self._initialBlock
+        else:
+            # Models without a measurement yet are assumed to be average
+            costs = np.where(np.isnan(self._costs), np.nanmean(self._costs), self._costs)
+            remainingTime = np.sum(remaining * costs)
+            if self._deadline is not None:
+                # Worker time left until the budget expires
+                remainingTime = min(remainingTime, (self._deadline - time.perf_counter()) * self._jobs)
+            taskTime = min(self._targetTime, remainingTime / (2 * self._jobs))
+            # Do not let dispatch overhead dominate the tail of the run
+            taskTime = max(taskTime, self._targetTime / 10)
+            size = int(taskTime / cost) if cost > 0 else self._maxBlock
+
+        if self._aligned[modelindex]:
+            size = max(size // SEED_BLOCK, 1) * SEED_BLOCK
+            return int(min(size, self._maxBlock // SEED_BLOCK * SEED_BLOCK, remaining[modelindex]))
+        return int(np.clip(size, 1, min(self._maxBlock, remaining[modelindex])))
+
+    def setTargets(self, simulations):
+        """
+        Change the number of simulations per model, e.g. after a pilot run.
+        :param simulations: number of simulations per model (scalar or one per model)
+        :return: None
+        """
+        self._simulations = simulations
+
+    def costPerSimulation(self):
+        """
+        Returns the observed cost of one simulation per model in seconds.
+        Models without a measurement are assumed to be average.
+        """
+        return np.where(np.isnan(self._costs), np.nanmean(self._costs), self._costs)
+
+    def finished(self):
+        """Returns True if all simulations have been handed out or the time budget expired."""
+
+        if self._deadline is not None and time.perf_counter() >= self._deadline:
+            return True
+        return not np.any(self._remaining() > 0)
+
+    def tasks(self):
+        """
+        Generate tasks lazily, cycling over the models so that the cost
+        of every model is learned early on. With a time budget, the model
+        with the fewest rows gets the next task.
+        :return: a generator of (modelindex, count, seed) tuples
+        """
+        if self._timeBudget is not None:
+            self._deadline = time.perf_counter() + self._timeBudget
+
+        while not self.finished():
+            if self._deadline is not None:
+                candidates = np.flatnonzero(self._remaining() > 0)
+                modelindices = [candidates[np.argmin(self._scheduled[candidates])]]
+            else:
+                modelindices = np.flatnonzero(self._remaining() > 0)
+            for modelindex in modelindices:
+                count = self._blockSize(modelindex)
+                self._scheduled[modelindex] += count
+                yield int(modelindex), count, self._seeds(int(modelindex), count)
+
+    def update(self, modelindex, count, elapsed, failed=0):
+        """
+        Record a completed task.
+        :param modelindex: index of the model
+        :param count: number of successful simulations of the task
+        :param elapsed: time the worker spent on the task in seconds
+        :param failed: number of failed (skipped) simulations of the task
+        :return: None
+        """
+        self._done[modelindex] += count
+        self._busy[modelindex] += elapsed
+
+        if count + failed == 0:
+            return
+        cost = elapsed / (count + failed)
+        if np.isnan(self._costs[modelindex]):
+            self._costs[modelindex] = cost
+        else:
+            self._costs[modelindex] += self._smoothing * (cost - self._costs[modelindex])
+
+    def costs(self):
+        """
+        Returns the observed cost per model.
+        :return: a pandas DataFrame indexed by model name
+        """
+        report = OrderedDict([
+            ('simulations', self._done),
+            ('seconds', np.round(self._busy, 3)),
+            ('ms/simulation', np.round(1000 * self._busy / np.maximum(self._done, 1), 4))
+        ])
+        return pd.DataFrame(report, index=pd.Index(self._names, name='Models'))
@@ -0,0 +1,192 @@
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+
+from abrox.core.abc_reference_table import RefTable
+
+
+class ABCTableBuffer:
+    """
+    Preallocated parameter and summary statistic arrays the workers
+    write their simulated blocks into by row offset, so only completion
+    counts travel back to the parent. The buffer holds one slot per task
+    in flight; the parent moves completed slots to the reference table.
+    A task publishes the time it started and the row it is simulating in
+    the started and progress columns at its first row (NaN before it
+    starts), so that the parent can time it from its start and tell
+    which row a lost worker was busy with.
+    If shared is True, the arrays live in multiprocessing shared memory
+    and the buffer can be handed to worker processes.
+    """
+
+    def __init__(self, nRows, nParams, nStats, shared=False):
+        """
+        :param nRows: number of rows of the buffer
+        :param nParams: maximum number of parameters over all models
+        :param nStats: number of summary statistics
+        :param shared: boolean flag - allocate in shared memory
+        """
+        self.shapes = {'param': (nRows, nParams), 'sumstat': (nRows, nStats), 'progress': (nRows,),
+                       'started': (nRows,)}
+        self.shared = shared
+        self._shm = {}
+        self._owner = True
+
+        for name, shape in self.shapes.items():
+            setattr(self, name, self._allocate(name, shape))
+            getattr(self, name).fill(np.nan)
+
+    def _allocate(self, name, shape):
+        """Allocate an array either on the heap or in shared memory."""
+
+        if not self.shared:
+            return np.empty(shape)
+        nbytes = max(int(np.prod(shape)) * np.dtype(np.float64).itemsize, 1)
+        self._shm[name] = SharedMemory(create=True, size=nbytes)
+        return np.ndarray(shape, dtype=np.float64, buffer=self._shm[name].buf)
+
+    def write(self, offset, params, sumstats):
+        """
+        Store a simulated block at the given row offset. Models with
+        fewer parameters have the remaining columns set to NaN.
+        :param offset: first row of the block
+        :param params: parameter block of shape (#rows, #model parameters)
+        :param sumstats: summary statistics of shape (#rows, #sumstats)
+        :return: None
+        """
+        stop = offset + params.shape[0]
+        self.param[offset:stop, :params.shape[1]] = params
+        self.param[offset:stop, params.shape[1]:] = np.nan
+        self.sumstat[offset:stop] = sumstats
+
+    def read(self, offset, count):
+        """
+        Return the parameters and summary statistics of a block.
+        :param offset: first row of the block
+        :param count: number of rows
+        :return: (params, sumstats) views into the buffer
+        """
+        return self.param[offset:offset+count], self.sumstat[offset:offset+count]
+
+    def release(self):
+        """Free the shared segments (if used)."""
+
+        for name in self.shapes:
+            setattr(self, name, None)
+        for shm in self._shm.values():
+            try:
+                shm.close()
+            except BufferError:
+                # Views are still referenced (e.g. by a traceback),
+                # the mapping goes away with them
+                pass
+            if self._owner:
+                shm.unlink()
+        self._shm = {}
+
+    def __getstate__(self):
+        """Pickle only the names of the shared segments."""
+
+        if not self.shared:
+            raise ValueError('Only shared table buffers can be sent to worker processes.')
+        return {'shapes': self.shapes,
+                'names': {name: shm.name for name, shm in self._shm.items()}}
+
+    def __setstate__(self, state):
+        """Attach to the shared segments in a worker process."""
+
+        self.shapes = state['shapes']
+        self.shared = True
+        self._owner = False
+        self._shm = {}
+        for name, shape in self.shapes.items():
+            self._shm[name] = SharedMemory(name=state['names'][name])
+            setattr(self, name, np.ndarray(shape, dtype=np.float64, buffer=self._shm[name].buf))
+
+
+def _mappedLocation(array):
+    """
+    Find the file an array is memory-mapped from.
+    :param array: a numpy array
+    :return: (path, byte offset) of the array in its file, None if the
+    array is not a contiguous part of a memory-mapped file
+    """
+    base = array
+    while base is not None and not isinstance(base, np.memmap):
+        base = base.base
+    if base is None or getattr(base, 'filename', None) is None or not array.flags.c_contiguous:
+        return None
+    start = array.__array_interface__['data'][0] - base.__array_interface__['data'][0]
+    return base.filename, base.offset + start
+
+
+class ABCSharedTable:
+    """
+    Hands the columns of a RefTable to worker processes without a copy
+    per worker: columns memory-mapped from a store are mapped again from
+    their files by the workers, the others are copied once into shared
+    memory. Workers see the table as the table attribute. Unless shared
+    is True, the table is only handed to in-process workers as it is.
+    """
+
+    columns = ('idx', 'param', 'sumstat', 'distance')
+
+    def __init__(self, table, shared=False):
+        """
+        :param table: the RefTable to share
+        :param shared: boolean flag - prepare the table for worker processes
+        """
+        self.table = table
+        self.shared = shared
+        self._sources = {}
+        self._shm = {}
+        self._owner = True
+
+        for name in self.columns if shared else ():
+            array = getattr(table, name)
+            if array is None:
+                continue
+            # Either the file and byte offset, or no file and the
+            # name of the shared segment holding the column
+            location = _mappedLocation(array)
+            if location is None:
+                shm = SharedMemory(create=True, size=max(array.nbytes, 1))
+                np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+                self._shm[name] = shm
+                location = (None, shm.name)
+            self._sources[name] = location + (array.dtype.str, array.shape)
+
+    def release(self):
+        """Free the shared segments."""
+
+        for shm in self._shm.values():
+            try:
+                shm.close()
+            except BufferError:
+                # Views are still referenced, the mapping goes away with them
+                pass
+            if self._owner:
+                shm.unlink()
+        self._shm = {}
+
+    def __getstate__(self):
+        """Pickle only the locations of the columns."""
+
+        if not self.shared:
+            raise ValueError('Only shared tables can be sent to worker processes.')
+        return {'sources': self._sources}
+
+    def __setstate__(self, state):
+        """Map the columns in a worker process."""
+
+        self._sources = state['sources']
+        self.shared = True
+        self._shm = {}
+        self._owner = False
+        columns = {}
+        for name, (path, location, dtype, shape) in self._sources.items():
+            if path is not None:
+                columns[name] = np.memmap(path, dtype=dtype, mode='r', offset=location, shape=shape)
+            else:
+                self._shm[name] = SharedMemory(name=location)
+                columns[name] = np.ndarray(shape, dtype=dtype, buffer=self._shm[name].buf)
+        self.table = RefTable(**columns)
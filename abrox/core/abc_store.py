@@ -0,0 +1,267 @@
+import json
+import os
+import numpy as np
+
+from abrox.core.abc_reference_table import RefTable
+from abrox.core.abc_worker import SEED_BLOCK
+
+
+class ABCMemoryWriter:
+    """Collects the completed blocks of the reference table in memory."""
+
+    def __init__(self):
+        self._blocks = []
+
+    def append(self, modelindex, params, sumstats):
+        """
+        Store a copy of a completed block.
+        :param modelindex: index of the model the block was simulated from,
+        or an array with one model index per row
+        :param params: parameter block of shape (#rows, #parameters)
+        :param sumstats: summary statistics of shape (#rows, #sumstats)
+        :return: None
+        """
+        idx = np.broadcast_to(np.asarray(modelindex, dtype=np.int64), params.shape[:1])
+        self._blocks.append((idx, params.copy(), sumstats.copy()))
+
+    def close(self):
+        """Nothing to release for in-memory tables."""
+        pass
+
+    def modelCounts(self, nModels):
+        """
+        Number of collected rows per model.
+        :param nModels: number of models
+        :return: an integer array of length nModels
+        """
+        counts = np.zeros(nModels, dtype=np.int64)
+        for idx, _, _ in self._blocks:
+            counts += np.bincount(idx, minlength=nModels)
+        return counts
+
+    def load(self):
+        """Returns the collected blocks as a RefTable."""
+
+        table = RefTable()
+        table.initialize(*(np.concatenate(column) for column in zip(*self._blocks)))
+        return table
+
+    def __len__(self):
+        return sum(idx.shape[0] for idx, _, _ in self._blocks)
+
+
+class ABCCheckpoint:
+    """
+    Hands out the seeds of the simulation tasks: a base seed and the
+    position of the first row of the task in the random stream of its
+    model (see abc_worker.drawTaskParameters), and records both next to
+    an on-disk store. Positions are reserved in batches of whole seed
+    blocks before they are handed out, so a resumed run continues with
+    fresh rows and never repeats the random stream of a block that was
+    completed (or lost in flight) before the interruption. Without a
+    path, nothing is written.
+    """
+
+    fileName = 'checkpoint.json'
+
+    def __init__(self, path=None, baseSeed=None, reserved=None, reserve=256):
+        """
+        :param path: directory of the store, None for no checkpoint file
+        :param baseSeed: base seed, None to draw one from numpy's global random state
+        :param reserved: next free position in the random stream of each model,
+        None to start all streams at their beginning
+        :param reserve: number of seed blocks reserved per checkpoint write
+        """
+        self.path = path
+        self.baseSeed = int(np.random.randint(np.iinfo(np.int32).max)) if baseSeed is None else baseSeed
+        self._next = list(reserved or [])
+        self._reserve = reserve * SEED_BLOCK
+        self._reserved = list(self._next)
+
+    @classmethod
+    def load(cls, path, baseSeed=None):
+        """
+        Open the checkpoint of a store, or start a new one if there is none.
+        :param path: directory of the store
+        :param baseSeed: base seed of a new checkpoint, None to draw one
+        :return: an ABCCheckpoint continuing after all reserved positions
+        """
+        fullPath = os.path.join(path, cls.fileName)
+        if not os.path.exists(fullPath):
+            return cls(path, baseSeed)
+        with open(fullPath) as infile:
+            state = json.load(infile)
+        return cls(path, state['baseSeed'], state['reserved'])
+
+    def save(self):
+        """Atomically write base seed and reserved positions."""
+
+        if self.path is None:
+            return
+        tmpPath = os.path.join(self.path, self.fileName + '.tmp')
+        with open(tmpPath, 'w') as outfile:
+            json.dump({'baseSeed': self.baseSeed, 'reserved': self._reserved}, outfile)
+        os.replace(tmpPath, os.path.join(self.path, self.fileName))
+
+    def nextSeed(self, modelindex, count):
+        """
+        Returns the seed of the next task of a model.
+        :param modelindex: index of the model
+        :param count: number of simulations of the task
+        :return: a (base seed, position of the first row) pair
+        """
+        while len(self._next) <= modelindex:
+            self._next.append(0)
+            self._reserved.append(0)
+        first = self._next[modelindex]
+        self._next[modelindex] += count
+        if self._next[modelindex] > self._reserved[modelindex]:
+            # Reserve whole seed blocks, so a resumed run starts at the beginning of one
+            blocks = -(-self._next[modelindex] // SEED_BLOCK)
+            self._reserved[modelindex] = blocks * SEED_BLOCK + self._reserve
+            self.save()
+        return self.baseSeed, first
+
+
+class ABCTableStore:
+    """
+    Append-only on-disk reference table. A store is a directory holding
+    a small json header and one raw binary file per column (model index,
+    parameters, summary statistics), each written row by row. Completed
+    blocks are appended as they arrive and flushed, so a crash only
+    loses the blocks still in flight. Stores are read back as
+    memory-mapped arrays, which allows tables larger than RAM.
+    """
+
+    _files = {'idx': ('idx.i8', np.int64),
+              'param': ('param.f8', np.float64),
+              'sumstat': ('sumstat.f8', np.float64)}
+
+    # Columns computed from the table when it is memory-mapped
+    _derived = {'scaled': 'scaled.f8', 'distance': 'distance.f8'}
+
+    def __init__(self, path, nParams=None, nStats=None, mode='r'):
+        """
+        :param path: directory of the store
+        :param nParams: number of parameter columns (needed for new stores)
+        :param nStats: number of summary statistic columns (needed for new stores)
+        :param mode: 'r' read, 'a' append to an existing store or create it,
+        'w' create a new store, discarding an existing one
+        """
+        self.path = path
+        self._handles = {}
+        headerPath = os.path.join(path, 'header.json')
+
+        if mode == 'w' or (mode == 'a' and not os.path.exists(headerPath)):
+            os.makedirs(path, exist_ok=True)
+            self.header = {'format': 1, 'nParams': int(nParams), 'nStats': int(nStats)}
+            with open(headerPath, 'w') as outfile:
+                json.dump(self.header, outfile)
+            for fileName, _ in self._files.values():
+                open(os.path.join(path, fileName), 'wb').close()
+        else:
+            with open(headerPath) as infile:
+                self.header = json.load(infile)
+            if mode == 'a' and (self.header['nParams'], self.header['nStats']) != (nParams, nStats):
+                raise ValueError('The store at {} holds {} parameters and {} summary statistics, '
+                                 'but {} and {} are simulated.'.format(path, self.header['nParams'],
+                                                                       self.header['nStats'],
+                                                                       nParams, nStats))
+
+        if mode != 'r':
+            self._truncate()
+            self._handles = {name: open(os.path.join(path, fileName), 'ab')
+                             for name, (fileName, _) in self._files.items()}
+
+    def _widths(self):
+        """Number of values per row of each column."""
+
+        return {'idx': 1, 'param': self.header['nParams'], 'sumstat': self.header['nStats']}
+
+    def _completeRows(self):
+        """Number of rows present in all column files."""
+
+        widths = self._widths()
+        rows = []
+        for name, (fileName, dtype) in self._files.items():
+            nbytes = os.path.getsize(os.path.join(self.path, fileName))
+            rowBytes = widths[name] * np.dtype(dtype).itemsize
+            rows.append(nbytes // rowBytes if rowBytes else np.inf)
+        return int(min(rows))
+
+    def _truncate(self):
+        """Drop a partially written last block (e.g. after a crash)."""
+
+        rows = self._completeRows()
+        widths = self._widths()
+        for name, (fileName, dtype) in self._files.items():
+            with open(os.path.join(self.path, fileName), 'r+b') as outfile:
+                outfile.truncate(rows * widths[name] * np.dtype(dtype).itemsize)
+
+    def append(self, modelindex, params, sumstats):
+        """
+        Append a completed block. The index column is written last,
+        so that it marks the block as complete.
+        :param modelindex: index of the model the block was simulated from
+        :param params: parameter block of shape (#rows, #parameters)
+        :param sumstats: summary statistics of shape (#rows, #sumstats)
+        :return: None
+        """
+        idx = np.full(params.shape[0], modelindex, dtype=np.int64)
+        for name, data in (('param', params), ('sumstat', sumstats), ('idx', idx)):
+            self._handles[name].write(np.ascontiguousarray(data, dtype=self._files[name][1]).tobytes())
+            self._handles[name].flush()
+
+    def derivedColumn(self, name, shape):
+        """
+        Create a memory-mapped column computed from the table (the scaled
+        summary statistics or the distances), replacing an earlier one.
+        :param name: 'scaled' or 'distance'
+        :param shape: shape of the column
+        :return: a writable numpy memmap
+        """
+        fullPath = os.path.join(self.path, self._derived[name])
+        if not shape[0]:
+            open(fullPath, 'wb').close()
+            return np.empty(shape)
+        return np.memmap(fullPath, dtype=np.float64, mode='w+', shape=shape)
+
+    def close(self):
+        """Close the column files."""
+
+        for handle in self._handles.values():
+            handle.close()
+        self._handles = {}
+
+    def modelCounts(self, nModels):
+        """
+        Number of stored rows per model.
+        :param nModels: number of models
+        :return: an integer array of length nModels
+        """
+        return np.bincount(self.load(mmap=True).idx, minlength=nModels)
+
+    def load(self, mmap=True):
+        """
+        Read the store as a RefTable.
+        :param mmap: boolean flag - memory-map the columns instead of reading them
+        :return: the RefTable
+        """
+        rows = self._completeRows()
+        widths = self._widths()
+        columns = {}
+        for name, (fileName, dtype) in self._files.items():
+            shape = (rows, widths[name]) if name != 'idx' else (rows,)
+            fullPath = os.path.join(self.path, fileName)
+            if mmap and rows > 0 and widths[name] > 0:
+                columns[name] = np.memmap(fullPath, dtype=dtype, mode='r', shape=shape)
+            else:
+                count = int(np.prod(shape))
+                columns[name] = np.fromfile(fullPath, dtype=dtype, count=count).reshape(shape)
+
+        table = RefTable()
+        table.initialize(columns['idx'], columns['param'], columns['sumstat'])
+        return table
+
+    def __len__(self):
+        return self._completeRows()
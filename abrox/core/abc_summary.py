@@ -1,11 +1,34 @@
+import numpy as np
+
+from abrox.core.abc_cache import codeFingerprint
+
 
 class ABCSummary:
     """A wrapper class over the user-defined summary func."""
 
-    def __init__(self, summary):
+    def __init__(self, summary, summaryBatch=None):
         self.summary = summary
+        self.summaryBatch = summaryBatch
 
     def summarize(self, data):
         """Compute and return summary statistics from data."""
 
         return self.summary(data).flatten()
+
+    def summarizeBatch(self, datasets):
+        """
+        Compute summary statistics for a stack of datasets. Uses the
+        user-defined batch summary function if available, otherwise
+        falls back to summarizing each dataset on its own.
+        :param datasets: an array of shape (#sims, #obs, #vars)
+        :return: an array of shape (#sims, #stats)
+        """
+        if self.summaryBatch is not None:
+            sumstats = np.asarray(self.summaryBatch(datasets))
+            return sumstats.reshape(sumstats.shape[0], -1)
+        return np.array([self.summarize(data) for data in datasets])
+
+    def fingerprint(self):
+        """Returns a text uniquely describing the summary code, used for caching."""
+
+        return '\n'.join((codeFingerprint(self.summary), codeFingerprint(self.summaryBatch)))
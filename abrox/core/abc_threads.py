@@ -0,0 +1,75 @@
+import os
+
+from abrox.core.abc_backend import availableCpus
+
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:
+    threadpool_limits = None
+
+
+# Environment variables read by the common BLAS/OpenMP runtimes. They only
+# take effect for libraries loaded afterwards (e.g. in freshly started
+# worker processes or in programs launched by a simulator), so threadpoolctl
+# is used on top of them if installed to limit already loaded libraries.
+THREAD_ENV_VARS = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS',
+                   'VECLIB_MAXIMUM_THREADS', 'NUMEXPR_NUM_THREADS')
+
+
+def limitBlasThreads(n):
+    """
+    Limit the number of BLAS/OpenMP threads of the current process.
+    :param n: the maximum number of threads
+    :return: the threadpoolctl limiter, or None if threadpoolctl is not installed
+    """
+    for var in THREAD_ENV_VARS:
+        os.environ[var] = str(n)
+    if threadpool_limits is None:
+        return None
+    return threadpool_limits(limits=n)
+
+
+class ABCThreadBudget:
+    """
+    Splits the available cores between the simulation workers and the
+    BLAS/OpenMP threads each worker may use, so that a pool of workers
+    running matrix-heavy simulators does not oversubscribe the machine.
+    Used as a context manager, it applies the per-worker limit to the
+    current process and restores the previous limits on exit.
+    """
+
+    def __init__(self, backend, jobs=None, blasThreads=None, cores=None):
+        """
+        :param backend: one of 'serial', 'threads', 'processes'
+        :param jobs: number of workers, None for all available CPUs
+        :param blasThreads: BLAS threads per worker, None to split the cores evenly
+        :param cores: number of cores to budget, None for all available CPUs
+        """
+        cores = cores or availableCpus()
+        self.jobs = 1 if backend == 'serial' else (jobs or cores)
+        self.blasThreads = blasThreads or max(1, cores // self.jobs)
+        self._limiter = None
+        self._environ = {}
+
+    def __enter__(self):
+        """Apply the per-worker limit to the current process."""
+
+        self._environ = {var: os.environ.get(var) for var in THREAD_ENV_VARS}
+        self._limiter = limitBlasThreads(self.blasThreads)
+        return self
+
+    def __exit__(self, *exc):
+        """Restore the limits the current process had before."""
+
+        if self._limiter is not None:
+            self._limiter.restore_original_limits()
+            self._limiter = None
+        for var, value in self._environ.items():
+            if value is None:
+                os.environ.pop(var, None)
+            else:
+                os.environ[var] = value
+        return False
+
+    def __repr__(self):
+        return 'ThreadBudget:(jobs={}, blasThreads={})'.format(self.jobs, self.blasThreads)
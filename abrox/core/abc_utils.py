@@ -2,6 +2,8 @@ import numpy as np
 import pandas as pd
 import pickle
 
+from abrox.core.abc_reference_table import RefTable
+
 # ABC utility functions
 
 
@@ -86,24 +88,11 @@ def read_external(path):
     """
     Read external reference table as csv and convert to ABrox ref table.
     :param path: path to file
-    :return: reference table as pandas dataframe.
+    :return: reference table as RefTable.
     """
     dfRaw = pd.read_csv(path,sep=",")
 
-    paramCols = [col for col in dfRaw if col.startswith('p')]
-    sumstatCols = [col for col in dfRaw if col.startswith('s')]
-
-    refTable = pd.DataFrame(index=dfRaw.index,columns=['idx','param','sumstat'])
-    refTable['idx'] = dfRaw['idx']
-    refTable['param'] = dfRaw[paramCols].as_matrix().tolist()
-
-    sumstatArray = dfRaw[sumstatCols].as_matrix().tolist()
-    sumstats = [np.array(sumstatList) for sumstatList in sumstatArray]
-    refTable['sumstat'] = sumstats
-
-    refTable['distance'] = dfRaw['distance']
-
-    return refTable
+    return RefTable.fromDataFrame(dfRaw)
 
 
 def pickle_results(output, outputdir):
@@ -2,13 +2,11 @@ import numpy as np
 from collections import OrderedDict
 from scipy import stats
 
-from abrox.core.abc_utils import toArray
-
 
 class Wegmann:
 
     def __init__(self, subset, paramNames):
-        self.paramArray = toArray(subset,'param')
+        self.paramArray = subset.param
         self.paramNames = paramNames
 
     def getProposal(self):
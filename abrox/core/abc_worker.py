@@ -0,0 +1,314 @@
+from contextlib import contextmanager
+import asyncio
+import signal
+import threading
+import time
+import numpy as np
+
+from abrox.core.abc_failures import ABCFailures
+from abrox.core.abc_threads import limitBlasThreads
+
+# Functions executed by the workers generating the reference table.
+# The models, the summarizer, the table buffer and the optional raw
+# store are installed once per worker by the pool initializer, so that
+# tasks only need to carry a model index, a row offset, a number of
+# simulations and a seed.
+
+# Number of rows of the blocks the random stream of a model is divided
+# into. The parameters of a seed block and the seeds of the simulations
+# of its rows only depend on the base seed, the model and the number of
+# the block, so a row is simulated the same way whatever the size of the
+# task it is part of.
+SEED_BLOCK = 100
+
+_models = None
+_summarizer = None
+_buffer = None
+_rawStore = None
+_timeout = None
+
+
+class SimulationTimeout(Exception):
+    """Raised when a simulation exceeds its time limit."""
+    pass
+
+
+@contextmanager
+def timeLimit(seconds):
+    """
+    Interrupt the enclosed code with a SimulationTimeout after the given
+    number of seconds. Relies on SIGALRM, so the limit only applies in
+    the main thread on Unix (worker processes and the serial backend).
+    :param seconds: the time limit, None for no limit
+    """
+    if not seconds or not hasattr(signal, 'SIGALRM') or \
+            threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    def _interrupt(signum, frame):
+        raise SimulationTimeout('exceeded {:g} seconds'.format(seconds))
+
+    previous = signal.signal(signal.SIGALRM, _interrupt)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def initWorker(models, summarizer, buffer, blasThreads=None, rawStore=None, timeout=None):
+    """
+    Pool initializer. Stores the models, the summarizer and the
+    table buffer in the worker process so they are not shipped
+    with every task.
+    :param models: list of ABCModel instances
+    :param summarizer: the ABCSummary instance
+    :param buffer: the ABCTableBuffer results are written into
+    :param blasThreads: BLAS threads of this worker, None to leave unchanged
+    :param rawStore: the ABCRawStore simulated datasets are saved to, None to discard them
+    :param timeout: time limit of one simulation in seconds, None for no limit
+    :return: None
+    """
+    global _models, _summarizer, _buffer, _rawStore, _timeout
+    _models = models
+    _summarizer = summarizer
+    _buffer = buffer
+    _rawStore = rawStore
+    _timeout = timeout
+
+    if blasThreads is not None:
+        limitBlasThreads(blasThreads)
+
+
+def _generateRows(model, params, summarizer, keepData, timeout, failures, modelindex, progress, seeds):
+    """
+    Simulate and summarize a parameter block row by row, skipping and
+    recording the rows that raise an exception or exceed the time limit.
+    :return: the indices of the successful rows, their summary statistics
+    and their datasets (None if keepData is False)
+    """
+    rows, sumstats, datasets = [], [], []
+    for i, paramRow in enumerate(params):
+        if progress is not None:
+            progress(i)
+        if seeds is not None:
+            np.random.seed(int(seeds[i]))
+        try:
+            with timeLimit(timeout):
+                simdata = model.simulate(model.toParamDict(paramRow))
+                sumstat = summarizer.summarize(simdata)
+        except SimulationTimeout as exc:
+            failures.add(modelindex, ABCFailures.TIMEOUT, str(exc), paramRow)
+        except Exception as exc:
+            failures.add(modelindex, ABCFailures.ERROR, repr(exc), paramRow)
+        else:
+            rows.append(i)
+            sumstats.append(sumstat)
+            if keepData:
+                datasets.append(simdata)
+    return (np.array(rows, dtype=np.int64), np.array(sumstats),
+            np.stack(datasets) if keepData and datasets else None)
+
+
+def generateBlock(model, params, summarizer, rawStore=None, timeout=None,
+                  failures=None, modelindex=0, progress=None, rowwise=False,
+                  seeds=None, first=0):
+    """
+    Run one simulation per row of a parameter block.
+    1. Simulate data (in one call if the model is vectorized,
+       otherwise once per parameter row)
+    2. Save the stacked datasets if a raw store is given
+    3. Compute summary statistics (batched for stacked datasets)
+    Simulations raising an exception or exceeding the time limit are
+    skipped and recorded in failures. A failing batch is rerun row by
+    row to isolate the failing rows.
+    :param model: the ABCModel to simulate from
+    :param params: parameter block of shape (#rows, #parameters)
+    :param summarizer: the ABCSummary instance
+    :param rawStore: the ABCRawStore to save the datasets to, None to discard them
+    :param timeout: time limit of one simulation in seconds, None for no limit
+    :param failures: the ABCFailures to record skipped simulations in
+    :param modelindex: index of the model, used to record failures
+    :param progress: function called with the index of each row before
+    it is simulated (with -1 before a batch), None to not report progress
+    :param rowwise: boolean flag - simulate row by row even if the model is vectorized
+    :param seeds: seeds of the simulations of the rows (see drawTaskParameters),
+    None to leave numpy's global random state alone
+    :param first: position of the first row in the random stream of the model;
+    with seeds, batches are cut at the seed blocks of the stream and seeded
+    from their first row
+    :return: the indices of the successful rows, their summary statistics
+    of shape (#rows, #sumstats) and the name of the saved block (None
+    without raw store)
+    """
+    failures = ABCFailures() if failures is None else failures
+    keepData = rawStore is not None
+
+    if model.hasBatchSimulate() and not rowwise:
+        if progress is not None:
+            progress(-1)
+        try:
+            with timeLimit(timeout and timeout * params.shape[0]):
+                if seeds is None:
+                    simdata = model.simulateBatch(params)
+                else:
+                    cuts = np.arange(-first % SEED_BLOCK, params.shape[0], SEED_BLOCK)
+                    bounds = np.union1d(cuts, [0, params.shape[0]])
+                    batches = []
+                    for start, stop in zip(bounds[:-1], bounds[1:]):
+                        np.random.seed(int(seeds[start]))
+                        batches.append(model.simulateBatch(params[start:stop]))
+                    simdata = np.concatenate(batches)
+                sumstats = summarizer.summarizeBatch(simdata)
+            rows = np.arange(params.shape[0])
+        except Exception:
+            rows, sumstats, simdata = _generateRows(model, params, summarizer, keepData,
+                                                    timeout, failures, modelindex, progress, seeds)
+    else:
+        rows, sumstats, simdata = _generateRows(model, params, summarizer, keepData,
+                                                timeout, failures, modelindex, progress, seeds)
+
+    name = None
+    if keepData and rows.shape[0] > 0:
+        name = rawStore.save(params[rows], simdata)
+    return rows, sumstats, name
+
+
+def drawTaskParameters(model, modelindex, count, seed):
+    """
+    Draw the parameters of the rows of a task, and the seeds of their
+    simulations, from the seed blocks of the random stream of the model
+    (see SEED_BLOCK) the rows fall into. Each seed block draws all its
+    parameters from a random state of its own, so the parameters of a
+    row do not depend on which other rows its task holds.
+    :param model: the ABCModel to draw from
+    :param modelindex: index of the model
+    :param count: number of parameter vectors
+    :param seed: seed of the task, a (base seed, position of the first
+    row in the random stream of the model) pair
+    :return: parameter block of shape (count, #parameters) and the seeds
+    of the simulations of its rows
+    """
+    baseSeed, first = seed
+    params, seeds = [], []
+    for block in range(first // SEED_BLOCK, (first + count - 1) // SEED_BLOCK + 1):
+        blockSeeds = np.random.SeedSequence([baseSeed, modelindex, block]).generate_state(SEED_BLOCK + 1)
+        start = max(first - block * SEED_BLOCK, 0)
+        stop = min(first + count - block * SEED_BLOCK, SEED_BLOCK)
+        blockParams = model.drawParameters(SEED_BLOCK, np.random.RandomState(blockSeeds[0]))
+        params.append(blockParams[start:stop])
+        seeds.append(blockSeeds[1 + start:1 + stop])
+    return np.concatenate(params), np.concatenate(seeds)
+
+
+def simulateRows(modelindex, count, seed, start=0, stop=None, progress=None):
+    """
+    Draw count parameter vectors from the priors of a model, simulate
+    and summarize them. Parameters and simulations are seeded per row
+    from the position of the row in the random stream of the model, so
+    the rows of a seeded run are reproducible, and the random streams
+    of different tasks (and workers) independent of each other.
+    :param modelindex: index of the model to simulate from
+    :param count: number of simulations
+    :param seed: seed of the task (see drawTaskParameters)
+    :param start: first row of the drawn block to simulate
+    :param stop: row after the last one to simulate, None to simulate the whole
+    block; the rows of a part of a block are simulated one by one
+    :param progress: see generateBlock
+    :return: the parameters and summary statistics of the successful rows
+    (failed simulations are skipped), the name of the block in the raw
+    store (None without raw store), the ABCFailures of the block and the
+    time spent in seconds
+    """
+    begin = time.perf_counter()
+    model = _models[modelindex]
+    params, seeds = drawTaskParameters(model, modelindex, count, seed)
+    params, seeds = params[start:stop], seeds[start:stop]
+    failures = ABCFailures()
+    rows, sumstats, name = generateBlock(model, params, _summarizer, _rawStore,
+                                         _timeout, failures, modelindex, progress,
+                                         rowwise=stop is not None, seeds=seeds,
+                                         first=seed[1] + start)
+    return params[rows], sumstats, name, failures, time.perf_counter() - begin
+
+
+def simulateBlock(modelindex, offset, count, seed, start=0, stop=None):
+    """
+    Simulate a block, or rows start to stop of it (see simulateRows), and
+    write it into the table buffer starting at row offset + start. The
+    start time and the row being simulated are published in the buffer,
+    so that the parent times the task from its start, and can split a
+    task lost with its worker around the row.
+    :param modelindex: index of the model to simulate from
+    :param offset: first row of the block in the table buffer
+    :param count: number of simulations of the block
+    :param seed: seed of the task (see drawTaskParameters)
+    :param start: first row of the block to simulate
+    :param stop: row after the last one to simulate, None for the whole block
+    :return: the number of rows written (failed simulations are skipped),
+    the time spent in seconds, the name of the block in the raw store
+    (None without raw store) and the ABCFailures of the block
+    """
+    def progress(row):
+        _buffer.progress[offset + start] = row if row < 0 else start + row
+
+    _buffer.started[offset + start] = time.time()
+    params, sumstats, name, failures, elapsed = simulateRows(modelindex, count, seed,
+                                                             start, stop, progress)
+    if params.shape[0] > 0:
+        _buffer.write(offset + start, params, sumstats)
+    return params.shape[0], elapsed, name, failures
+
+
+async def simulateBlockAsync(modelindex, offset, count, seed):
+    """
+    Coroutine version of simulateBlock for the asyncio backend. The
+    simulations of a block run one after the other, while the event
+    loop interleaves the blocks in flight. Simulations raising an
+    exception or exceeding the time limit are skipped and recorded.
+    The seed only determines the parameters, since the simulations
+    of interleaved blocks share numpy's global random state.
+    :param modelindex: index of the model to simulate from
+    :param offset: first row of the block in the table buffer
+    :param count: number of simulations
+    :param seed: seed of the task (see drawTaskParameters)
+    :return: see simulateBlock
+    """
+    start = time.perf_counter()
+    model = _models[modelindex]
+    params, _ = drawTaskParameters(model, modelindex, count, seed)
+    failures = ABCFailures()
+    rows, sumstats, datasets = [], [], []
+
+    for i, paramRow in enumerate(params):
+        try:
+            simdata = await asyncio.wait_for(model.simulateAsync(model.toParamDict(paramRow)), _timeout)
+            sumstat = _summarizer.summarize(simdata)
+        except asyncio.TimeoutError:
+            failures.add(modelindex, ABCFailures.TIMEOUT, 'exceeded {:g} seconds'.format(_timeout), paramRow)
+        except Exception as exc:
+            failures.add(modelindex, ABCFailures.ERROR, repr(exc), paramRow)
+        else:
+            rows.append(i)
+            sumstats.append(sumstat)
+            if _rawStore is not None:
+                datasets.append(simdata)
+
+    rows, name = np.array(rows, dtype=np.int64), None
+    if rows.shape[0] > 0:
+        _buffer.write(offset, params[rows], np.array(sumstats))
+        if _rawStore is not None:
+            name = _rawStore.save(params[rows], np.stack(datasets))
+    return rows.shape[0], time.perf_counter() - start, name, failures
+
+
+def resummarizeBlock(name):
+    """
+    Recompute the summary statistics of a block of the raw store.
+    :param name: the name of the block
+    :return: summary statistics of shape (#rows, #sumstats)
+    """
+    _, simdata = _rawStore.load(name)
+    return _summarizer.summarizeBatch(simdata)
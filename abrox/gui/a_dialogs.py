@@ -234,6 +234,18 @@ class ASettingsDialog(QDialog):
             QLabel('Number of simulations:'),
             ASettingEntry(self._internalModel, 'simulations', True)
         ]
+        self._backendEntry = [
+            QLabel('Execution backend:'),
+            AComboBox(['processes', 'threads', 'serial'])
+        ]
+        self._jobsEntry = [
+            QLabel('Number of workers:'),
+            ASettingEntry(self._internalModel, 'jobs', True)
+        ]
+        self._budgetEntry = [
+            QLabel('Time budget (s):'),
+            ASettingEntry(self._internalModel, 'timebudget', True)
+        ]
 
     def _createReferenceTableSettingsBox(self):
         """Creates a reference table."""
@@ -247,8 +259,41 @@ class ASettingsDialog(QDialog):
 
         self._simEntry[1].setValue(self._internalModel.simulations())
 
+        # Add execution backend and number of workers
+        refGroupBoxLayout.addWidget(self._backendEntry[0], 1, 0, 1, 1)
+        refGroupBoxLayout.addWidget(self._backendEntry[1], 1, 1, 1, 1)
+        self._backendEntry[1].setValue(self._internalModel.backend())
+
+        refGroupBoxLayout.addWidget(self._jobsEntry[0], 2, 0, 1, 1)
+        refGroupBoxLayout.addWidget(self._jobsEntry[1], 2, 1, 1, 1)
+
+        # Add all cpus checkbutton
+        allCpusCheck = QCheckBox()
+        allCpusCheck.setText('All CPUs')
+        if self._internalModel.jobs() is None:
+            allCpusCheck.setChecked(True)
+            self._jobsEntry[1].setEnabled(False)
+        else:
+            self._jobsEntry[1].setValue(self._internalModel.jobs())
+        allCpusCheck.toggled.connect(self._onAllCpus)
+        refGroupBoxLayout.addWidget(allCpusCheck, 2, 2)
+
+        # Add time budget, the number of simulations then caps the rows per model
+        refGroupBoxLayout.addWidget(self._budgetEntry[0], 3, 0, 1, 1)
+        refGroupBoxLayout.addWidget(self._budgetEntry[1], 3, 1, 1, 1)
+
+        noBudgetCheck = QCheckBox()
+        noBudgetCheck.setText('No limit')
+        if self._internalModel.timeBudget() is None:
+            noBudgetCheck.setChecked(True)
+            self._budgetEntry[1].setEnabled(False)
+        else:
+            self._budgetEntry[1].setValue(self._internalModel.timeBudget())
+        noBudgetCheck.toggled.connect(self._onNoBudget)
+        refGroupBoxLayout.addWidget(noBudgetCheck, 3, 2)
+
         useExtCheck = QCheckBox("Use external reference table")
-        refGroupBoxLayout.addWidget(useExtCheck, 1, 0, 1, 1)
+        refGroupBoxLayout.addWidget(useExtCheck, 4, 0, 1, 1)
 
         # Toggle, if specified in model
         if self._internalModel.externalReference() is not None:
@@ -262,7 +307,7 @@ class ASettingsDialog(QDialog):
         useExtCheck.toggled.connect(self._onExt)
 
         # Add file selector entry to layout
-        refGroupBoxLayout.addWidget(self._refTableWidget, 2, 0, 1, 2)
+        refGroupBoxLayout.addWidget(self._refTableWidget, 5, 0, 1, 2)
         refGroupBox.setLayout(refGroupBoxLayout)
         return refGroupBox
 
@@ -325,6 +370,16 @@ class ASettingsDialog(QDialog):
 
         self._toggleExt(checked)
 
+    def _onAllCpus(self, checked):
+        """Activated when user toggles using all available CPUs."""
+
+        self._jobsEntry[1].setEnabled(not checked)
+
+    def _onNoBudget(self, checked):
+        """Activated when user toggles running without a time budget."""
+
+        self._budgetEntry[1].setEnabled(not checked)
+
     def _collect(self):
         """Collects values from entries and updates internal model."""
 
@@ -338,10 +393,15 @@ class ASettingsDialog(QDialog):
                 # User has selected, use given value
                 methodSpecs[key] = self._settingsEntries[key][1].val()
 
-        refTableSpecs = {
+        # Start from current reference table settings to keep keys not shown here
+        refTableSpecs = dict(self._internalModel.refTable())
+        refTableSpecs.update({
             'simulations': int(self._simEntry[1].val()),
-            'extref': self._refTableWidget.val()
-        }
+            'extref': self._refTableWidget.val(),
+            'backend': self._backendEntry[1].val(),
+            'jobs': self._jobsEntry[1].val() if self._jobsEntry[1].isEnabled() else None,
+            'timebudget': self._budgetEntry[1].val() if self._budgetEntry[1].isEnabled() else None
+        })
         method = {
             'algorithm': self._algorithm(),
             'specs': methodSpecs
@@ -630,6 +690,12 @@ class ASettingEntry(QDoubleSpinBox):
         elif self._key == 'simulations':
             self._customize([1, 1e10], 100, 0)
 
+        elif self._key == 'jobs':
+            self._customize([1, 1024], 1, 0)
+
+        elif self._key == 'timebudget':
+            self._customize([1, 1e7], 60, 0)
+
         elif self._key == 'cv':
             self._customize([1, 1e10], 10, 0)
 
@@ -727,4 +793,4 @@ class AComboBox(QComboBox):
         return self.currentText().lower()
 
     def setValue(self, val):
-        self.setCurrentText(val.upper())
\ No newline at end of file
+        self.setCurrentText(val.capitalize())
\ No newline at end of file
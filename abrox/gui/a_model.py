@@ -33,7 +33,13 @@ class AInternalModel:
                         'test': {'model': None, 'fixed': OrderedDict()},
                         'reftable': {
                             'simulations': 10000,
-                            'extref': None
+                            'extref': None,
+                            'blocksize': 500,
+                            'backend': 'processes',
+                            'jobs': None,
+                            'blasthreads': None,
+                            'seed': None,
+                            'cache': True
                         },
                     })
                     ]
@@ -207,6 +213,18 @@ class AInternalModel:
     def simulations(self):
         return self._project['Analysis']['settings']['reftable']['simulations']
 
+    def refTable(self):
+        return self._project['Analysis']['settings']['reftable']
+
+    def backend(self):
+        return self._project['Analysis']['settings']['reftable'].get('backend', 'processes')
+
+    def jobs(self):
+        return self._project['Analysis']['settings']['reftable'].get('jobs')
+
+    def timeBudget(self):
+        return self._project['Analysis']['settings']['reftable'].get('timebudget')
+
     def models(self):
         """Returns the model list."""
 
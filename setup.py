@@ -11,7 +11,8 @@ setup(
     author_email='mertens.ulf@gmail.com',
     entry_points={
         'console_scripts': [
-            'abrox-gui = abrox.gui.main:main'
+            'abrox-gui = abrox.gui.main:main',
+            'abrox-worker = abrox.core.abc_cluster:main'
         ]
     },
     url='https://github.com/mertensu/ABrox',  # use the URL to the github repo
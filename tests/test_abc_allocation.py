@@ -0,0 +1,47 @@
+import time
+from scipy import stats
+import numpy as np
+
+from abrox.core.abc_model import ABCModel
+from abrox.core.abc_preprocess import ABCPreProcessor
+from abrox.core.abc_rejection import ABCRejection
+from abrox.core.abc_report import ABCReporter
+from abrox.core.abc_summary import ABCSummary
+
+# Adaptive allocation gives an expensive model fewer rows (Neyman
+# allocation), and the effective prior model probabilities of the table
+# correct the Bayes factor: two models that only differ in their cost
+# still get a Bayes factor close to 1
+
+def summary(data):
+    return np.array([np.mean(data), np.std(data)])
+
+def simulate(params):
+    return np.random.normal(params['mu'], 1, 50)
+
+def simulateExpensive(params):
+    time.sleep(0.003)
+    return simulate(params)
+
+
+if __name__ == "__main__":
+
+    models = [ABCModel('Cheap', [{'mu': stats.norm(0, 1)}], simulate),
+              ABCModel('Expensive', [{'mu': stats.norm(0, 1)}], simulateExpensive)]
+    names = ['Cheap', 'Expensive']
+    pp = ABCPreProcessor(models, ABCSummary(summary), np.array([0.0, 1.0]))
+    table = pp.preprocess(2000, backend='processes', jobs=2, blockSize=100, seed=3,
+                          allocation='adaptive', keep=400)
+
+    rows = np.bincount(table.idx, minlength=2)
+    print('Rows per model:', rows)
+    assert rows[0] == 2000
+    assert 200 <= rows[1] <= 1000
+
+    modelPrior = rows / len(table)
+    subset, _ = ABCRejection(table, 400).reject()
+    corrected = ABCReporter(subset, names, None, 'comparison', None, modelPrior).bayesFactor()
+    uncorrected = ABCReporter(subset, names, None, 'comparison', None).bayesFactor()
+    print(corrected)
+    assert 0.5 < corrected.loc['Cheap', 'Expensive'] < 2
+    assert uncorrected.loc['Cheap', 'Expensive'] > 2
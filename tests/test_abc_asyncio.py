@@ -0,0 +1,54 @@
+import asyncio
+import time
+from scipy import stats
+import numpy as np
+
+from abrox.core.abc_config_check import ConfigTester, ConfigurationError
+from abrox.core.abc_failures import ABCFailures
+from abrox.core.abc_model import ABCModel
+from abrox.core.abc_preprocess import ABCPreProcessor
+from abrox.core.abc_summary import ABCSummary
+
+# Async simulate functions run concurrently on the event loop of the
+# asyncio backend, and a simulation exceeding the timeout is cancelled
+# and skipped. A timeout with a plain simulate function is refused on
+# this backend, since its thread could not be stopped.
+
+def summary(data):
+    return np.array([np.mean(data), np.std(data)])
+
+async def simulate(params):
+    # Simulations with a large mean hang
+    await asyncio.sleep(60 if params['mu'] > 1.5 else 0.05)
+    return np.random.normal(params['mu'], 1, 50)
+
+def simulatePlain(params):
+    return np.random.normal(params['mu'], 1, 50)
+
+
+if __name__ == "__main__":
+
+    model = ABCModel('Model1', [{'mu': stats.norm(0, 1)}], simulate)
+    pp = ABCPreProcessor([model], ABCSummary(summary), np.array([0.0, 1.0]), timeout=0.5)
+    start = time.perf_counter()
+    table = pp.preprocess(400, backend='asyncio', jobs=50, blockSize=10, seed=2)
+    elapsed = time.perf_counter() - start
+
+    timeouts = pp.failures.counts[(0, ABCFailures.TIMEOUT)]
+    print('{} rows and {} timeouts in {:.2f} s'.format(len(table), timeouts, elapsed))
+    # One after the other, the simulations would take more than 20 s
+    assert elapsed < 5.0
+    assert timeouts > 0 and len(table) + timeouts == 400
+    assert np.all(table.param[:, 0] <= 1.5)
+
+    for simulateFunc, accepted in ((simulate, True), (simulatePlain, False)):
+        config = {'models': [{'name': 'Model1', 'priors': [{'mu': stats.norm(0, 1)}],
+                              'simulate': simulateFunc}],
+                  'settings': {'reftable': {'simulations': 100, 'backend': 'asyncio', 'timeout': 0.5}}}
+        try:
+            ConfigTester(config)._checkRefTableSettings()
+        except ConfigurationError as exc:
+            print('Refused:', exc)
+            assert not accepted
+        else:
+            assert accepted
@@ -0,0 +1,40 @@
+import shutil
+import tempfile
+from scipy import stats
+import numpy as np
+
+from abrox.core.abc_cache import ABCTableCache
+from abrox.core.abc_model import ABCModel
+from abrox.core.abc_preprocess import ABCPreProcessor
+from abrox.core.abc_summary import ABCSummary
+
+# A second run with the same models, summary function, number of
+# simulations and seed reads the table from the cache without
+# simulating a single row
+
+def summary(data):
+    return np.array([np.mean(data), np.std(data)])
+
+def simulate(params):
+    return np.random.normal(params['mu'], 1, 50)
+
+
+if __name__ == "__main__":
+
+    models = [ABCModel('Model1', [{'mu': stats.norm(0, 1)}], simulate),
+              ABCModel('Model2', [{'mu': stats.norm(1, 1)}], simulate)]
+    summarizer = ABCSummary(summary)
+    sumStatObsData = np.array([0.0, 1.0])
+    cache = ABCTableCache(tempfile.mkdtemp())
+
+    try:
+        tables = []
+        for run in range(2):
+            pp = ABCPreProcessor(models, summarizer, sumStatObsData)
+            tables.append(pp.preprocess(500, backend='processes', jobs=2, blockSize=100,
+                                        cache=cache, seed=1))
+            print('Run', run + 1, 'simulated', pp.costs['simulations'].sum(), 'rows')
+        assert pp.costs['simulations'].sum() == 0
+        assert np.array_equal(tables[0].param, tables[1].param)
+    finally:
+        shutil.rmtree(cache.path)
@@ -0,0 +1,77 @@
+import os
+import subprocess
+import sys
+import time
+from scipy import stats
+import numpy as np
+
+from abrox.core.abc_cluster import ABCCoordinator
+from abrox.core.abc_initializer import ABCInitializer
+from abrox.core.abc_preprocess import ABCPreProcessor
+from abrox.core.abc_summary import ABCSummary
+
+# A coordinator on localhost serves the blocks of a table to two
+# abrox-worker processes loading the models from this script. One worker
+# dies after 100 simulations and its blocks go to the other one, so the
+# table is still complete, and equal to a local run with the same seed.
+# A worker with the wrong key is refused.
+
+calls = 0
+
+def summary(data):
+    return np.array([np.mean(data), np.std(data)])
+
+def simulate(params):
+    global calls
+    calls += 1
+    if calls > 100 and os.environ.get('ABROX_TEST_DIE'):
+        os._exit(1)
+    time.sleep(0.002)
+    return np.random.normal(params['mu'], 1, 50)
+
+CONFIG = {
+    "models": [
+        {"name": "Model1", "priors": [{"mu": stats.norm(0, 1)}], "simulate": simulate},
+        {"name": "Model2", "priors": [{"mu": stats.norm(1, 1)}], "simulate": simulate}
+    ],
+    "summary": summary
+}
+
+
+def startWorker(address, authkey, die=False):
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+               ABROX_TEST_DIE='1' if die else '')
+    return subprocess.Popen([sys.executable, '-W', 'ignore', '-m', 'abrox.core.abc_cluster',
+                             os.path.abspath(__file__), '--coordinator', '{}:{}'.format(*address),
+                             '--authkey', authkey, '--wait', '10'],
+                            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+
+def sortedRows(table):
+    rows = np.column_stack([table.idx, table.param, table.sumstat])
+    return rows[np.lexsort(rows.T[::-1])]
+
+
+if __name__ == "__main__":
+
+    models, _ = ABCInitializer(CONFIG).buildAndGetModels()
+    summarizer = ABCSummary(summary)
+    sumStatObsData = np.array([0.0, 1.0])
+
+    with ABCCoordinator('localhost:0', 'secret', models, summarizer) as coordinator:
+        intruder = startWorker(coordinator.address, 'wrong')
+        workers = [startWorker(coordinator.address, 'secret', die) for die in (True, False)]
+
+        pp = ABCPreProcessor(models, summarizer, sumStatObsData, coordinator=coordinator)
+        table = pp.preprocess(600, backend='cluster', blockSize=50, seed=5)
+        print('Cluster run:', np.bincount(table.idx), 'rows')
+
+    print('Worker exit codes:', [worker.wait(30) for worker in workers])
+    assert workers[1].returncode == 0
+    assert intruder.wait(30) != 0
+    assert b'AuthenticationError' in intruder.stderr.read()
+
+    pp = ABCPreProcessor(models, summarizer, sumStatObsData)
+    local = pp.preprocess(600, backend='serial', blockSize=50, seed=5)
+    assert np.array_equal(np.bincount(table.idx), [600, 600])
+    assert np.array_equal(sortedRows(table), sortedRows(local))
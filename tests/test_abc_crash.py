@@ -0,0 +1,43 @@
+import os
+from scipy import stats
+import numpy as np
+
+from abrox.core.abc_failures import ABCFailures
+from abrox.core.abc_model import ABCModel
+from abrox.core.abc_preprocess import ABCPreProcessor
+from abrox.core.abc_summary import ABCSummary
+
+# A simulation killing its worker process costs only its own row: the
+# rest of the block is rerun, and the failure reports the fatal draw
+
+def summary(data):
+    return np.array([np.mean(data), np.std(data)])
+
+def simulate(params):
+    if params['mu'] > 2.3:
+        os._exit(1)
+    return np.random.normal(params['mu'], 1, 50)
+
+def simulateBatch(params):
+    if (params[:, 0] > 2.3).any():
+        os._exit(1)
+    return np.random.normal(params[:, :1], 1, (params.shape[0], 50))
+
+
+if __name__ == "__main__":
+
+    summarizer = ABCSummary(summary)
+    sumStatObsData = np.array([0.0, 1.0])
+
+    for batch in (None, simulateBatch):
+        model = ABCModel('Model1', [{'mu': stats.norm(0, 1)}], simulate, batch)
+        pp = ABCPreProcessor([model], summarizer, sumStatObsData)
+        table = pp.preprocess(2000, backend='processes', jobs=2, blockSize=200, seed=1)
+
+        crashes = pp.failures.counts[(0, ABCFailures.CRASH)]
+        print('batch' if batch else 'rows', len(table), 'rows,', crashes, 'crashes')
+        assert len(table) + crashes == 2000
+        assert np.all(table.param[:, 0] <= 2.3)
+        assert all(params[0] > 2.3 for _, _, _, params in pp.failures.examples)
+        # Only about 1% of the draws are fatal, far less than a block
+        assert crashes < 60
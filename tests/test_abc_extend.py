@@ -0,0 +1,58 @@
+import shutil
+import tempfile
+from scipy import stats
+import numpy as np
+
+from abrox.core.abc_model import ABCModel
+from abrox.core.abc_preprocess import ABCPreProcessor
+from abrox.core.abc_scale import ABCScaler
+from abrox.core.abc_summary import ABCSummary
+from abrox.core.abc_utils import euclideanDistance
+
+# Extending a table (in memory or in a store) keeps its rows, appends
+# the new ones, and refits the MAD scaling and the distances on all of
+# them, as if the whole table had been simulated at once
+
+def summary(data):
+    return np.array([np.mean(data), np.std(data)])
+
+def simulate(params):
+    return np.random.normal(params['mu'], 1, 50)
+
+
+def checkScaling(pp, table, unscaled):
+    scaler = ABCScaler()
+    scaler.scale(unscaled)
+    assert np.allclose(pp.scaler.mad, scaler.mad)
+    assert np.allclose(table.sumstat, unscaled / scaler.mad)
+    assert np.allclose(table.distance, euclideanDistance(unscaled / scaler.mad,
+                                                         pp.sumStatObsData / scaler.mad))
+
+
+if __name__ == "__main__":
+
+    models = [ABCModel('Model1', [{'mu': stats.norm(0, 1)}], simulate),
+              ABCModel('Model2', [{'mu': stats.norm(1, 1)}], simulate)]
+    summarizer = ABCSummary(summary)
+    sumStatObsData = np.array([0.0, 1.0])
+    store = tempfile.mkdtemp()
+
+    try:
+        for target in (None, store):
+            pp = ABCPreProcessor(models, summarizer, sumStatObsData)
+            pp.preprocess(500, backend='processes', jobs=2, blockSize=100, store=target, seed=1)
+            table = pp._refTable
+            before = np.array(table.param), np.array(table.sumstat) * pp.scaler.mad
+
+            table = pp.extend(300, backend='processes', jobs=2, blockSize=100, store=target)
+            print('store' if target else 'memory', 'extended to', len(table), 'rows')
+            assert len(table) == 1600
+            assert np.array_equal(np.bincount(table.idx), [800, 800])
+            assert np.array_equal(table.param[:1000], before[0])
+            assert np.unique(table.param, axis=0).shape[0] == 1600
+
+            unscaled = np.array(table.sumstat) * pp.scaler.mad
+            assert np.allclose(unscaled[:1000], before[1])
+            checkScaling(pp, table, unscaled)
+    finally:
+        shutil.rmtree(store)
@@ -0,0 +1,88 @@
+import os
+import shutil
+import sys
+import tempfile
+from scipy import stats
+import numpy as np
+
+from abrox.core.abc_external import ABCExternalSimulator
+from abrox.core.abc_model import ABCModel
+from abrox.core.abc_preprocess import ABCPreProcessor
+from abrox.core.abc_summary import ABCSummary
+
+# An external echo simulator answers both protocols with the parameters
+# of each request and their sum. Its datasets arrive in request order,
+# also through the worker processes of a reference table, and a
+# simulator that dies is replaced on the next request.
+
+ECHO = '''
+import struct
+import sys
+
+def echo(row):
+    if row[0] > 100:
+        sys.exit(3)
+    return [row[0], row[1], row[0] + row[1]]
+
+if sys.argv[1] == 'text':
+    while True:
+        header = sys.stdin.readline()
+        if not header:
+            break
+        n, k = map(int, header.split())
+        rows = [echo(list(map(float, sys.stdin.readline().split()))) for _ in range(n)]
+        sys.stdout.write(''.join(' '.join(map(repr, row)) + '\\n' for row in rows))
+        sys.stdout.flush()
+else:
+    stdin, stdout = sys.stdin.buffer, sys.stdout.buffer
+    while True:
+        header = stdin.read(8)
+        if len(header) < 8:
+            break
+        n, k = struct.unpack('<II', header)
+        values = struct.unpack('<{}d'.format(n * k), stdin.read(8 * n * k))
+        rows = [echo(values[i * k:(i + 1) * k]) for i in range(n)]
+        stdout.write(struct.pack('<{}d'.format(3 * n), *[value for row in rows for value in row]))
+        stdout.flush()
+'''
+
+def summary(data):
+    return np.asarray(data)
+
+
+if __name__ == "__main__":
+
+    path = tempfile.mkdtemp()
+    script = os.path.join(path, 'echo.py')
+    with open(script, 'w') as outfile:
+        outfile.write(ECHO)
+    priors = [{'mu': stats.norm(0, 1)}, {'sigma': stats.uniform(1, 1)}]
+
+    try:
+        for protocol in ABCExternalSimulator.PROTOCOLS:
+            simulator = ABCExternalSimulator([sys.executable, script, protocol], (3,), protocol)
+            params = np.array([[0.1, 1.5], [-2.0, 1.25], [1e-300, 3.0]])
+            expected = np.column_stack([params, params.sum(axis=1)])
+            assert np.array_equal(simulator.simulateBatch(params), expected)
+            assert np.array_equal(simulator.simulate({'mu': 0.5, 'sigma': 2.0}), [0.5, 2.0, 2.5])
+
+            try:
+                simulator.simulateBatch(np.array([[200.0, 1.0]]))
+            except RuntimeError as exc:
+                print(protocol, 'simulator died:', exc)
+            else:
+                raise AssertionError('A dead simulator was not detected')
+            assert np.array_equal(simulator.simulateBatch(params), expected)
+            simulator.close()
+
+            model = ABCModel('Echo', priors, external={'command': [sys.executable, script, protocol],
+                                                       'shape': (3,), 'protocol': protocol})
+            pp = ABCPreProcessor([model], ABCSummary(summary), np.zeros(3))
+            table = pp.preprocess(500, backend='processes', jobs=2, blockSize=100, seed=1)
+            unscaled = table.sumstat * pp.scaler.mad
+            print(protocol, 'table:', len(table), 'rows')
+            assert len(table) == 500
+            assert np.allclose(unscaled[:, :2], table.param)
+            assert np.allclose(unscaled[:, 2], table.param.sum(axis=1))
+    finally:
+        shutil.rmtree(path)
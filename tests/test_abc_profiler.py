@@ -0,0 +1,45 @@
+import time
+from scipy import stats
+import numpy as np
+
+from abrox.core.abc_model import ABCModel
+from abrox.core.abc_profiler import ABCProfiler
+from abrox.core.abc_summary import ABCSummary
+
+# The profiler predicts the runtime, memory, workers and block size of a
+# reference table from a calibration run, also for vectorized models too
+# cheap to time and within a time budget
+
+def summary(data):
+    return np.array([np.mean(data), np.std(data)])
+
+def summaryBatch(data):
+    return data[:, :2]
+
+def simulate(params):
+    time.sleep(0.001)
+    return np.random.normal(params['mu'], 1, 20)
+
+def simulateBatch(params):
+    return np.repeat(params[:, :1], 20, axis=1)
+
+
+if __name__ == "__main__":
+
+    priors = [{'mu': stats.norm(0, 1)}]
+    models = [ABCModel('Slow', priors, simulate), ABCModel('Vectorized', priors, simulate, simulateBatch)]
+    summarizer = ABCSummary(summary, summaryBatch)
+    sumStatObsData = np.array([0.0, 1.0])
+
+    for modelList in (models, models[1:]):
+        profiler = ABCProfiler(modelList, summarizer, sumStatObsData, draws=5000, maxSeconds=1.0)
+        costs = profiler.calibrate()
+        assert costs.loc['Vectorized', 'draws'] == 5000
+
+        for timeBudget in (None, 2.0):
+            prediction = profiler.predict(10000, 'processes', 2, timeBudget)
+            print(profiler.report(prediction))
+            assert all(np.isfinite(value) for value in prediction.values())
+            assert 1 <= prediction['blocksize'] <= ABCProfiler.maxBlockSize
+            assert prediction['rows'] <= 10000 * len(modelList)
+        assert prediction['runtime'] <= 2.0 + prediction['rows'] * profiler.distanceCost + 1e-9
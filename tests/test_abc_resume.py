@@ -0,0 +1,54 @@
+import shutil
+import tempfile
+from scipy import stats
+import numpy as np
+
+from abrox.core.abc_model import ABCModel
+from abrox.core.abc_preprocess import ABCPreProcessor
+from abrox.core.abc_summary import ABCSummary
+
+# A run interrupted while streaming to a store is resumed up to the
+# requested number of rows, and the resumed blocks draw fresh seeds,
+# so no parameter row of the interrupted run is simulated twice
+
+calls = 0
+
+def summary(data):
+    return np.array([np.mean(data), np.std(data)])
+
+def simulate(params):
+    return np.random.normal(params['mu'], params['sigma'], 50)
+
+def simulateInterrupted(params):
+    global calls
+    calls += 1
+    if calls > 450:
+        raise KeyboardInterrupt
+    return simulate(params)
+
+
+if __name__ == "__main__":
+
+    priors = [{'mu': stats.norm(0, 1)}, {'sigma': stats.uniform(0.5, 1)}]
+    summarizer = ABCSummary(summary)
+    sumStatObsData = np.array([0.0, 1.0])
+    store = tempfile.mkdtemp()
+
+    try:
+        try:
+            model = ABCModel('Model1', priors, simulateInterrupted)
+            ABCPreProcessor([model], summarizer, sumStatObsData).preprocess(
+                1000, backend='serial', blockSize=100, store=store, seed=1)
+        except KeyboardInterrupt:
+            print('Interrupted the first run')
+
+        model = ABCModel('Model1', priors, simulate)
+        for backend, simulations in (('serial', 1000), ('processes', 1500)):
+            pp = ABCPreProcessor([model], summarizer, sumStatObsData)
+            table = pp.preprocess(simulations, backend=backend, jobs=2, blockSize=100,
+                                  store=store, resume=True, seed=1)
+            nUnique = np.unique(table.param, axis=0).shape[0]
+            print(backend, 'resumed to', len(table), 'rows,', nUnique, 'distinct')
+            assert len(table) == nUnique == simulations
+    finally:
+        shutil.rmtree(store)
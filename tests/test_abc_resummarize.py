@@ -0,0 +1,46 @@
+import shutil
+import tempfile
+from scipy import stats
+import numpy as np
+
+from abrox.core.abc_model import ABCModel
+from abrox.core.abc_preprocess import ABCPreProcessor
+from abrox.core.abc_raw import ABCRawStore
+from abrox.core.abc_summary import ABCSummary
+
+# With a raw store, the table is rebuilt with a new summary function
+# from the saved datasets: same parameters, same datasets, new columns
+
+def summary(data):
+    return np.array([np.mean(data), np.std(data)])
+
+def newSummary(data):
+    return np.array([np.mean(data), np.std(data), np.median(data)])
+
+def simulate(params):
+    return np.random.normal(params['mu'], 1, 50)
+
+
+if __name__ == "__main__":
+
+    models = [ABCModel('Model1', [{'mu': stats.norm(0, 1)}], simulate),
+              ABCModel('Model2', [{'mu': stats.norm(1, 1)}, {'sigma': stats.uniform(1, 1)}], simulate)]
+    path = tempfile.mkdtemp()
+
+    try:
+        for compress in (False, True):
+            rawStore = ABCRawStore(path, compress)
+            pp = ABCPreProcessor(models, ABCSummary(summary), np.array([0.0, 1.0]), rawStore)
+            pp.preprocess(500, backend='processes', jobs=2, blockSize=100, seed=1)
+            table = pp._refTable
+            params, sumstats = np.array(table.param), np.array(table.sumstat) * pp.scaler.mad
+
+            pp = ABCPreProcessor(models, ABCSummary(newSummary), np.array([0.0, 1.0, 0.0]), rawStore)
+            table = pp.resummarize(backend='processes', jobs=2)
+            print('compressed' if compress else 'plain', 'store resummarized', len(table), 'rows')
+            assert table.sumstat.shape == (1000, 3)
+            assert np.array_equal(table.param, params, equal_nan=True)
+            assert np.allclose(np.array(table.sumstat[:, :2]) * pp.scaler.mad[:2], sumstats)
+            assert np.all(np.isfinite(table.distance))
+    finally:
+        shutil.rmtree(path)
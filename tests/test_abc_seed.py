@@ -0,0 +1,52 @@
+from scipy import stats
+import numpy as np
+
+from abrox.core.abc_model import ABCModel
+from abrox.core.abc_preprocess import ABCPreProcessor
+from abrox.core.abc_summary import ABCSummary
+
+# Two runs with the same seed simulate the same rows, even with another
+# backend, number of workers and block size, so that the adaptive task
+# sizes do not change the table. Rows arrive in completion order, so
+# the tables are compared sorted.
+
+def summary(data):
+    return np.array([np.mean(data), np.std(data)])
+
+def simulate(params):
+    return np.random.normal(params['mu'], 1, 50)
+
+def simulateBatch(params):
+    return np.random.normal(params[:, :1], 1, (params.shape[0], 50))
+
+def summaryBatch(data):
+    return np.column_stack([data.mean(axis=1), data.std(axis=1)])
+
+
+def sortedRows(table):
+    rows = np.column_stack([table.idx, table.param, table.sumstat])
+    return rows[np.lexsort(rows.T[::-1])]
+
+
+if __name__ == "__main__":
+
+    models = [ABCModel('Model1', [{'mu': stats.norm(0, 1)}], simulate),
+              ABCModel('Model2', [{'mu': stats.norm(1, 1)}], simulate,
+                       simulateBatch)]
+    summarizer = ABCSummary(summary, summaryBatch=summaryBatch)
+    sumStatObsData = np.array([0.0, 1.0])
+
+    tables = []
+    for backend, jobs, blockSize in [('processes', 2, 500), ('serial', 1, 120), ('processes', 3, 250)]:
+        pp = ABCPreProcessor(models, summarizer, sumStatObsData)
+        pp.preprocess(1000, backend=backend, jobs=jobs, blockSize=blockSize, seed=7)
+        tables.append(sortedRows(pp._refTable))
+        print(backend, 'simulated', tables[-1].shape[0], 'rows')
+
+    # The vectorized model needs blocks of at least 100 rows (one seed block)
+    for table in tables[1:]:
+        assert np.array_equal(tables[0], table)
+
+    pp = ABCPreProcessor(models, summarizer, sumStatObsData)
+    pp.preprocess(1000, backend='serial', blockSize=500, seed=8)
+    assert not np.array_equal(tables[0], sortedRows(pp._refTable))
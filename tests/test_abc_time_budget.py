@@ -0,0 +1,48 @@
+import time
+from scipy import stats
+import numpy as np
+
+from abrox.core.abc_model import ABCModel
+from abrox.core.abc_preprocess import ABCPreProcessor
+from abrox.core.abc_summary import ABCSummary
+
+# With a time budget, the models are simulated in balanced blocks until
+# the budget expires, and the number of simulations only caps the rows
+
+def summary(data):
+    return np.array([np.mean(data), np.std(data)])
+
+def simulateSlow(params):
+    time.sleep(0.002)
+    return np.random.normal(params['mu'], 1, 50)
+
+def simulateFast(params):
+    time.sleep(0.0005)
+    return np.random.normal(params['mu'], 1, 50)
+
+
+if __name__ == "__main__":
+
+    models = [ABCModel('Slow', [{'mu': stats.norm(0, 1)}], simulateSlow),
+              ABCModel('Fast', [{'mu': stats.norm(0, 1)}], simulateFast)]
+    summarizer = ABCSummary(summary)
+    sumStatObsData = np.array([0.0, 1.0])
+
+    pp = ABCPreProcessor(models, summarizer, sumStatObsData)
+    start = time.perf_counter()
+    pp.preprocess(None, backend='processes', jobs=2, blockSize=50, timeBudget=2.0)
+    elapsed = time.perf_counter() - start
+    rows = np.bincount(pp._refTable.idx, minlength=2)
+    print('Budget of 2 s: {} rows in {:.2f} s'.format(rows, elapsed))
+    assert elapsed < 5.0
+    assert rows.min() > 100
+    assert abs(rows[0] - rows[1]) <= 2 * 50
+
+    pp = ABCPreProcessor(models, summarizer, sumStatObsData)
+    start = time.perf_counter()
+    pp.preprocess(200, backend='processes', jobs=2, blockSize=50, timeBudget=60.0)
+    elapsed = time.perf_counter() - start
+    rows = np.bincount(pp._refTable.idx, minlength=2)
+    print('Cap of 200 rows: {} rows in {:.2f} s'.format(rows, elapsed))
+    assert np.array_equal(rows, [200, 200])
+    assert elapsed < 30.0
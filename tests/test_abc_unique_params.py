@@ -0,0 +1,29 @@
+from scipy import stats
+import numpy as np
+
+from abrox.core.abc_model import ABCModel
+from abrox.core.abc_preprocess import ABCPreProcessor
+from abrox.core.abc_summary import ABCSummary
+
+# Every task draws its parameters from a random stream of its own, so
+# the rows of a table simulated by several workers are all distinct
+
+def summary(data):
+    return np.array([np.mean(data), np.std(data)])
+
+def simulate(params):
+    return np.random.normal(params['mu'], params['sigma'], 50)
+
+
+if __name__ == "__main__":
+
+    model = ABCModel('Model1', [{'mu': stats.norm(0, 1)}, {'sigma': stats.uniform(0.5, 1)}], simulate)
+    summarizer = ABCSummary(summary)
+    sumStatObsData = summarizer.summarize(simulate({'mu': 0.0, 'sigma': 1.0}))
+
+    for backend in ('serial', 'threads', 'processes'):
+        pp = ABCPreProcessor([model], summarizer, sumStatObsData)
+        table = pp.preprocess(300, backend=backend, jobs=2, blockSize=50)
+        nUnique = np.unique(table.param, axis=0).shape[0]
+        print(backend, nUnique, 'distinct parameter rows of', len(table))
+        assert nUnique == len(table) == 300